@@ -17,11 +17,22 @@ import threading
 import subprocess
 import requests
 from pathlib import Path
+import ollama_client
+import ollama_process
+import review_lexicon
+import response_filter
+import review_cache
+import chat_store
+import context_builder
+import temporal_extractor
+import search_cache
+import async_runner
+import search_monitor
 # 禁用SSL警告
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 import winreg
-from datetime import datetime, date
+from datetime import datetime
 import webbrowser
 import locale
 import argparse
@@ -36,8 +47,8 @@ from PyQt5.QtWidgets import (
     QGroupBox, QGridLayout, QFormLayout, QMessageBox, QFileDialog,
     QSplitter, QFrame, QScrollArea, QSpacerItem, QSizePolicy
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QSize, QUrl
-from PyQt5.QtGui import QFont, QIcon, QPalette, QColor, QPixmap
+from PyQt5.QtCore import Qt, QThread, QObject, pyqtSignal, pyqtSlot, QTimer, QSize, QUrl, QFile, QIODevice
+from PyQt5.QtGui import QFont, QIcon, QPalette, QColor, QPixmap, QTextCursor
 try:
     from PyQt5.QtWebEngineWidgets import QWebEngineView
     WEBENGINE_AVAILABLE = True
@@ -102,67 +113,311 @@ class DownloadThread(QThread):
             self.download_finished.emit(False, f"下载失败: {e}")
 
 
+class OllamaSupervisor(QThread):
+    """在后台启动、探测并在必要时重启Ollama服务，之后定期探测服务健康状态"""
+    status_changed = pyqtSignal(str)  # 状态文本键（status分类）
+    service_ready = pyqtSignal()  # 服务变为可用
+    service_lost = pyqtSignal()  # 服务由可用变为不可用
+
+    PROBE_INTERVAL = float(os.environ.get("OLLAMA_PROBE_INTERVAL", "15"))  # 健康探测间隔（秒）
+    PROBE_TIMEOUT = 2
+    PROCESS_WAIT = 5  # 进程已存在时等待服务就绪的时间（秒）
+    STARTUP_WAIT = 8  # 启动服务后等待就绪的时间（秒）
+    RESTART_AFTER = 2  # 连续探测失败多少次后尝试重新启动
+    TERMINATE_WAIT = 5  # 终止无响应的进程时等待其退出的时间（秒）
+    PORT_RELEASE_WAIT = 2  # 终止进程后等待端口释放的时间（秒）
+
+    def __init__(self, host, port, ollama_path):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.ollama_path = ollama_path
+        self.processes = ollama_process.OllamaProcessTracker(port)
+        self.auto_restart = True  # 用户手动停止服务后不再自动拉起
+        self.available = None  # None表示尚未探测过
+        self.failures = 0
+        self.start_requested = False
+        self.stopping = threading.Event()
+        self.wakeup = threading.Event()
+
+    def set_address(self, host, port):
+        """修改服务地址，下一轮立即探测"""
+        self.host = host
+        self.port = port
+        self.processes.set_port(port)
+        self.request_check()
+
+    def request_check(self):
+        """立即进行一次探测"""
+        self.wakeup.set()
+
+    def request_start(self):
+        """在后台启动服务（服务已运行时只做探测）"""
+        self.auto_restart = True
+        self.start_requested = True
+        self.wakeup.set()
+
+    def stop(self, timeout=None):
+        """停止监视并等待线程退出，不影响Ollama服务本身
+        
+        各处等待都会响应stopping，通常很快返回；默认的超时按最长的终止进程路径计算，
+        避免在进程退出过程中销毁仍在运行的线程
+        """
+        self.stopping.set()
+        self.wakeup.set()
+        if timeout is None:
+            timeout = int((self.PROBE_TIMEOUT + self.TERMINATE_WAIT + self.PORT_RELEASE_WAIT + 1) * 1000)
+        self.wait(timeout)
+
+    def run(self):
+        self.ensure_running()
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.PROBE_INTERVAL)
+            self.wakeup.clear()
+            if self.stopping.is_set():
+                break
+
+            if self.start_requested:
+                self.start_requested = False
+                self.ensure_running()
+            elif self.probe():
+                self.set_available(True, "ollama_service_running")
+            else:
+                self.failures += 1
+                if self.available and self.failures < self.RESTART_AFTER:
+                    continue  # 偶发的探测失败，下一轮再确认
+                if self.available and self.auto_restart:
+                    # 运行中的服务失去响应，尝试重新拉起
+                    self.ensure_running()
+                else:
+                    self.set_available(False, "service_not_running")
+
+    def probe(self):
+        """探测服务是否可访问"""
+        return ollama_client.get_client(self.host, self.port).ping(timeout=self.PROBE_TIMEOUT)
+
+    def set_available(self, available, status_key, announce=False):
+        """记录服务状态，状态变化（或announce为True）时发出信号"""
+        previous = self.available
+        self.available = available
+        if available:
+            self.failures = 0
+        if announce or available != previous:
+            self.status_changed.emit(status_key)
+        if available and not previous:
+            self.service_ready.emit()
+        elif not available and previous:
+            self.service_lost.emit()
+
+    def wait_until_ready(self, seconds):
+        """轮询等待服务就绪，停止监视时提前返回"""
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            if self.stopping.wait(0.5):
+                return False
+            if self.probe():
+                return True
+        return False
+
+    def ensure_running(self):
+        """确保服务可用：必要时等待、重启或启动服务"""
+        try:
+            self.status_changed.emit("checking_ollama_service")
+
+            # 1. 检查Ollama服务是否可访问
+            if self.probe():
+                self.set_available(True, "ollama_service_running", announce=True)
+                return True
+
+            # 2. 进程在运行但服务不响应：等待片刻，仍不响应则结束进程后重新启动
+            if self.is_process_running():
+                self.status_changed.emit("ollama_process_waiting")
+                if self.wait_until_ready(self.PROCESS_WAIT):
+                    self.set_available(True, "ollama_service_ready", announce=True)
+                    return True
+                if self.stopping.is_set():
+                    return False
+                self.status_changed.emit("ollama_service_not_responding")
+                self.terminate_processes()
+
+            # 3. 检查是否已安装后启动服务
+            if not self.ollama_path or not Path(self.ollama_path).exists():
+                self.set_available(False, "ollama_not_installed", announce=True)
+                return False
+
+            self.status_changed.emit("starting_ollama_service")
+            if self.spawn() and self.wait_until_ready(self.STARTUP_WAIT):
+                self.set_available(True, "ollama_service_started", announce=True)
+                return True
+            if self.stopping.is_set():
+                return False
+
+            # 如果直接启动失败，尝试使用start命令
+            if sys.platform == "win32":
+                subprocess.Popen(
+                    f'start "Ollama Service" /min "{self.ollama_path}" serve',
+                    shell=True,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+                if self.wait_until_ready(self.STARTUP_WAIT):
+                    self.set_available(True, "ollama_service_started", announce=True)
+                    return True
+
+            self.set_available(False, "ollama_service_start_failed", announce=True)
+            return False
+
+        except Exception as e:
+            print(f"自动检查Ollama服务时出错: {e}")
+            self.set_available(False, "ollama_service_check_failed", announce=True)
+            return False
+
+    def spawn(self):
+        """启动ollama serve进程（不等待）"""
+        try:
+            if sys.platform == "win32":
+                CREATE_NO_WINDOW = 0x08000000
+                DETACHED_PROCESS = 0x00000008
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                startupinfo.wShowWindow = 0
+
+                process = subprocess.Popen(
+                    [str(self.ollama_path), "serve"],
+                    creationflags=CREATE_NO_WINDOW | DETACHED_PROCESS,
+                    startupinfo=startupinfo,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    stdin=subprocess.DEVNULL
+                )
+            else:
+                process = subprocess.Popen(
+                    [str(self.ollama_path), "serve"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    stdin=subprocess.DEVNULL
+                )
+            self.processes.remember(process.pid)
+            return True
+        except Exception as e:
+            print(f"启动Ollama服务时出错: {e}")
+            return False
+
+    def is_process_running(self):
+        """检查Ollama进程是否在运行"""
+        return self.processes.is_running()
+
+    def terminate_processes(self):
+        """终止现有的Ollama进程"""
+        self.processes.terminate(self.TERMINATE_WAIT, cancel=self.stopping)
+        # 等待端口释放
+        self.stopping.wait(self.PORT_RELEASE_WAIT)
+
+
+# 对话历史中用户与助手消息的发送者名称（兼容中英文界面文本）
+USER_SENDERS = ('我', '用户', 'User', 'user')
+ASSISTANT_SENDERS = ('AI 助手', 'AI 助手(联网增强)', '助手', 'Assistant', 'assistant')
+
+def sender_role(sender):
+    """发送者名称对应的消息角色"""
+    if sender in USER_SENDERS:
+        return chat_store.ROLE_USER
+    if sender in ASSISTANT_SENDERS:
+        return chat_store.ROLE_ASSISTANT
+    return chat_store.ROLE_SYSTEM
+
+
+# 聊天区域只保留最近的消息，完整记录保存在对话记录数据库中，滚动到顶部时按页加载更早的消息
+TRANSCRIPT_WINDOW = int(os.environ.get("MINIAI_TRANSCRIPT_WINDOW", "200"))
+TRANSCRIPT_PAGE = 50
+
+
+class TranscriptBridge(QObject):
+    """聊天页面通过QWebChannel调用的接口：滚动到顶部时从对话记录按页加载较早的消息"""
+    
+    def __init__(self, window):
+        super().__init__()
+        self.window = window
+    
+    @pyqtSlot(int)
+    def loadOlder(self, before_id):
+        self.window.load_older_webview_messages(before_id)
+
+
+def history_to_chat_messages(history_entries, current_message=None):
+    """将对话历史转换为 /api/chat 使用的结构化消息列表
+    
+    历史前缀在相邻两轮之间保持不变，Ollama可以复用已缓存的KV，只需对新消息做prefill。
+    """
+    messages = []
+    for entry in history_entries:
+        sender = entry.get('sender', '')
+        content = entry.get('message', '')
+        if not content:
+            continue
+        if sender in USER_SENDERS:
+            messages.append({"role": "user", "content": content})
+        elif sender in ASSISTANT_SENDERS:
+            messages.append({"role": "assistant", "content": content})
+    
+    if current_message is not None:
+        # 历史中通常已包含刚发送的用户消息，避免重复
+        if messages and messages[-1]["role"] == "user" and messages[-1]["content"] == current_message:
+            messages.pop()
+        messages.append({"role": "user", "content": current_message})
+    
+    return messages
+
+
 class ChatThread(QThread):
     """聊天线程"""
     message_received = pyqtSignal(str)
+    token_received = pyqtSignal(str)  # 流式模式下的增量文本
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, host, port, model, message, chat_history=None):
+    def __init__(self, host, port, model, message, chat_history=None, stream=True, keep_alive=None,
+                 context_budget=context_builder.DEFAULT_BUDGET):
         super().__init__()
         self.host = host
         self.port = port
         self.model = model
         self.message = message
         self.chat_history = chat_history or []
+        self.stream = stream
+        self.keep_alive = keep_alive
+        self.context_budget = context_budget  # 提示的token预算
     
-    def build_conversation_prompt(self):
-        """构建包含历史对话的prompt"""
+    def build_chat_messages(self):
+        """构建包含历史对话的结构化消息"""
         try:
-            # 获取最近5个回合的对话历史
+            # 按token预算选取最近的对话历史
             recent_history = self.get_recent_conversation_history()
-            
-            if not recent_history:
-                # 如果没有历史记录，直接返回当前消息
-                return self.message
-            
-            # 构建对话上下文
-            conversation_context = "以下是最近的对话历史，请基于这些上下文回答用户的新问题：\n\n"
-            conversation_context += "=== 对话历史 ===\n"
-            
-            for entry in recent_history:
-                sender = entry.get('sender', '')
-                message = entry.get('message', '')
-                if sender and message:
-                    conversation_context += f"{sender}: {message}\n"
-            
-            conversation_context += "\n=== 当前问题 ===\n"
-            conversation_context += f"用户: {self.message}\n\n"
-            conversation_context += "请基于上述对话历史，给出恰当的回答："
-            
-            return conversation_context
+            return history_to_chat_messages(recent_history, self.message)
             
         except Exception as e:
-            print(f"构建对话prompt时出错: {e}")
-            return self.message
+            print(f"构建对话消息时出错: {e}")
+            return [{"role": "user", "content": self.message}]
     
     def get_recent_conversation_history(self):
-        """获取最近5个回合的对话历史（确保完整的用户-AI对话对）"""
+        """按token预算选取最近的对话历史（以用户问题开始）"""
         try:
             if not self.chat_history:
                 return []
             
             # 过滤掉系统消息，只保留用户和助手的对话
-            filtered_history = []
-            for entry in self.chat_history:
-                sender = entry.get('sender', '')
-                if sender in ['我', 'AI 助手', 'AI 助手(联网增强)', 'user', 'assistant']:
-                    filtered_history.append(entry)
+            filtered_history = [entry for entry in self.chat_history
+                                if entry.get('sender', '') in USER_SENDERS or entry.get('sender', '') in ASSISTANT_SENDERS]
+            
+            # 当前消息单独计入预算，不参与历史的选取
+            if filtered_history and filtered_history[-1].get('sender') in USER_SENDERS \
+                    and filtered_history[-1].get('message') == self.message:
+                filtered_history = filtered_history[:-1]
             
-            # 获取最近10条记录（5个回合，每个回合包含用户问题和助手回答）
-            # 确保获取完整的5个对话回合，优先保证对话的完整性
-            recent_entries = filtered_history[-10:] if len(filtered_history) > 10 else filtered_history
+            history_budget = max(0, self.context_budget - context_builder.estimate_tokens(self.message))
+            recent_entries, used = context_builder.select_history(filtered_history, history_budget)
             
-            print(f"[DEBUG] ChatThread - 对话历史总数: {len(self.chat_history)}, 过滤后: {len(filtered_history)}, 发送给AI: {len(recent_entries)}")
+            print(f"[DEBUG] ChatThread - 模型 {self.model} 上下文预算 {self.context_budget} tokens，"
+                  f"历史 {len(recent_entries)}/{len(filtered_history)} 条，约 {used} tokens")
             for i, entry in enumerate(recent_entries):
                 sender = entry.get('sender', '')
                 message = entry.get('message', '')[:50] + "..." if len(entry.get('message', '')) > 50 else entry.get('message', '')
@@ -176,31 +431,68 @@ class ChatThread(QThread):
         
     def run(self):
         try:
-            # 构建包含历史对话的prompt
-            prompt = self.build_conversation_prompt()
-            
-            url = f"http://{self.host}:{self.port}/api/generate"
+            # 使用结构化消息调用 /api/chat，历史前缀可复用服务端KV缓存
+            client = ollama_client.get_client(self.host, self.port)
             payload = {
                 "model": self.model,
-                "prompt": prompt,
-                "stream": False
+                "messages": self.build_chat_messages(),
+                "stream": self.stream
             }
+            if self.keep_alive:
+                # 保持模型常驻，缓存的对话前缀才不会随模型卸载而失效
+                payload["keep_alive"] = self.keep_alive
+            
+            if self.stream:
+                reply = self.read_stream(client, payload)
+                if reply is not None:
+                    self.message_received.emit(reply)
+                return
             
-            response = requests.post(url, json=payload, timeout=60)
+            response = client.post("/api/chat", payload, timeout=60)
             
             if response.status_code == 200:
                 data = response.json()
-                reply = data.get("response", "")
+                reply = data.get("message", {}).get("content", "")
                 self.message_received.emit(reply)
             else:
                 self.error_occurred.emit(f"请求失败: {response.status_code}")
                 
         except Exception as e:
             self.error_occurred.emit(f"生成回复失败: {e}")
+    
+    def read_stream(self, client, payload):
+        """逐行读取NDJSON流，边生成边发送增量文本，返回完整回复"""
+        chunks = []
+        # 流式模式下timeout为两次数据块之间的最大间隔，而不是总生成时间
+        with client.post("/api/chat", payload, timeout=60, stream=True) as response:
+            if response.status_code != 200:
+                self.error_occurred.emit(f"请求失败: {response.status_code}")
+                return None
+            
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                
+                token = data.get("message", {}).get("content", "")
+                if token:
+                    chunks.append(token)
+                    self.token_received.emit(token)
+                
+                if data.get("done"):
+                    break
+        
+        return "".join(chunks)
 
 
 class AnswerReviewThread(QThread):
     """答案审查线程"""
+    # 各项检测需要的词库分类
+    QUESTION_CATEGORIES = ("non_intellectual", "intellectual", "intellectual_pattern", "question_word", "subjective")
+    UNCERTAINTY_CATEGORIES = ("uncertainty", "uncertainty_exclude", "maybe_word", "uncertain_ending")
+
     review_completed = pyqtSignal(bool, float, str)  # 是否需要搜索, 可信度, 审查结果
     error_occurred = pyqtSignal(str)
     
@@ -258,6 +550,15 @@ class AnswerReviewThread(QThread):
                 self.review_completed.emit(True, 0.0, review_result)
                 return
             
+            # 相同模型下同一问答已审查过时直接使用缓存结果
+            cache = review_cache.get_cache()
+            cached = cache.get(self.model, self.original_question, self.answer)
+            if cached is not None:
+                confidence_score, review_result = cached
+                print(f"[DEBUG] 命中审查缓存，可信度: {confidence_score}（命中 {cache.hits} 次，未命中 {cache.misses} 次）")
+                self.review_completed.emit(confidence_score < 70, confidence_score, review_result)
+                return
+            
             # 构建审查提示
             review_prompt = f"""
 请审查以下问答对的质量和可信度：
@@ -281,14 +582,13 @@ class AnswerReviewThread(QThread):
 建议：[是否需要网络搜索]
 """
             
-            url = f"http://{self.host}:{self.port}/api/generate"
             payload = {
                 "model": self.model,
                 "prompt": review_prompt,
                 "stream": False
             }
             
-            response = requests.post(url, json=payload, timeout=30)
+            response = ollama_client.get_client(self.host, self.port).post("/api/generate", payload, timeout=30)
             
             if response.status_code == 200:
                 data = response.json()
@@ -297,6 +597,7 @@ class AnswerReviewThread(QThread):
                 # 解析审查结果
                 confidence_score = self.extract_confidence_score(review_result)
                 needs_search = confidence_score < 70
+                cache.put(self.model, self.original_question, self.answer, confidence_score, review_result)
                 
                 self.review_completed.emit(needs_search, confidence_score, review_result)
             else:
@@ -305,29 +606,20 @@ class AnswerReviewThread(QThread):
         except Exception as e:
             self.error_occurred.emit(f"答案审查失败: {e}")
     
-    def is_simple_greeting(self, question):
+    @staticmethod
+    def is_simple_greeting(question):
         """检查是否为简单问候语"""
         try:
             question_lower = question.lower().strip()
             
-            # 常见问候语列表
-            greetings = [
-                '你好', 'hello', 'hi', '您好', '早上好', '下午好', '晚上好',
-                '早安', '晚安', 'good morning', 'good afternoon', 'good evening',
-                'good night', '嗨', 'hey', '哈喽', '哈罗', '喂', '在吗',
-                '在不在', '有人吗', '请问', '打扰了', '不好意思', 'excuse me',
-                'sorry', '谢谢', 'thank you', 'thanks', '再见', 'bye', 'goodbye',
-                '拜拜', '回见', 'see you', '怎么样', 'how are you', '最近怎么样',
-                '近来可好', '还好吗', '一切都好吗', '身体好吗'
-            ]
-            
             # 检查是否为纯问候语（去除标点符号）
             clean_question = ''.join(c for c in question_lower if c.isalnum() or c.isspace())
             clean_question = clean_question.strip()
             
             # 精确匹配或包含匹配
-            for greeting in greetings:
-                if clean_question == greeting or (len(clean_question) <= 10 and greeting in clean_question):
+            greetings = review_lexicon.scan(clean_question, ("greeting",)).get("greeting", [])
+            for _, greeting in greetings:
+                if clean_question == greeting or len(clean_question) <= 10:
                     return True
             
             # 检查是否为很短的问句（可能是问候）
@@ -340,53 +632,17 @@ class AnswerReviewThread(QThread):
             print(f"问候语检测出错: {e}")
             return False
     
-    def is_time_related_question(self, question):
+    @staticmethod
+    def is_time_related_question(question):
         """判断是否为时间相关问题，需要实时信息"""
         try:
-            question_lower = question.lower().strip()
             print(f"[DEBUG] 检查时间相关问题: {question}")
             
-            # 时间查询的关键词
-            time_keywords = [
-                # 直接时间询问
-                '今天', '明天', '昨天', '现在', '当前',
-                '今日', '明日', '昨日', '本日', '今晚',
-                
-                # 日期询问
-                '日期', '几号', '号数', '多少号',
-                '年月日', '月份', '年份',
-                
-                # 时间询问
-                '时间', '几点', '点钟', '现在时间',
-                '当前时间', '现在几点', '什么时候',
-                
-                # 星期询问
-                '星期', '礼拜', '周几', '星期几',
-                '礼拜几', '今天星期', '今天礼拜',
-                
-                # 时间状态
-                '现在是', '今天是', '当前是',
-                '现在几', '今天几', '当前几'
-            ]
-            
-            # 检查关键词匹配
-            for keyword in time_keywords:
-                if keyword in question_lower:
-                    print(f"[DEBUG] 匹配时间关键词: {keyword}")
-                    return True
-            
-            # 检查时间相关的句式模式
-            time_patterns = [
-                r'.*今天.*', r'.*现在.*', r'.*当前.*',
-                r'.*几号.*', r'.*几点.*', r'.*星期.*',
-                r'.*日期.*', r'.*时间.*', r'.*礼拜.*'
-            ]
-            
-            import re
-            for pattern in time_patterns:
-                if re.match(pattern, question_lower):
-                    print(f"[DEBUG] 匹配时间模式: {pattern}")
-                    return True
+            # 检查关键词匹配（原有的 r'.*今天.*' 等句式模式都已包含在关键词中）
+            hits = review_lexicon.scan(question.strip(), ("time",)).get("time")
+            if hits:
+                print(f"[DEBUG] 匹配时间关键词: {hits[0][1]}")
+                return True
             
             print(f"[DEBUG] 不是时间相关问题")
             return False
@@ -395,89 +651,35 @@ class AnswerReviewThread(QThread):
             print(f"时间问题检测出错: {e}")
             return False
     
-    def is_intellectual_question(self, question):
+    @staticmethod
+    def is_intellectual_question(question):
         """判断是否为智力问题（需要知识、分析、推理的问题）"""
         try:
             question_lower = question.lower().strip()
-            
-            # 智力问题的关键词和模式
-            intellectual_keywords = [
-                # 知识性问题
-                '什么是', 'what is', '如何', 'how to', 'how do', '为什么', 'why',
-                '怎么样', '怎么办', '原理', '定义', '概念', '解释', '说明',
-                '介绍', '区别', '差异', '比较', '优缺点', '特点', '特征',
-                
-                # 技术性问题
-                '编程', '代码', 'python', 'java', 'javascript', 'html', 'css',
-                '算法', '数据结构', '机器学习', '人工智能', 'ai', 'ml', 'dl',
-                '数据库', 'sql', '网络', '服务器', '系统', '软件', '硬件',
-                
-                # 学术性问题
-                '数学', '物理', '化学', '生物', '历史', '地理', '经济', '政治',
-                '哲学', '心理学', '社会学', '文学', '艺术', '科学', '研究',
-                
-                # 分析性问题
-                '分析', '计算', '求解', '证明', '推导', '解决', '方案', '策略',
-                '方法', '步骤', '流程', '过程', '原因', '结果', '影响', '效果',
-                
-                # 信息查询
-                '最新', '当前', '现在', '目前', '2020', '2021', '2022', '2023', '2024', '2025',
-                '价格', '多少钱', '费用', '成本', '市场', '股票', '汇率', '天气',
-                '新闻', '事件', '发生', '时间', '地点', '人物', '公司', '产品',
-                
-                # 专业领域
-                '医学', '法律', '金融', '投资', '管理', '营销', '设计', '工程',
-                '建筑', '教育', '培训', '考试', '证书', '资格', '职业', '工作'
-            ]
-            
-            # 智力问题的句式模式
-            intellectual_patterns = [
-                r'.*是什么.*', r'.*怎么.*', r'.*如何.*', r'.*为什么.*',
-                r'.*什么.*', r'.*哪.*', r'.*多少.*', r'.*几.*',
-                r'.*能否.*', r'.*可以.*', r'.*应该.*', r'.*需要.*',
-                r'.*有没有.*', r'.*是否.*', r'.*会不会.*', r'.*能不能.*',
-                r'.*请问.*', r'.*想知道.*', r'.*了解.*', r'.*学习.*'
-            ]
-            
-            # 非智力问题的关键词（日常对话、情感交流等）
-            non_intellectual_keywords = [
-                # 情感表达
-                '开心', '高兴', '快乐', '伤心', '难过', '生气', '愤怒', '担心', '害怕',
-                '喜欢', '讨厌', '爱', '恨', '想念', '思念', '感谢', '抱歉', '对不起',
-                
-                # 日常闲聊
-                '聊天', '闲聊', '说话', '陪我', '无聊', '有趣', '好玩', '搞笑',
-                '天气真好', '今天心情', '最近怎样', '过得如何', '身体好吗',
-                
-                # 简单互动
-                '再见', '拜拜', '晚安', '早安', '保重', '加油', '努力', '坚持',
-                '祝福', '祝贺', '恭喜', '节日快乐', '生日快乐', '新年快乐'
-            ]
+            hits = review_lexicon.scan(question_lower, AnswerReviewThread.QUESTION_CATEGORIES)
             
             # 检查非智力关键词
-            for keyword in non_intellectual_keywords:
-                if keyword in question_lower:
-                    return False
+            if "non_intellectual" in hits:
+                return False
             
             # 检查智力关键词
-            for keyword in intellectual_keywords:
-                if keyword in question_lower:
-                    return True
+            if "intellectual" in hits:
+                return True
             
-            # 检查智力问题句式
-            import re
-            for pattern in intellectual_patterns:
-                if re.match(pattern, question_lower):
-                    return True
+            # 检查智力问题句式（与原 re.match(r'.*xxx.*') 一致，只匹配第一行）
+            first_line_end = question_lower.find('\n')
+            if first_line_end < 0:
+                first_line_end = len(question_lower)
+            if any(start + len(phrase) <= first_line_end
+                   for start, phrase in hits.get("intellectual_pattern", [])):
+                return True
             
             # 检查问句特征（以疑问词开头或结尾有问号）
-            question_words = ['什么', '怎么', '如何', '为什么', '哪', '多少', '几', 'what', 'how', 'why', 'where', 'when', 'who']
-            has_question_word = any(word in question_lower for word in question_words)
+            has_question_word = "question_word" in hits
             has_question_mark = '?' in question or '？' in question
             
             # 排除主观性和太短的问句
-            subjective_patterns = ['你觉得', '你认为', '你喜欢', '你想', '感觉如何', '怎么样']
-            is_subjective = any(pattern in question_lower for pattern in subjective_patterns)
+            is_subjective = "subjective" in hits
             is_too_short = len(question.strip()) <= 5
             
             # 如果有疑问词或问号，且长度超过5个字符，且不是主观问题，可能是智力问题
@@ -496,119 +698,16 @@ class AnswerReviewThread(QThread):
         """检查AI回答中是否主动承认不确定或不知道"""
         try:
             answer_lower = answer.lower().strip()
-            
-            # 不确定性表达的关键词和短语
-            uncertainty_phrases = [
-                # 直接承认不知道
-                '不知道', '不清楚', '不了解', '不确定', '不太清楚', '不太了解',
-                '我不知道', '我不清楚', '我不了解', '我不确定', '我不太清楚',
-                
-                # 无法回答的表达
-                '无法回答', '不能回答', '无法解答', '不能解答', '无法答复', '不能答复',
-                '我无法回答', '我不能回答', '我无法解答', '我不能解答',
-                '对不起，我无法回答', '抱歉，我无法回答', '很抱歉，我无法回答',
-                '对不起，我不能回答', '抱歉，我不能回答', '很抱歉，我不能回答',
-                'cannot answer', 'unable to answer', 'can\'t answer', 'i cannot answer',
-                'i am unable to answer', 'i can\'t answer', 'sorry, i cannot answer',
-                'sorry, i can\'t answer', 'i\'m sorry, i cannot answer',
-                
-                # 拒绝回答的表达
-                '拒绝回答', '不便回答', '不适合回答', '不宜回答', '不方便回答',
-                '我拒绝回答', '我不便回答', '我不适合回答', '我不宜回答',
-                'refuse to answer', 'decline to answer', 'not appropriate to answer',
-                'i refuse to answer', 'i decline to answer', 'not suitable to answer',
-                
-                # 英文表达
-                "i don't know", "i'm not sure", "i'm uncertain", "not sure",
-                "don't know", "unclear", "uncertain", "i have no idea",
-                "no idea", "i'm not certain", "not certain", "i can't say",
-                
-                # 模糊表达
-                '可能', '也许', '大概', '估计', '应该是', '似乎', '好像',
-                '据我所知', '据了解', '听说', '据说', '可能是', '或许',
-                'maybe', 'perhaps', 'possibly', 'probably', 'might be',
-                'could be', 'seems like', 'appears to be', 'i think',
-                
-                # 信息缺乏表达
-                '没有足够信息', '没有足够的信息', '信息不足', '缺乏信息', '无法确定', '难以确定',
-                '无法给出', '无法提供', '没有相关信息', '缺少数据', '信息有限',
-                'insufficient information', 'lack of information', 'no information',
-                'cannot determine', 'unable to determine', 'cannot provide',
-                
-                # 需要更多信息
-                '需要更多信息', '需要进一步', '需要查证', '建议查询', '建议搜索',
-                '请查询', '请搜索', '请核实', '需要核实', '需要确认',
-                'need more information', 'need to check', 'need to verify',
-                'suggest checking', 'recommend checking', 'please verify',
-                
-                # 时效性不确定
-                '可能已过时', '信息可能过时', '可能不是最新', '需要最新信息',
-                '建议查看最新', '可能有变化', '情况可能改变',
-                'might be outdated', 'information may be outdated', 'may have changed',
-                'might have changed', 'need latest information', 'check latest',
-                
-                # 谦逊表达
-                '我的知识有限', '知识有限', '了解有限', '可能有误', '如有错误',
-                '仅供参考', '请以实际为准', '建议核实', '请确认',
-                'my knowledge is limited', 'limited knowledge', 'may be incorrect',
-                'for reference only', 'please verify', 'please confirm',
-                
-                # 推测性表达
-                '我猜测', '我推测', '我认为可能', '估计可能', '大致上',
-                '粗略地说', '一般来说', '通常情况下', '在我印象中',
-                'i guess', 'i assume', 'i suppose', 'roughly speaking',
-                'generally speaking', 'typically', 'usually', 'in my understanding',
-                
-                # 道德/伦理拒绝表达
-                '我的目的是', '我不会参与', '我不能参与', '不实信息', '不当信息',
-                '有害信息', '违法信息', '不合适的内容', '不适当的内容',
-                'my purpose is', 'i will not participate', 'i cannot participate',
-                'inappropriate content', 'harmful content', 'illegal content',
-                'misinformation', 'false information', 'not appropriate',
-                
-                # 技术限制表达
-                '无法访问', '不能访问', '无法连接', '不能连接', '无法获取', '不能获取',
-                '无法追踪', '不能追踪', '无法检测', '不能检测', '无法查看', '不能查看',
-                '无法读取', '不能读取', '无法浏览', '不能浏览', '无法打开', '不能打开',
-                '我无法访问', '我不能访问', '我无法连接', '我不能连接',
-                '我无法追踪', '我不能追踪', '我无法检测', '我不能检测',
-                '我是一个文本模型', '我是文本模型', '作为文本模型', '作为AI模型',
-                '我是AI助手', '作为AI助手', '我没有能力', '我不具备能力',
-                'cannot access', 'unable to access', 'can\'t access', 'cannot connect',
-                'unable to connect', 'can\'t connect', 'cannot track', 'unable to track',
-                'can\'t track', 'cannot browse', 'unable to browse', 'can\'t browse',
-                'i cannot access', 'i am unable to access', 'i can\'t access',
-                'i cannot connect', 'i am unable to connect', 'i can\'t connect',
-                'i am a text model', 'i am an ai model', 'as an ai model',
-                'as a text model', 'i don\'t have the ability', 'i lack the ability',
-                
-                # 图片/视觉相关技术限制
-                '无法提供图片', '不能提供图片', '无法生成图片', '不能生成图片',
-                '无法显示图片', '不能显示图片', '无法创建图片', '不能创建图片',
-                '无法处理图片', '不能处理图片', '没有图片功能', '无图片生成功能',
-                '无法提供视觉', '不能提供视觉', '无法处理视觉', '不能处理视觉',
-                '目前我无法提供图片', '目前无法提供图片', '我无法生成图片',
-                '我不能显示图片', '作为文本AI无法', '作为语言模型无法',
-                
-                # 多媒体限制
-                '无法播放', '不能播放', '无法显示视频', '不能显示视频',
-                '无法处理音频', '不能处理音频', '无法生成音频', '不能生成音频',
-                
-                # 实时信息限制
-                '无法获取实时', '不能获取实时', '无法访问实时', '不能访问实时',
-                '无法联网', '不能联网', '无法上网', '不能上网'
-            ]
+            hits = review_lexicon.scan(answer_lower, self.UNCERTAINTY_CATEGORIES)
             
             # 检查是否包含不确定性表达
             detected_phrases = []
-            for phrase in uncertainty_phrases:
-                if phrase in answer_lower:
+            for _, phrase in hits.get("uncertainty", []):
+                if phrase not in detected_phrases:
                     detected_phrases.append(phrase)
             
             # 排除一些常见的非不确定表达
-            exclude_patterns = [
-                '通常情况下', '一般来说', '通常', '一般而言', 'generally', 'usually', 'typically'
-            ]
+            exclude_patterns = {phrase for _, phrase in hits.get("uncertainty_exclude", [])}
             
             # 如果只检测到排除模式，不认为是不确定
             print(f"[DEBUG] 不确定性检测 - 回答内容: {answer[:100]}...")
@@ -632,22 +731,15 @@ class AnswerReviewThread(QThread):
                 return True
             
             # 检查是否包含多个"可能"、"也许"等词汇
-            maybe_words = ['可能', '也许', '大概', '估计', 'maybe', 'perhaps', 'possibly', 'probably']
-            maybe_count = sum(answer_lower.count(word) for word in maybe_words)
+            maybe_count = len(hits.get("maybe_word", []))
             if maybe_count >= 3:  # 过多的不确定词汇
                 print(f"检测到过多不确定词汇: {maybe_count}个")
                 return True
             
             # 检查是否以不确定的方式结尾
-            uncertain_endings = [
-                '不太确定', '不太清楚', '可能有误', '仅供参考', '请核实',
-                '建议查证', '需要确认', '可能不准确', '请以实际为准',
-                'not sure', 'not certain', 'may be wrong', 'please verify',
-                'please check', 'for reference only', 'need confirmation'
-            ]
-            
-            for ending in uncertain_endings:
-                if answer_lower.endswith(ending) or ending in answer_lower[-100:]:
+            tail_start = len(answer_lower) - 100
+            for start, ending in hits.get("uncertain_ending", []):
+                if start >= tail_start:
                     print(f"检测到不确定结尾: '{ending}'")
                     return True
             
@@ -660,88 +752,14 @@ class AnswerReviewThread(QThread):
     def check_time_related_content(self, text):
         """检查回答中是否包含时间信息，如果在5年内则返回0，否则返回100"""
         try:
-            current_year = date.today().year
-            print(f"[DEBUG] 时间检测开始，当前年份: {current_year}")
-            print(f"[DEBUG] 检测文本长度: {len(text)} 字符")
-            
-            # 定义各种时间模式
-            time_patterns = [
-                # 年份模式：2019年、2020、2021-2024等
-                r'(\d{4})\s*年',
-                r'\b(\d{4})\b',
-                # 日期模式：2024年1月、2023-01-01等
-                r'(\d{4})\s*年\s*\d+\s*月',
-                r'(\d{4})-\d{1,2}-\d{1,2}',
-                r'(\d{4})/\d{1,2}/\d{1,2}',
-                # 月份年份：2024年1月、January 2024等
-                r'(\d{4})\s*年\s*\d+\s*月',
-                r'[A-Za-z]+\s+(\d{4})',
-                # 时间范围：2020-2024、2019至2023等
-                r'(\d{4})\s*[-至到]\s*(\d{4})',
-                # 相对时间：去年、今年、明年等（这些通常意味着时效性内容）
-                r'去年|今年|明年|上年|本年|下年',
-                r'最近\d+年|近\d+年|过去\d+年',
-                # 季度和月份：2024年第一季度、2023年Q1等
-                r'(\d{4})\s*年\s*第[一二三四1234]\s*季度',
-                r'(\d{4})\s*年\s*Q[1234]',
-                # 发布时间、更新时间等关键词
-                r'发布于\s*(\d{4})',
-                r'更新于\s*(\d{4})',
-                r'截至\s*(\d{4})',
-                r'自\s*(\d{4})\s*年',
-            ]
+            # 相对时间（去年、目前、最新等）或5年内的年份都表示回答可能具有时效性
+            time_sensitive, span = temporal_extractor.is_time_sensitive(text, window=5)
+            if time_sensitive:
+                print(f"[DEBUG] 检测到时效性内容: {span.kind} '{span.text}'，时间检测返回0（可信度为0）")
+                return 0
             
-            found_years = set()
-            
-            # 检查相对时间关键词（这些通常表示时效性内容）
-            relative_time_keywords = [
-                '去年', '今年', '明年', '上年', '本年', '下年',
-                '最近', '近期', '当前', '目前', '现在',
-                '最新', '新发布', '刚刚', '刚发布',
-                '最近几年', '近几年', '过去几年'
-            ]
-            
-            for keyword in relative_time_keywords:
-                if keyword in text:
-                    print(f"[DEBUG] 检测到相对时间关键词: {keyword}")
-                    print(f"[DEBUG] 时间检测返回0（可信度为0）")
-                    return 0  # 包含相对时间，可能是时效性内容
-            
-            # 检查具体年份
-            for pattern in time_patterns:
-                matches = re.findall(pattern, text)
-                if matches:
-                    print(f"[DEBUG] 模式 '{pattern}' 匹配到: {matches}")
-                for match in matches:
-                    if isinstance(match, tuple):
-                        # 处理元组（如时间范围）
-                        for year_str in match:
-                            if year_str.isdigit():
-                                year = int(year_str)
-                                if 1900 <= year <= 2100:  # 合理的年份范围
-                                    found_years.add(year)
-                    else:
-                        # 处理单个匹配
-                        if match.isdigit():
-                            year = int(match)
-                            if 1900 <= year <= 2100:  # 合理的年份范围
-                                found_years.add(year)
-            
-            # 检查找到的年份是否在5年内
-            if found_years:
-                print(f"[DEBUG] 检测到年份: {found_years}")
-                for year in found_years:
-                    year_diff = abs(current_year - year)
-                    print(f"[DEBUG] 年份 {year} 与当前年份 {current_year} 相差 {year_diff} 年")
-                    if year_diff <= 5:
-                        print(f"[DEBUG] 年份 {year} 在5年内，时间检测返回0（可信度为0）")
-                        return 0  # 在5年内，设置可信度为0
-                
-                print(f"[DEBUG] 所有检测到的年份都不在5年内，时间检测返回100")
-                return 100  # 不在5年内，正常处理
-            
-            print(f"[DEBUG] 没有检测到时间信息，时间检测返回100")
-            return 100  # 没有检测到时间信息，正常处理
+            print(f"[DEBUG] 没有检测到5年内的时间信息，时间检测返回100")
+            return 100
             
         except Exception as e:
             print(f"时间检测出错: {e}")
@@ -799,43 +817,36 @@ class WebSearchThread(QThread):
     def search_with_server(self):
         """使用简化的搜索接口进行搜索"""
         try:
-            import asyncio
-            import os
-            
-            # 设置环境变量
-            os.environ['SEARXNG_API_URL'] = 'https://searx.bndkt.io'
-            
-            print(f"DEBUG: 执行简化搜索: {self.query}")
+            # 问题限定在今年时只搜索最近一年的结果
+            time_range = temporal_extractor.search_time_range(self.query)
+            print(f"DEBUG: 执行简化搜索: {self.query}" + (f"（时间范围: {time_range}）" if time_range else ""))
             
             # 直接调用simple_search模块
             try:
                 import simple_search
                 
-                # 创建事件循环并执行异步搜索
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
+                # 在应用共享的后台事件循环中执行异步搜索，连接池和缓存在多次搜索之间保持
+                search_result = async_runner.get_runner().run(
+                    simple_search.perform_search(
+                        query=self.query,
+                        category="general",
+                        language="auto",
+                        safe_search=1,
+                        time_range=time_range,
+                        output_format="llm"  # 结果只用于增强回答的提示
+                    ),
+                    timeout=simple_search.REQUEST_TIMEOUT * 2
+                )
                 
-                try:
-                    search_result = loop.run_until_complete(
-                        simple_search.perform_search(
-                            query=self.query,
-                            category="general",
-                            language="auto",
-                            safe_search=1,
-                            time_range="",
-                            output_format="html"
-                        )
-                    )
-                    
-                    if search_result and search_result.strip():
-                        print(f"DEBUG: 简化搜索成功，结果长度: {len(search_result)}")
-                        return search_result
-                    else:
-                        print("DEBUG: 搜索结果为空")
-                        return None
-                        
-                finally:
-                    loop.close()
+                # 搜索请求完成（即使没有结果）说明搜索引擎可以访问
+                search_monitor.get_monitor().report(True)
+                
+                if search_result and search_result.strip():
+                    print(f"DEBUG: 简化搜索成功，结果长度: {len(search_result)}")
+                    return search_result
+                else:
+                    print("DEBUG: 搜索结果为空")
+                    return None
                     
             except ImportError as e:
                 print(f"DEBUG: 无法导入simple_search模块: {e}")
@@ -843,6 +854,7 @@ class WebSearchThread(QThread):
                 
         except Exception as e:
             print(f"DEBUG: 简化搜索异常: {e}")
+            search_monitor.get_monitor().report(False)
             return None
     
     
@@ -909,32 +921,36 @@ class EnhancedAnswerThread(QThread):
     answer_generated = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     
-    def __init__(self, host, port, model, original_question, search_results, chat_history=None):
+    def __init__(self, host, port, model, original_question, search_results, chat_history=None, keep_alive=None,
+                 context_budget=context_builder.DEFAULT_BUDGET):
         super().__init__()
         self.host = host
         self.port = port
         self.model = model
         self.original_question = original_question
-        self.search_results = search_results
+        # 搜索结果最多占用预算的一部分，其余留给问题和对话历史
+        self.search_results = context_builder.truncate_text(
+            search_results, int(context_budget * context_builder.SEARCH_RESULTS_SHARE))
         self.chat_history = chat_history or []
+        self.keep_alive = keep_alive
+        self.context_budget = context_budget  # 提示的token预算
         
     def run(self):
         try:
-            # 构建包含对话历史的增强提示
-            enhanced_prompt = self.build_enhanced_prompt()
-            
-            url = f"http://{self.host}:{self.port}/api/generate"
+            # 构建包含对话历史的增强消息，历史前缀与聊天线程一致，可复用服务端KV缓存
             payload = {
                 "model": self.model,
-                "prompt": enhanced_prompt,
+                "messages": self.build_enhanced_messages(),
                 "stream": False
             }
+            if self.keep_alive:
+                payload["keep_alive"] = self.keep_alive
             
-            response = requests.post(url, json=payload, timeout=60)
+            response = ollama_client.get_client(self.host, self.port).post("/api/chat", payload, timeout=60)
             
             if response.status_code == 200:
                 data = response.json()
-                enhanced_answer = data.get("response", "")
+                enhanced_answer = data.get("message", {}).get("content", "")
                 self.answer_generated.emit(enhanced_answer)
             else:
                 self.error_occurred.emit(f"增强回答生成失败: {response.status_code}")
@@ -942,48 +958,27 @@ class EnhancedAnswerThread(QThread):
         except Exception as e:
             self.error_occurred.emit(f"增强回答生成失败: {e}")
     
-    def build_enhanced_prompt(self):
-        """构建包含对话历史的增强提示"""
+    def build_enhanced_messages(self):
+        """构建包含对话历史的增强消息列表"""
         try:
             # 获取最近的对话历史
             recent_history = self.get_recent_conversation_history()
-            
-            enhanced_prompt = "基于以下网络搜索结果和对话历史，请回答用户的问题：\n\n"
-            
-            # 添加对话历史（如果有）
-            if recent_history:
-                enhanced_prompt += "=== 对话历史 ===\n"
-                for entry in recent_history:
-                    sender = entry.get('sender', '')
-                    message = entry.get('message', '')
-                    if sender and message:
-                        enhanced_prompt += f"{sender}: {message}\n"
-                enhanced_prompt += "\n"
-            
-            enhanced_prompt += f"=== 当前问题 ===\n用户问题：{self.original_question}\n\n"
-            enhanced_prompt += f"=== 网络搜索结果 ===\n{self.search_results}\n\n"
-            enhanced_prompt += "请基于上述搜索结果和对话历史，提供一个准确、详细且有用的回答。如果搜索结果中包含相关信息，请优先使用这些信息。请确保回答的准确性和可靠性，并保持与对话历史的连贯性。\n\n回答："
-            
-            return enhanced_prompt
+            return history_to_chat_messages(recent_history, self.build_enhanced_prompt())
             
         except Exception as e:
-            print(f"构建增强prompt时出错: {e}")
-            # 回退到原始提示
-            return f"""
-基于以下网络搜索结果，请回答用户的问题：
-
-用户问题：{self.original_question}
-
-网络搜索结果：
-{self.search_results}
-
-请基于上述搜索结果，提供一个准确、详细且有用的回答。如果搜索结果中包含相关信息，请优先使用这些信息。请确保回答的准确性和可靠性。
-
-回答：
-"""
+            print(f"构建增强消息时出错: {e}")
+            return [{"role": "user", "content": self.build_enhanced_prompt()}]
+    
+    def build_enhanced_prompt(self):
+        """构建当前轮次的增强提示（搜索结果放在最后一条用户消息中，不破坏历史前缀）"""
+        enhanced_prompt = "基于以下网络搜索结果和对话历史，请回答用户的问题：\n\n"
+        enhanced_prompt += f"=== 当前问题 ===\n用户问题：{self.original_question}\n\n"
+        enhanced_prompt += f"=== 网络搜索结果 ===\n{self.search_results}\n\n"
+        enhanced_prompt += "请基于上述搜索结果和对话历史，提供一个准确、详细且有用的回答。如果搜索结果中包含相关信息，请优先使用这些信息。请确保回答的准确性和可靠性，并保持与对话历史的连贯性。\n\n回答："
+        return enhanced_prompt
     
     def get_recent_conversation_history(self):
-        """获取最近5个回合的对话历史"""
+        """按token预算选取最近的对话历史"""
         try:
             if not self.chat_history:
                 return []
@@ -992,12 +987,20 @@ class EnhancedAnswerThread(QThread):
             filtered_history = []
             for entry in self.chat_history:
                 sender = entry.get('sender', '')
-                if sender in ['我', 'AI 助手', 'AI 助手(联网增强)', 'user', 'assistant']:
+                if sender in USER_SENDERS or sender in ASSISTANT_SENDERS:
                     filtered_history.append(entry)
             
-            # 获取最近10条记录（5个回合，每个回合包含用户问题和助手回答）
-            recent_entries = filtered_history[-10:] if len(filtered_history) > 10 else filtered_history
+            # 当前问题会放进增强提示中，不在历史中重复出现
+            if filtered_history and filtered_history[-1].get('sender') in USER_SENDERS \
+                    and filtered_history[-1].get('message') == self.original_question:
+                filtered_history = filtered_history[:-1]
             
+            # 增强提示（含搜索结果）之外的预算留给对话历史
+            history_budget = max(0, self.context_budget - context_builder.estimate_tokens(self.build_enhanced_prompt()))
+            recent_entries, used = context_builder.select_history(filtered_history, history_budget)
+            
+            print(f"[DEBUG] EnhancedAnswerThread - 模型 {self.model} 上下文预算 {self.context_budget} tokens，"
+                  f"历史 {len(recent_entries)}/{len(filtered_history)} 条，约 {used} tokens")
             return recent_entries
             
         except Exception as e:
@@ -1020,12 +1023,47 @@ class OllamaSettingsQt(QMainWindow):
         self.ollama_path = self.find_ollama_path()
         self.models_path = Path.home() / ".ollama" / "models"
         
+        # 对话记录：默认每次启动新建会话，resume_last_session为True时继续上一次的会话
+        self.chat_store = chat_store.get_store()
+        self.chat_session = self.chat_store.latest_session() if self.config.get("resume_last_session", False) else None
+        self.chat_store.prune_empty_sessions(keep=self.chat_session)
+        if self.chat_session is None:
+            self.chat_session = self.chat_store.create_session()
+        
         # 变量
-        self.chat_history = []
         self.current_model = ""
         self.auto_start = False
         self.current_user_message = ""  # 保存当前用户消息用于审查
         self.pending_reply = ""  # 暂存待审查的回复
+        self.stream_responses = self.config.get("stream_responses", True)  # 是否流式显示回复
+        self.streaming_text = ""  # 流式输出中尚未定稿的回复
+        self.streaming_visible = ""  # 去除<think>块后可显示的流式文本
+        self.think_stripper = response_filter.ThinkStripper()
+        self.streaming_anchor = None  # QTextBrowser模式下草稿消息的起始位置
+        self.speculative_search_enabled = self.config.get("speculative_search", True)  # 是否预取联网搜索
+        self.speculative_search = None  # 与回答生成并行的预取搜索状态
+        self.background_threads = set()  # 结果可能被丢弃的后台线程，保持引用直到结束
+        self.search_monitor = search_monitor.get_monitor()  # 搜索引擎连通性（后台探测）
+        
+        self.pre_routing_enabled = self.config.get("pre_routing", True)  # 是否在生成前路由问题
+        self.routing_stats = {"total": 0, "short_circuit": 0, "fallback": 0}  # 路由统计
+        
+        # 流式token合并刷新，避免每个token都触发一次界面重绘
+        self.stream_flush_timer = QTimer(self)
+        self.stream_flush_timer.setSingleShot(True)
+        self.stream_flush_timer.timeout.connect(self.flush_streaming_message)
+        
+        # WebView渲染队列：页面加载完成前积压，之后每帧合并为一次runJavaScript
+        self.webview_ready = False
+        self.webview_queue = []
+        self.webview_render_timer = QTimer(self)
+        self.webview_render_timer.setSingleShot(True)
+        self.webview_render_timer.timeout.connect(self.flush_webview_queue)
+        
+        # QTextBrowser模式下已渲染消息在文档中的起始位置和消息ID，以及对话记录中是否还有更早的消息
+        self.transcript_offsets = []
+        self.transcript_ids = []
+        self.transcript_has_older = False
         
         # 创建隐藏的WebView用于网络搜索（如果可用）
         if WEBENGINE_AVAILABLE and QWebEngineView:
@@ -1044,172 +1082,38 @@ class OllamaSettingsQt(QMainWindow):
         # 初始化GUI
         self.init_ui()
         self.load_settings()
-        
-        # 自动检查并启动Ollama服务
-        self.auto_check_and_start_ollama()
-        
-        # 初始化完成后刷新模型列表（异常处理）
-        try:
-            self.refresh_models()
-        except Exception as e:
-            print(self.get_text("init_refresh_failed", "debug").format(e))
-            self.update_status(self.get_text("service_not_running", "status"))
+        self.migrate_config_history()
         
         self.load_downloadable_models()  # 加载可下载模型数据
         
         # 聊天消息列表（用于WebView）
         self.chat_messages = []
         
-        # 检查是否有本地模型，如果没有则提示下载
-        QTimer.singleShot(1000, self.check_and_prompt_for_models)  # 延迟1秒执行，确保界面完全加载
+        # 在后台检查并启动Ollama服务，就绪后刷新模型列表并检查是否需要下载模型
+        self.models_prompted = False
+        self.ollama_supervisor = OllamaSupervisor(self.ollama_host, self.ollama_port, self.ollama_path)
+        self.ollama_supervisor.status_changed.connect(self.on_ollama_status_changed)
+        self.ollama_supervisor.service_ready.connect(self.on_ollama_ready)
+        self.ollama_supervisor.service_lost.connect(self.on_ollama_lost)
+        self.ollama_supervisor.start()
     
-    def auto_check_and_start_ollama(self):
-        """自动检查并启动Ollama服务"""
-        try:
-            self.update_status(self.get_text("checking_ollama_service", "status"))
-            
-            # 1. 检查Ollama服务是否可访问
-            if self.check_ollama_service_availability():
-                self.update_status(self.get_text("ollama_service_running", "status"))
-                return True
-            
-            # 2. 检查Ollama进程是否在运行
-            if self.check_ollama_process():
-                self.update_status(self.get_text("ollama_process_waiting", "status"))
-                # 等待服务就绪
-                for i in range(5):
-                    time.sleep(1)
-                    if self.check_ollama_service_availability():
-                        self.update_status(self.get_text("ollama_service_ready", "status"))
-                        return True
-                # 服务仍不可访问，尝试重启
-                self.update_status(self.get_text("ollama_service_not_responding", "status"))
-                self.restart_ollama_service()
-            
-            # 3. 如果进程未运行，检查是否已安装
-            if self.ollama_path and self.ollama_path.exists():
-                self.update_status(self.get_text("starting_ollama_service", "status"))
-                if self.start_ollama_service():
-                    self.update_status(self.get_text("ollama_service_started", "status"))
-                    return True
-                else:
-                    self.update_status(self.get_text("ollama_service_start_failed", "status"))
-                    return False
-            else:
-                self.update_status(self.get_text("ollama_not_installed", "status"))
-                return False
-                
-        except Exception as e:
-            print(f"自动检查Ollama服务时出错: {e}")
-            self.update_status(self.get_text("ollama_service_check_failed", "status"))
-            return False
+    def on_ollama_status_changed(self, status_key):
+        """显示服务监视线程报告的状态"""
+        self.update_status(self.get_text(status_key, "status"))
     
-    def check_ollama_service_availability(self):
-        """检查Ollama服务是否可访问"""
+    def on_ollama_ready(self):
+        """服务可用后刷新模型列表，首次就绪时检查是否需要下载模型"""
         try:
-            import requests
-            url = f"http://{self.ollama_host}:{self.ollama_port}/api/tags"
-            response = requests.get(url, timeout=3)
-            return response.status_code == 200
-        except:
-            return False
-    
-    def check_ollama_process(self):
-        """检查Ollama进程是否在运行"""
-        try:
-            import psutil
-            for proc in psutil.process_iter(['pid', 'name', 'exe']):
-                try:
-                    if proc.info['name'] and 'ollama' in proc.info['name'].lower():
-                        return True
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            return False
-        except ImportError:
-            # 如果没有psutil，使用tasklist命令检查
-            try:
-                result = subprocess.run(
-                    ["tasklist", "/FI", "IMAGENAME eq ollama.exe"],
-                    capture_output=True, text=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
-                )
-                return "ollama.exe" in result.stdout.lower()
-            except:
-                return False
-    
-    def start_ollama_service(self):
-        """启动Ollama服务"""
-        if not self.ollama_path or not self.ollama_path.exists():
-            return False
-        
-        try:
-            # 方法1: 直接启动ollama serve
-            subprocess.Popen(
-                [str(self.ollama_path), "serve"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
-            )
-            
-            # 等待服务启动
-            for i in range(8):
-                time.sleep(1)
-                if self.check_ollama_service_availability():
-                    return True
-            
-            # 如果直接启动失败，尝试使用start命令
-            if sys.platform == "win32":
-                subprocess.Popen(
-                    f'start "Ollama Service" /min "{self.ollama_path}" serve',
-                    shell=True,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
-                )
-                
-                # 再次等待服务启动
-                for i in range(8):
-                    time.sleep(1)
-                    if self.check_ollama_service_availability():
-                        return True
-            
-            return False
-            
+            self.refresh_models()
         except Exception as e:
-            print(f"启动Ollama服务时出错: {e}")
-            return False
+            print(self.get_text("init_refresh_failed", "debug").format(e))
+        if not self.models_prompted:
+            self.models_prompted = True
+            self.check_and_prompt_for_models()
     
-    def restart_ollama_service(self):
-        """重启Ollama服务"""
-        try:
-            # 尝试终止现有进程
-            if self.check_ollama_process():
-                try:
-                    import psutil
-                    for proc in psutil.process_iter(['pid', 'name']):
-                        try:
-                            if proc.info['name'] and 'ollama' in proc.info['name'].lower():
-                                proc.terminate()
-                                proc.wait(timeout=5)
-                        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.TimeoutExpired):
-                            continue
-                except ImportError:
-                    # 如果没有psutil，使用taskkill命令
-                    if sys.platform == "win32":
-                        subprocess.run(
-                            ["taskkill", "/F", "/IM", "ollama.exe"],
-                            stdout=subprocess.DEVNULL,
-                            stderr=subprocess.DEVNULL,
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                
-                time.sleep(2)
-            
-            # 重新启动服务
-            return self.start_ollama_service()
-            
-        except Exception as e:
-            print(f"重启Ollama服务时出错: {e}")
-            return False
+    def on_ollama_lost(self):
+        """服务失去响应"""
+        print("[DEBUG] Ollama服务失去响应")
     
     def setup_webview_link_handling(self):
         """设置WebView链接点击处理 - 在系统浏览器中打开"""
@@ -1247,7 +1151,8 @@ class OllamaSettingsQt(QMainWindow):
                         self.parent.open_link_in_browser(QUrl(url))
                 
                 self.link_handler = LinkHandler(self)
-                self.web_channel = QWebChannel()
+                if getattr(self, 'web_channel', None) is None:
+                    self.web_channel = QWebChannel()
                 self.web_channel.registerObject("linkHandler", self.link_handler)
                 page.setWebChannel(self.web_channel)
                 
@@ -1277,6 +1182,38 @@ class OllamaSettingsQt(QMainWindow):
             # 回退方案：简单的JavaScript拦截
             self.setup_simple_link_handling()
     
+    def setup_transcript_bridge(self):
+        """注册聊天页面加载较早消息用的QWebChannel对象"""
+        self.web_channel = None
+        self.webchannel_js = ""
+        try:
+            from PyQt5.QtWebChannel import QWebChannel
+            
+            self.transcript_bridge = TranscriptBridge(self)
+            self.web_channel = QWebChannel()
+            self.web_channel.registerObject("transcript", self.transcript_bridge)
+            self.chat_display.page().setWebChannel(self.web_channel)
+            # qwebchannel.js编译在QtWebChannel的资源中，页面加载完成后与渲染桥一起注入
+            script = QFile(":/qtwebchannel/qwebchannel.js")
+            if script.open(QIODevice.ReadOnly):
+                self.webchannel_js = bytes(script.readAll()).decode("utf-8")
+                script.close()
+        except Exception as e:
+            print(f"设置聊天记录加载接口时出错: {e}")
+    
+    def load_older_webview_messages(self, before_id):
+        """聊天页面滚动到顶部时，从对话记录读取ID小于before_id的一页消息插入到最前面"""
+        try:
+            entries = self.chat_store.before(self.chat_session, before_id, TRANSCRIPT_PAGE)
+        except Exception as e:
+            print(f"读取对话记录时出错: {e}")
+            entries = []
+        html = "".join(
+            self.format_webview_message(entry["sender"], entry["message"], entry["timestamp"], entry["id"])
+            for entry in entries
+        )
+        self.queue_webview_update({"type": "prepend", "html": html, "more": len(entries) >= TRANSCRIPT_PAGE})
+    
     def setup_simple_link_handling(self):
         """简单的链接处理方案"""
         try:
@@ -1340,57 +1277,6 @@ class OllamaSettingsQt(QMainWindow):
             print(f"URL转换出错: {e}")
             return text
     
-    def check_search_engine_connectivity(self):
-        """检查简化搜索服务连通性"""
-        try:
-            import os
-            import asyncio
-            
-            # 设置环境变量
-            os.environ['SEARXNG_API_URL'] = 'https://searx.bndkt.io'
-            
-            # 测试simple_search模块
-            try:
-                import simple_search
-                print("simple_search模块导入成功")
-                
-                # 测试搜索功能
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                try:
-                    result = loop.run_until_complete(
-                        simple_search.perform_search(
-                            query="test",
-                            category="general",
-                            language="auto",
-                            safe_search=1,
-                            time_range="",
-                            output_format="html"
-                        )
-                    )
-                    
-                    if result and result.strip():
-                        print("简化搜索服务连通性检查成功")
-                        return True
-                    else:
-                        print("搜索测试返回空结果")
-                        return False
-                        
-                finally:
-                    loop.close()
-                    
-            except ImportError as e:
-                print(f"simple_search模块导入失败: {e}")
-                return False
-            except Exception as e:
-                print(f"简化搜索连通性检查异常: {e}")
-                return False
-                
-        except Exception as e:
-            print(f"搜索服务连通性检查失败: {e}")
-            return False
-    
     def init_chat_html(self):
         """初始化聊天HTML内容"""
         # 使用国际化文本
@@ -1501,7 +1387,141 @@ class OllamaSettingsQt(QMainWindow):
 </body>
 </html>
         """
+        # 重新加载页面后等待loadFinished再安装渲染桥，旧页面的待渲染内容作废
+        self.webview_ready = False
+        self.webview_queue.clear()
         self.chat_display.setHtml(html_content)
+    
+    def on_chat_page_loaded(self, ok):
+        """聊天页面加载完成后安装一次JS渲染桥，并渲染积压的消息"""
+        if not ok:
+            print("[DEBUG] 聊天页面加载失败")
+            return
+        
+        self.chat_display.page().runJavaScript(self.webchannel_js + """;
+        window.miniaiChat = {
+            windowSize: 200,
+            hasOlder: true,  // 对话记录中可能还有未显示的较早消息
+            loading: false,
+            bridge: null,  // Python端的TranscriptBridge
+            configure: function(windowSize) {
+                this.windowSize = windowSize;
+            },
+            apply: function(ops) {
+                var messagesDiv = document.getElementById('messages');
+                if (!messagesDiv) {
+                    return;
+                }
+                var follow = false;
+                for (var i = 0; i < ops.length; i++) {
+                    var op = ops[i];
+                    var draft = document.getElementById('streaming-message');
+                    if (op.type === 'prepend') {
+                        this.prepend(messagesDiv, op);
+                        continue;
+                    }
+                    follow = true;
+                    if (op.type === 'append') {
+                        // 保持流式草稿始终位于最后
+                        if (draft) {
+                            draft.insertAdjacentHTML('beforebegin', op.html);
+                        } else {
+                            messagesDiv.insertAdjacentHTML('beforeend', op.html);
+                        }
+                    } else if (op.type === 'draft') {
+                        if (!draft) {
+                            draft = document.createElement('div');
+                            draft.id = 'streaming-message';
+                            draft.className = 'message assistant-message';
+                            draft.innerHTML = '<div class="assistant-bubble"><div class="timestamp"></div><div class="message-content"></div></div>';
+                            messagesDiv.appendChild(draft);
+                        }
+                        draft.querySelector('.timestamp').textContent = op.header;
+                        draft.querySelector('.message-content').textContent = op.text;
+                    } else if (op.type === 'clear_draft') {
+                        if (draft) {
+                            draft.parentNode.removeChild(draft);
+                        }
+                    }
+                }
+                if (follow) {
+                    this.trim(messagesDiv);
+                    // 每批只滚动一次
+                    window.scrollTo(0, document.body.scrollHeight);
+                }
+            },
+            trim: function(messagesDiv) {
+                // 超出窗口的最早消息直接移出DOM，需要时再从对话记录加载
+                var excess = messagesDiv.children.length - this.windowSize;
+                if (document.getElementById('streaming-message')) {
+                    excess -= 1;
+                }
+                while (excess-- > 0) {
+                    var first = messagesDiv.firstElementChild;
+                    if (!first || first.id === 'streaming-message') {
+                        break;
+                    }
+                    messagesDiv.removeChild(first);
+                    this.hasOlder = true;
+                }
+            },
+            loadOlder: function() {
+                // 滚动到顶部时请求已显示的最早一条消息之前的一页，结果以prepend操作返回
+                var messagesDiv = document.getElementById('messages');
+                if (!messagesDiv || !this.bridge || this.loading || !this.hasOlder) {
+                    return;
+                }
+                var first = messagesDiv.querySelector('[data-id]');
+                if (!first) {
+                    return;
+                }
+                this.loading = true;
+                this.bridge.loadOlder(parseInt(first.getAttribute('data-id'), 10));
+            },
+            prepend: function(messagesDiv, op) {
+                // 插入较早的消息并保持当前阅读位置
+                var before = document.body.scrollHeight;
+                messagesDiv.insertAdjacentHTML('afterbegin', op.html);
+                window.scrollTo(0, window.scrollY + document.body.scrollHeight - before);
+                this.hasOlder = op.more;
+                this.loading = false;
+            }
+        };
+        if (window.QWebChannel && window.qt && qt.webChannelTransport) {
+            new QWebChannel(qt.webChannelTransport, function(channel) {
+                window.miniaiChat.bridge = channel.objects.transcript;
+            });
+        }
+        window.addEventListener('scroll', function() {
+            if (window.scrollY < 50) {
+                window.miniaiChat.loadOlder();
+            }
+        });
+        """ + f"window.miniaiChat.configure({TRANSCRIPT_WINDOW});")
+        self.webview_ready = True
+        self.flush_webview_queue()
+    
+    def queue_webview_update(self, op):
+        """将DOM更新加入渲染队列，在下一帧与其他更新一起执行"""
+        # 连续的草稿更新只保留最新的一次
+        if op["type"] == "draft" and self.webview_queue and self.webview_queue[-1]["type"] == "draft":
+            self.webview_queue[-1] = op
+        else:
+            self.webview_queue.append(op)
+        if self.webview_ready and not self.webview_render_timer.isActive():
+            self.webview_render_timer.start(16)
+    
+    def flush_webview_queue(self):
+        """用一次runJavaScript执行队列中的全部DOM更新"""
+        if not self.webview_ready or not self.webview_queue:
+            return
+        ops, self.webview_queue = self.webview_queue, []
+        try:
+            self.chat_display.page().runJavaScript(
+                f"window.miniaiChat.apply({json.dumps(ops, ensure_ascii=False)});"
+            )
+        except Exception as e:
+            print(f"执行JavaScript时出错: {e}")
         
     def detect_language(self):
         """检测系统语言"""
@@ -1681,7 +1701,6 @@ class OllamaSettingsQt(QMainWindow):
         return {
             "auto_start": False,
             "selected_model": "",
-            "chat_history": [],
             "window_geometry": "900x600",
             "ollama_host": "localhost",
             "ollama_port": "11434",
@@ -2137,6 +2156,8 @@ class OllamaSettingsQt(QMainWindow):
         if WEBENGINE_AVAILABLE and QWebEngineView:
             self.chat_display = QWebEngineView()
             self.chat_display.setMinimumHeight(300)
+            self.chat_display.loadFinished.connect(self.on_chat_page_loaded)
+            self.setup_transcript_bridge()
             # 设置链接点击行为 - 在系统浏览器中打开
             self.setup_webview_link_handling()
             # 初始化HTML内容
@@ -2147,6 +2168,7 @@ class OllamaSettingsQt(QMainWindow):
             self.chat_display.setMinimumHeight(300)
             self.chat_display.setReadOnly(True)
             self.chat_display.setOpenExternalLinks(True)  # QTextBrowser支持此方法
+            self.chat_display.verticalScrollBar().valueChanged.connect(self.on_transcript_scrolled)
             # 设置文档模式支持HTML，确保不覆盖内联样式
             self.chat_display.document().setDefaultStyleSheet("""
                 body { 
@@ -2277,8 +2299,8 @@ class OllamaSettingsQt(QMainWindow):
         send_shortcut.activated.connect(self.send_message)
         
         # 初始化聊天
-        welcome_msg = self.get_text("welcome_message", "chat")
-        self.add_chat_message(self.get_text("system", "chat"), welcome_msg)
+        self.render_session_history()
+        self.show_welcome_message()
     
     def setup_model_tab(self):
         """设置模型管理标签页"""
@@ -2685,11 +2707,7 @@ class OllamaSettingsQt(QMainWindow):
         
         try:
             if self.check_ollama_status():
-                url = f"http://{self.ollama_host}:{self.ollama_port}/api/tags"
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    models = [model['name'] for model in data.get('models', [])]
+                models = ollama_client.get_client(self.ollama_host, self.ollama_port).list_models(timeout=10)
         except Exception as e:
             self.update_status(f"获取本地模型列表失败: {e}")
         
@@ -3004,18 +3022,209 @@ class OllamaSettingsQt(QMainWindow):
         # 添加用户消息
         self.add_chat_message(self.get_text("user", "chat"), message)
         
-        # 启动聊天线程，传递聊天历史
+        self.speculative_search = None
+        
+        # 审查结论已经确定需要联网的问题，跳过首次生成直接搜索
+        if self.route_question(message) == "search":
+            self.start_speculative_search(message, routed=True)
+            self.update_status("正在联网搜索...")
+            return
+        
+        self.start_chat_thread(message)
+        
+        # 问题本身已预示需要联网时，在生成和审查回答的同时提前搜索
+        if (self.speculative_search_enabled and self.search_monitor.is_available() is not False
+                and self.should_prefetch_search(message)):
+            self.start_speculative_search(message)
+        
+        self.update_status("正在生成回复...")
+    
+    def start_chat_thread(self, message):
+        """启动聊天线程，传递聊天历史"""
+        self.reset_streaming_text()
         self.chat_thread = ChatThread(
             self.ollama_host, self.ollama_port, 
-            self.model_combo.currentText(), message, self.chat_history
+            self.model_combo.currentText(), message, self.recent_history(),
+            stream=self.stream_responses, keep_alive=self.ollama_keep_alive,
+            context_budget=self.context_budget()
         )
         self.chat_thread.message_received.connect(self.on_message_received)
+        self.chat_thread.token_received.connect(self.on_token_received)
         self.chat_thread.error_occurred.connect(
             lambda error: self.add_chat_message("错误", error)
         )
         self.chat_thread.start()
+    
+    def route_question(self, question):
+        """生成前路由：返回 "search"（直接联网）或 "generate"（先生成再审查）
         
-        self.update_status("正在生成回复...")
+        时间相关问题的审查结果固定为可信度0，首次生成的回答只会被丢弃
+        """
+        self.routing_stats["total"] += 1
+        route = "generate"
+        if (self.pre_routing_enabled and self.search_monitor.is_available() is not False
+                and AnswerReviewThread.is_time_related_question(question)):
+            route = "search"
+            self.routing_stats["short_circuit"] += 1
+        
+        stats = self.routing_stats
+        print(f"[DEBUG] 路由结果: {route}，累计 {stats['total']} 个问题，"
+              f"直接联网 {stats['short_circuit']} 次 ({stats['short_circuit'] / stats['total']:.0%})，"
+              f"搜索失败回退生成 {stats['fallback']} 次")
+        return route
+    
+    def should_prefetch_search(self, question):
+        """仅根据问题预测审查后是否可能需要联网搜索（与审查线程的判断顺序一致）"""
+        if AnswerReviewThread.is_time_related_question(question):
+            return True
+        if AnswerReviewThread.is_simple_greeting(question):
+            return False
+        return AnswerReviewThread.is_intellectual_question(question)
+    
+    def start_speculative_search(self, question, routed=False):
+        """启动预取搜索，结果是否使用取决于审查结论；routed为True时已确定使用结果"""
+        print(f"[DEBUG] 启动{'路由' if routed else '预取'}搜索: {question}")
+        thread = WebSearchThread(question, self.hidden_webview)
+        self.speculative_search = {
+            "thread": thread,
+            "question": question,
+            "state": "running",  # running / done / failed
+            "result": None,
+            "wanted": routed,  # 审查已确认需要搜索，正在等待结果
+            "routed": routed,  # 由生成前路由发起，未生成过回答
+            "confidence": 0.0,
+            "started": time.time()
+        }
+        thread.search_completed.connect(
+            lambda result, t=thread: self.on_speculative_search_completed(t, result)
+        )
+        thread.error_occurred.connect(
+            lambda error, t=thread: self.on_speculative_search_failed(t, error)
+        )
+        self.keep_thread_alive(thread)
+        thread.start()
+    
+    def keep_thread_alive(self, thread):
+        """保持线程对象的引用直到线程结束，避免运行中的QThread被回收"""
+        self.background_threads.add(thread)
+        thread.finished.connect(lambda t=thread: self.background_threads.discard(t))
+    
+    def use_speculative_search(self, confidence_score):
+        """审查确认需要搜索时，复用预取搜索；无可用的预取搜索时返回False"""
+        spec = self.speculative_search
+        if not spec or spec["question"] != self.current_user_message:
+            return False
+        
+        if spec["state"] == "done":
+            print(f"[DEBUG] 预取搜索已完成，直接使用结果（提前 {time.time() - spec['started']:.1f} 秒启动）")
+            self.speculative_search = None
+            self.on_search_completed(spec["result"])
+        elif spec["state"] == "failed":
+            # 预取搜索刚刚失败，不再重复探测网络
+            self.speculative_search = None
+            self.show_offline_reply(confidence_score)
+        else:
+            print(f"[DEBUG] 预取搜索仍在进行，等待结果")
+            spec["wanted"] = True
+            spec["confidence"] = confidence_score
+            self.update_status("正在联网搜索...")
+        return True
+    
+    def on_speculative_search_completed(self, thread, search_results):
+        """预取搜索完成"""
+        spec = self.speculative_search
+        if not spec or spec["thread"] is not thread:
+            return  # 已被丢弃的过期搜索
+        
+        spec["state"] = "done"
+        spec["result"] = search_results
+        if spec["wanted"]:
+            self.speculative_search = None
+            self.on_search_completed(search_results)
+    
+    def on_speculative_search_failed(self, thread, error):
+        """预取搜索失败"""
+        spec = self.speculative_search
+        if not spec or spec["thread"] is not thread:
+            return
+        
+        print(f"[DEBUG] 预取搜索失败: {error}")
+        spec["state"] = "failed"
+        if spec["routed"]:
+            # 没有可显示的离线回答，回退到正常生成；审查后会复用这次失败结果而不再探测网络
+            self.routing_stats["fallback"] += 1
+            spec["wanted"] = False
+            spec["routed"] = False
+            self.update_status("正在生成回复...")
+            self.start_chat_thread(spec["question"])
+        elif spec["wanted"]:
+            self.speculative_search = None
+            self.show_offline_reply(spec["confidence"])
+    
+    def on_token_received(self, token):
+        """处理流式输出的增量文本"""
+        self.streaming_text += token
+        self.streaming_visible += self.think_stripper.feed(token)
+        if not self.stream_flush_timer.isActive():
+            self.stream_flush_timer.start(50)
+    
+    def reset_streaming_text(self):
+        """清空流式输出的累计文本"""
+        self.streaming_text = ""
+        self.streaming_visible = ""
+        self.think_stripper = response_filter.ThinkStripper()
+    
+    def flush_streaming_message(self):
+        """将累计的流式文本刷新到聊天区域的草稿消息中"""
+        # 草稿只去除<think>块（增量完成），完整的过滤在最终回答到达时进行
+        draft_text = self.streaming_visible.strip()
+        if not draft_text:
+            return
+        
+        try:
+            sender = self.get_text("assistant", "chat")
+            timestamp = datetime.now().strftime("%H:%M:%S")
+            
+            if WEBENGINE_AVAILABLE and hasattr(self.chat_display, 'setHtml'):
+                self.queue_webview_update({
+                    "type": "draft",
+                    "header": f"[{timestamp}] {sender}",
+                    "text": draft_text
+                })
+            else:
+                cursor = self.chat_display.textCursor()
+                if self.streaming_anchor is None:
+                    cursor.movePosition(cursor.End)
+                    self.streaming_anchor = cursor.position()
+                else:
+                    cursor.setPosition(self.streaming_anchor)
+                    cursor.movePosition(cursor.End, cursor.KeepAnchor)
+                    cursor.removeSelectedText()
+                cursor.insertHtml(self.format_textedit_message(sender, draft_text, timestamp))
+                
+                scrollbar = self.chat_display.verticalScrollBar()
+                scrollbar.setValue(scrollbar.maximum())
+                
+        except Exception as e:
+            print(f"刷新流式消息时出错: {e}")
+    
+    def clear_streaming_message(self):
+        """移除流式草稿消息（最终回答会作为正式消息重新添加）"""
+        self.stream_flush_timer.stop()
+        self.reset_streaming_text()
+        
+        try:
+            if WEBENGINE_AVAILABLE and hasattr(self.chat_display, 'setHtml'):
+                self.queue_webview_update({"type": "clear_draft"})
+            elif self.streaming_anchor is not None:
+                cursor = self.chat_display.textCursor()
+                cursor.setPosition(self.streaming_anchor)
+                cursor.movePosition(cursor.End, cursor.KeepAnchor)
+                cursor.removeSelectedText()
+        except Exception as e:
+            print(f"移除流式消息时出错: {e}")
+        finally:
+            self.streaming_anchor = None
     
     def on_message_received(self, reply):
         """处理接收到的消息"""
@@ -3045,30 +3254,44 @@ class OllamaSettingsQt(QMainWindow):
         print(f"[DEBUG] 审查结果: {review_result[:100]}...")
         
         if needs_search or confidence_score <= 70:
-            # 可信度<=70%，先检查搜索引擎连通性
-            self.update_status("检查网络连接...")
+            # 已有预取搜索时直接使用其结果，省去一次搜索往返
+            if self.use_speculative_search(confidence_score):
+                return
             
-            if self.check_search_engine_connectivity():
-                # 搜索引擎正常，启动网络搜索（不显示"正在联网查询"提示）
+            # 可信度<=70%，读取后台监控的搜索引擎状态（不等待网络）
+            if self.search_monitor.is_available() is False:
+                # 搜索引擎不可用，直接显示LLM的回复
+                self.show_offline_reply(confidence_score)
+            else:
+                # 搜索引擎正常或状态未知，启动网络搜索（不显示"正在联网查询"提示）
                 self.update_status("正在联网搜索...")
                 self.search_thread = WebSearchThread(self.current_user_message, self.hidden_webview)
                 self.search_thread.search_completed.connect(self.on_search_completed)
                 self.search_thread.error_occurred.connect(
-                    lambda error: self.add_chat_message("搜索错误", error)
+                    lambda error, score=confidence_score: self.on_search_failed(error, score)
                 )
                 self.search_thread.start()
-            else:
-                # 搜索引擎不可用，直接显示LLM的回复
-                self.add_chat_message("AI 系统", "网络连接不可用，显示离线回答")
-                enhanced_reply = f"{self.pending_reply} <small style='color: #666; font-size: 11px;'>(离线回答，可信度: {confidence_score:.1f}%)</small>"
-                self.add_chat_message(self.get_text("assistant", "chat"), enhanced_reply)
-                self.update_status("就绪")
         else:
+            # 回答可信，丢弃预取搜索的结果
+            self.speculative_search = None
+            
             # 可信度>70%，显示原始回答，并在回答后附加可信度信息
             enhanced_reply = f"{self.pending_reply} <small style='color: #666; font-size: 11px;'>(可信度: {confidence_score:.1f}%)</small>"
             self.add_chat_message(self.get_text("assistant", "chat"), enhanced_reply)
             self.update_status("就绪")
     
+    def on_search_failed(self, error, confidence_score):
+        """联网搜索失败时退回显示LLM的原始回复"""
+        print(f"[DEBUG] 联网搜索失败: {error}")
+        self.show_offline_reply(confidence_score)
+    
+    def show_offline_reply(self, confidence_score):
+        """联网搜索不可用时显示LLM的原始回复"""
+        self.add_chat_message("AI 系统", "网络连接不可用，显示离线回答")
+        enhanced_reply = f"{self.pending_reply} <small style='color: #666; font-size: 11px;'>(离线回答，可信度: {confidence_score:.1f}%)</small>"
+        self.add_chat_message(self.get_text("assistant", "chat"), enhanced_reply)
+        self.update_status("就绪")
+    
     def on_search_completed(self, search_results):
         """处理搜索完成"""
         if search_results:
@@ -3077,7 +3300,8 @@ class OllamaSettingsQt(QMainWindow):
             self.enhanced_answer_thread = EnhancedAnswerThread(
                 self.ollama_host, self.ollama_port,
                 self.model_combo.currentText(),
-                self.current_user_message, search_results, self.chat_history
+                self.current_user_message, search_results, self.recent_history(),
+                keep_alive=self.ollama_keep_alive, context_budget=self.context_budget()
             )
             self.enhanced_answer_thread.answer_generated.connect(self.on_enhanced_answer_generated)
             self.enhanced_answer_thread.error_occurred.connect(
@@ -3094,228 +3318,191 @@ class OllamaSettingsQt(QMainWindow):
         self.update_status("就绪")
     
     def filter_llm_response(self, message):
-        """过滤LLM回复中的多余内容"""
+        """过滤LLM回复中的多余内容（思考过程、图片、HTML标签等）"""
         try:
-            # 如果不是助手回复，直接返回原消息
-            if not message:
-                return message
-            
-            # 过滤模式列表
-            filter_patterns = [
-                # 思考过程标记
-                r'<think>.*?</think>',
-                r'\*thinks?\*.*?\*thinks?\*',
-                r'\[thinking\].*?\[/thinking\]',
-                r'思考：.*?(?=\n|$)',
-                r'让我想想.*?(?=\n|$)',
-                
-                # 图片相关
-                r'!\[.*?\]\(.*?\)',  # Markdown图片
-                r'<img.*?>',         # HTML图片标签
-                r'图片：.*?(?=\n|$)',
-                r'image:.*?(?=\n|$)',
-                
-                # 多余的标记
-                r'<.*?>', # 其他HTML标签
-                r'\*\*思考\*\*.*?(?=\n|$)',
-                r'```thinking.*?```',
-                
-                # 多余的元信息
-                r'作为.*?AI.*?，',
-                r'根据我的.*?训练.*?，',
-                r'我是.*?语言模型.*?，',
-                
-                # 重复的标点符号
-                r'[。！？]{3,}',
-                r'[.!?]{3,}',
-                
-                # 多余的换行
-                r'\n{3,}',
-            ]
-            
-            import re
-            filtered_message = message
-            
-            # 应用过滤规则
-            for pattern in filter_patterns:
-                filtered_message = re.sub(pattern, '', filtered_message, flags=re.DOTALL | re.IGNORECASE)
-            
-            # 清理多余的空白字符
-            filtered_message = re.sub(r'[ \t]+', ' ', filtered_message)  # 多个空格/制表符变成一个空格
-            filtered_message = re.sub(r'\n\s*\n\s*\n+', '\n\n', filtered_message)  # 多个换行变成两个
-            filtered_message = re.sub(r'^\s+|\s+$', '', filtered_message)  # 去除首尾空白
-            
-            return filtered_message if filtered_message else message
-            
+            return response_filter.filter_response(message)
         except Exception as e:
             print(f"过滤LLM回复时出错: {e}")
             return message
     
-    def add_chat_message(self, sender, message):
-        """添加聊天消息 - 支持WebView和QTextEdit两种模式"""
+    def show_welcome_message(self):
+        """显示欢迎语（只显示，不保存到对话记录）；WebView页面模板中已包含欢迎语"""
+        if WEBENGINE_AVAILABLE and hasattr(self.chat_display, 'setHtml'):
+            return
+        self.add_chat_message(self.get_text("system", "chat"), self.get_text("welcome_message", "chat"), persist=False)
+    
+    def add_chat_message(self, sender, message, persist=True):
+        """添加聊天消息 - 支持WebView和QTextEdit两种模式，persist为False时只显示不保存到对话记录"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         
+        # 正式消息到达时移除流式草稿
+        if self.streaming_text or self.streaming_anchor is not None:
+            self.clear_streaming_message()
+        
         # 如果是助手回复，先过滤多余内容
         if sender in ["AI 助手", "AI 助手(联网增强)", self.get_text("assistant", "chat")]:
             message = self.filter_llm_response(message)
         
+        # 保存到对话记录（两种显示模式共用，供后续对话构建上下文），消息ID用于按页加载较早的消息
+        message_id = None
+        if persist:
+            try:
+                message_id = self.chat_store.append(self.chat_session, sender_role(sender), sender, message, timestamp)
+            except Exception as e:
+                print(f"保存对话记录时出错: {e}")
+        
         # 检查是否使用WebView
         if WEBENGINE_AVAILABLE and hasattr(self.chat_display, 'setHtml'):
-            self.add_webview_message(sender, message, timestamp)
+            self.add_webview_message(sender, message, timestamp, message_id)
         else:
-            self.add_textedit_message(sender, message, timestamp)
+            self.add_textedit_message(sender, message, timestamp, message_id)
+    
+    def render_session_history(self):
+        """继续上一次的会话时显示其中最近的消息"""
+        entries = self.chat_store.before(self.chat_session, None, TRANSCRIPT_WINDOW)
+        for entry in entries:
+            if WEBENGINE_AVAILABLE and hasattr(self.chat_display, 'setHtml'):
+                self.add_webview_message(entry["sender"], entry["message"], entry["timestamp"], entry["id"])
+            else:
+                self.add_textedit_message(entry["sender"], entry["message"], entry["timestamp"], entry["id"])
+        self.transcript_has_older = len(entries) >= TRANSCRIPT_WINDOW
     
-    def add_webview_message(self, sender, message, timestamp):
-        """添加消息到WebView"""
+    def context_budget(self):
+        """当前模型的提示token预算，可在配置的context_budgets中按模型名（支持通配符）设置"""
+        return context_builder.budget_for(self.model_combo.currentText(), self.config.get("context_budgets"))
+    
+    def recent_history(self, limit=context_builder.MAX_HISTORY_MESSAGES):
+        """从对话记录中读取最近的用户和助手消息（候选，按token预算选取在线程中进行）"""
         try:
-            # 转义HTML特殊字符
-            escaped_message = message.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            
-            # 将URL转换为可点击的链接
-            escaped_message = self.convert_urls_to_links(escaped_message)
-            
-            # 确定消息类型和样式
-            if sender == self.get_text("user", "chat") or sender == "我":
-                message_class = "user-message"
-                bubble_class = "user-bubble"
-            elif sender in ["AI 系统", "system"]:
-                message_class = "system-message"
-                bubble_class = "system-bubble"
-            else:
-                message_class = "assistant-message"
-                bubble_class = "assistant-bubble"
-            
-            # 构建消息HTML
-            message_html = f"""
-            <div class="message {message_class}">
+            return self.chat_store.recent(self.chat_session, limit)
+        except Exception as e:
+            print(f"读取对话记录时出错: {e}")
+            return []
+    
+    def migrate_config_history(self):
+        """将旧版本保存在配置文件中的chat_history迁移到对话记录数据库"""
+        legacy_history = self.config.pop("chat_history", None)
+        if not legacy_history:
+            return
+        try:
+            session = self.chat_store.create_session("config")
+            self.chat_store.append_many(session, [
+                (sender_role(entry.get("sender", "")), entry.get("sender", ""),
+                 entry.get("message", ""), entry.get("timestamp", ""))
+                for entry in legacy_history
+            ])
+            print(f"[DEBUG] 已迁移配置文件中的 {len(legacy_history)} 条对话记录")
+        except Exception as e:
+            print(f"迁移对话记录时出错: {e}")
+            return
+        self.save_config()
+    
+    def format_webview_message(self, sender, message, timestamp, message_id=None):
+        """生成WebView中单条消息的HTML，message_id写入data-id供按页加载较早的消息"""
+        # 转义HTML特殊字符
+        escaped_message = message.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        
+        # 将URL转换为可点击的链接
+        escaped_message = self.convert_urls_to_links(escaped_message)
+        
+        # 确定消息类型和样式
+        if sender == self.get_text("user", "chat") or sender == "我":
+            message_class = "user-message"
+            bubble_class = "user-bubble"
+        elif sender in ["AI 系统", "system"]:
+            message_class = "system-message"
+            bubble_class = "system-bubble"
+        else:
+            message_class = "assistant-message"
+            bubble_class = "assistant-bubble"
+        
+        data_id = f' data-id="{int(message_id)}"' if message_id is not None else ''
+        return f"""
+            <div class="message {message_class}"{data_id}>
                 <div class="{bubble_class}">
                     <div class="timestamp">[{timestamp}] {sender}</div>
                     <div class="message-content">{escaped_message}</div>
                 </div>
             </div>
             """
-            
-            # 使用JavaScript添加消息，增加强化的DOM检查和重试机制
-            js_code = f"""
-            (function() {{
-                function addMessage(retryCount) {{
-                    retryCount = retryCount || 0;
-                    var messagesDiv = document.getElementById('messages');
-                    
-                    if (!messagesDiv) {{
-                        if (retryCount < 10) {{
-                            console.log('messages元素不存在，重试中... (' + (retryCount + 1) + '/10)');
-                            setTimeout(function() {{ addMessage(retryCount + 1); }}, 100);
-                            return;
-                        }} else {{
-                            console.error('messages元素不存在，HTML可能未完全加载，已重试10次');
-                            return;
-                        }}
-                    }}
-                    
-                    var newMessage = document.createElement('div');
-                    newMessage.innerHTML = `{message_html}`;
-                    if (newMessage.firstElementChild) {{
-                        messagesDiv.appendChild(newMessage.firstElementChild);
-                        window.scrollTo(0, document.body.scrollHeight);
-                        console.log('消息添加成功');
-                    }} else {{
-                        console.error('无法创建消息元素');
-                    }}
-                }}
-                
-                // 检查DOM是否准备就绪
-                if (document.readyState === 'complete') {{
-                    addMessage();
-                }} else {{
-                    document.addEventListener('DOMContentLoaded', function() {{
-                        addMessage();
-                    }});
-                    // 备用方案：延迟执行
-                    setTimeout(function() {{ addMessage(); }}, 200);
-                }}
-            }})();
-            """
-            
-            # 延迟执行JavaScript，确保DOM完全加载
-            def run_js():
-                try:
-                    self.chat_display.page().runJavaScript(js_code)
-                except Exception as e:
-                    print(f"执行JavaScript时出错: {e}")
-            
-            # 使用QTimer延迟200ms执行，给HTML更多加载时间
-            from PyQt5.QtCore import QTimer
-            QTimer.singleShot(200, run_js)
+    
+    def add_webview_message(self, sender, message, timestamp, message_id=None):
+        """添加消息到WebView"""
+        try:
+            message_html = self.format_webview_message(sender, message, timestamp, message_id)
+            self.queue_webview_update({"type": "append", "html": message_html})
             
         except Exception as e:
             print(f"WebView添加消息时出错: {e}")
             # 回退到QTextBrowser模式
-            self.add_textedit_message(sender, message, timestamp)
+            self.add_textedit_message(sender, message, timestamp, message_id)
+    
+    def format_textedit_message(self, sender, message, timestamp):
+        """生成QTextBrowser中单条消息的HTML"""
+        # 转义HTML特殊字符，保持换行
+        escaped_message = message.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        # 将换行符转换为HTML换行，但保持段落结构
+        escaped_message = escaped_message.replace('\n\n', '</p><p>').replace('\n', '<br>')
+        escaped_message = f'<p>{escaped_message}</p>' if escaped_message.strip() else ''
+        
+        # 将URL转换为可点击的链接
+        escaped_message = self.convert_urls_to_links(escaped_message)
+        
+        # 根据发送者设置样式
+        if sender == self.get_text("user", "chat") or sender == "用户" or sender == "我":
+            # 用户消息右对齐，使用蓝色主题
+            formatted_message = f"""
+            <table width="100%" style="margin: 12px 0; border-collapse: collapse;">
+                <tr>
+                    <td style="text-align: right; padding: 0;">
+                        <div style="display: inline-block; max-width: 300px; background-color: #2196F3; color: #FFFFFF; padding: 10px 15px; border-radius: 18px 18px 5px 18px; box-shadow: 0 2px 10px rgba(33,150,243,0.3); text-align: left; word-wrap: break-word; font-family: 'Microsoft YaHei', sans-serif;">
+                            <div style="font-size: 10px; color: #FFFFFF; margin-bottom: 6px; font-weight: 500;">[{timestamp}] {sender}</div>
+                            <div style="font-size: 14px; line-height: 1.5; word-break: break-word; color: #FFFFFF;">{escaped_message}</div>
+                        </div>
+                    </td>
+                </tr>
+            </table>
+            """
+        elif sender in ["AI 系统", "system", "系统"]:
+            # 系统消息，居中显示
+            formatted_message = f"""
+            <div style="text-align: center; margin: 12px 0; clear: both;">
+                <div style="display: inline-block; max-width: 80%; background: linear-gradient(135deg, #FFF8E1, #FFF3C4); color: #F57F17; padding: 8px 12px; border-radius: 15px; border: 1px solid #FFE082; text-align: center; font-family: 'Microsoft YaHei', sans-serif; font-size: 12px;">
+                    <div style="font-weight: 500;">[{timestamp}] {sender}</div>
+                    <div style="margin-top: 4px; line-height: 1.4;">{escaped_message}</div>
+                </div>
+            </div>
+            <div style="height: 8px; clear: both;"></div>
+            """
+        else:
+            # 助手消息左对齐，使用灰色主题
+            formatted_message = f"""
+            <table width="100%" style="margin: 12px 0; border-collapse: collapse;">
+                <tr>
+                    <td style="text-align: left; padding: 0;">
+                        <div style="display: inline-block; max-width: 300px; background-color: #F5F5F5; color: #333333; padding: 10px 15px; border-radius: 18px 18px 18px 5px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); border: 1px solid #E0E0E0; text-align: left; word-wrap: break-word; font-family: 'Microsoft YaHei', sans-serif;">
+                            <div style="font-size: 10px; color: #666666; margin-bottom: 6px; font-weight: 500;">[{timestamp}] {sender}</div>
+                            <div style="font-size: 14px; line-height: 1.5; word-break: break-word; color: #333333;">{escaped_message}</div>
+                        </div>
+                    </td>
+                </tr>
+            </table>
+            """
+        return formatted_message
     
-    def add_textedit_message(self, sender, message, timestamp):
-        """添加消息到QTextBrowser（回退模式）"""
+    def add_textedit_message(self, sender, message, timestamp, message_id=None):
+        """添加消息到QTextBrowser（回退模式），message_id为该消息在对话记录中的ID"""
         try:
-            # 调试信息：打印sender的值
-            print(f"DEBUG: sender='{sender}', get_text('user', 'chat')='{self.get_text('user', 'chat')}'")
-            print(f"DEBUG: 是否匹配用户条件: {sender == self.get_text('user', 'chat') or sender == '用户' or sender == '我'}")
-            # 转义HTML特殊字符，保持换行
-            escaped_message = message.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            # 将换行符转换为HTML换行，但保持段落结构
-            escaped_message = escaped_message.replace('\n\n', '</p><p>').replace('\n', '<br>')
-            escaped_message = f'<p>{escaped_message}</p>' if escaped_message.strip() else ''
-            
-            # 将URL转换为可点击的链接
-            escaped_message = self.convert_urls_to_links(escaped_message)
-            
-            # 根据发送者设置样式
-            if sender == self.get_text("user", "chat") or sender == "用户" or sender == "我":
-                # 用户消息右对齐，使用蓝色主题
-                print(f"DEBUG: 匹配用户消息，sender='{sender}'")
-                formatted_message = f"""
-                <table width="100%" style="margin: 12px 0; border-collapse: collapse;">
-                    <tr>
-                        <td style="text-align: right; padding: 0;">
-                            <div style="display: inline-block; max-width: 300px; background-color: #2196F3; color: #FFFFFF; padding: 10px 15px; border-radius: 18px 18px 5px 18px; box-shadow: 0 2px 10px rgba(33,150,243,0.3); text-align: left; word-wrap: break-word; font-family: 'Microsoft YaHei', sans-serif;">
-                                <div style="font-size: 10px; color: #FFFFFF; margin-bottom: 6px; font-weight: 500;">[{timestamp}] {sender}</div>
-                                <div style="font-size: 14px; line-height: 1.5; word-break: break-word; color: #FFFFFF;">{escaped_message}</div>
-                            </div>
-                        </td>
-                    </tr>
-                </table>
-                """
-            elif sender in ["AI 系统", "system", "系统"]:
-                # 系统消息，居中显示
-                formatted_message = f"""
-                <div style="text-align: center; margin: 12px 0; clear: both;">
-                    <div style="display: inline-block; max-width: 80%; background: linear-gradient(135deg, #FFF8E1, #FFF3C4); color: #F57F17; padding: 8px 12px; border-radius: 15px; border: 1px solid #FFE082; text-align: center; font-family: 'Microsoft YaHei', sans-serif; font-size: 12px;">
-                        <div style="font-weight: 500;">[{timestamp}] {sender}</div>
-                        <div style="margin-top: 4px; line-height: 1.4;">{escaped_message}</div>
-                    </div>
-                </div>
-                <div style="height: 8px; clear: both;"></div>
-                """
-            else:
-                # 助手消息左对齐，使用灰色主题
-                print(f"DEBUG: 匹配AI消息，sender='{sender}'")
-                formatted_message = f"""
-                <table width="100%" style="margin: 12px 0; border-collapse: collapse;">
-                    <tr>
-                        <td style="text-align: left; padding: 0;">
-                            <div style="display: inline-block; max-width: 300px; background-color: #F5F5F5; color: #333333; padding: 10px 15px; border-radius: 18px 18px 18px 5px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); border: 1px solid #E0E0E0; text-align: left; word-wrap: break-word; font-family: 'Microsoft YaHei', sans-serif;">
-                                <div style="font-size: 10px; color: #666666; margin-bottom: 6px; font-weight: 500;">[{timestamp}] {sender}</div>
-                                <div style="font-size: 14px; line-height: 1.5; word-break: break-word; color: #333333;">{escaped_message}</div>
-                            </div>
-                        </td>
-                    </tr>
-                </table>
-                """
+            formatted_message = self.format_textedit_message(sender, message, timestamp)
             
             # 插入HTML
             cursor = self.chat_display.textCursor()
             cursor.movePosition(cursor.End)
+            self.transcript_offsets.append(cursor.position())
+            self.transcript_ids.append(message_id)
             cursor.insertHtml(formatted_message)
             self.chat_display.setTextCursor(cursor)
+            self.trim_textedit_transcript()
             
             # 滚动到底部
             scrollbar = self.chat_display.verticalScrollBar()
@@ -3326,19 +3513,61 @@ class OllamaSettingsQt(QMainWindow):
             # 最后的回退：格式化纯文本模式
             simple_message = f"\n[{timestamp}] {sender}:\n{message}\n" + "="*50 + "\n"
             self.chat_display.append(simple_message)
+    
+    def trim_textedit_transcript(self):
+        """从QTextBrowser中移除超出窗口的最早消息"""
+        excess = len(self.transcript_offsets) - TRANSCRIPT_WINDOW
+        if excess <= 0:
+            return
+        
+        cut = self.transcript_offsets[excess]
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(0)
+        cursor.setPosition(cut, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        
+        self.transcript_offsets = [offset - cut for offset in self.transcript_offsets[excess:]]
+        self.transcript_ids = self.transcript_ids[excess:]
+        self.transcript_has_older = True
+        if self.streaming_anchor is not None:
+            self.streaming_anchor -= cut
+    
+    def on_transcript_scrolled(self, value):
+        """QTextBrowser滚动到顶部时从对话记录加载一页较早的消息"""
+        scrollbar = self.chat_display.verticalScrollBar()
+        if value != scrollbar.minimum() or not self.transcript_has_older:
+            return
+        
+        # 以已显示的最早一条消息的ID为界向前取一页（未能保存的消息没有ID，跳过）
+        oldest_id = next((message_id for message_id in self.transcript_ids if message_id is not None), None)
+        entries = self.chat_store.before(self.chat_session, oldest_id, TRANSCRIPT_PAGE) if oldest_id is not None else []
+        self.transcript_has_older = len(entries) >= TRANSCRIPT_PAGE
+        if not entries:
+            return
+        old_maximum = scrollbar.maximum()
         
-        # 保存到历史记录
-        self.chat_history.append({
-            "timestamp": timestamp,
-            "sender": sender,
-            "message": message
-        })
+        cursor = QTextCursor(self.chat_display.document())
+        offsets = []
+        for entry in entries:
+            offsets.append(cursor.position())
+            cursor.insertHtml(self.format_textedit_message(entry["sender"], entry["message"], entry["timestamp"]))
+        shift = cursor.position()
+        
+        self.transcript_offsets = offsets + [offset + shift for offset in self.transcript_offsets]
+        self.transcript_ids = [entry["id"] for entry in entries] + self.transcript_ids
+        if self.streaming_anchor is not None:
+            self.streaming_anchor += shift
+        
+        # 保持当前阅读位置
+        scrollbar.setValue(scrollbar.maximum() - old_maximum)
     
     def clear_chat(self):
         """清空聊天记录"""
         # 直接清空，不询问用户
-        # 清空聊天历史
-        self.chat_history.clear()
+        self.clear_streaming_message()
+        
+        # 开始新的会话，之前的会话保留在对话记录数据库中
+        self.chat_session = self.chat_store.create_session()
         
         # 根据聊天显示类型进行清空
         if WEBENGINE_AVAILABLE and hasattr(self.chat_display, 'setHtml'):
@@ -3347,16 +3576,19 @@ class OllamaSettingsQt(QMainWindow):
         else:
             # QTextBrowser模式：直接清空
             self.chat_display.clear()
+            self.transcript_offsets = []
+            self.transcript_ids = []
+            self.transcript_has_older = False
         
         # 清空消息列表（用于WebView）
         if hasattr(self, 'chat_messages'):
             self.chat_messages.clear()
         
-        # 清空完成后不显示任何消息
+        self.show_welcome_message()
     
     def save_chat(self):
         """保存聊天记录"""
-        if not self.chat_history:
+        if not self.chat_store.count(self.chat_session):
             QMessageBox.warning(self, "警告", "没有聊天记录可保存")
             return
         
@@ -3364,8 +3596,8 @@ class OllamaSettingsQt(QMainWindow):
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"chat_history_{timestamp}.txt"
             
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(self.chat_display.toPlainText())
+            # 从数据库分批导出完整会话（聊天区域只保留最近的消息）
+            self.chat_store.export_text(self.chat_session, filename)
             
             self.update_status(f"聊天记录已保存到: {filename}")
             
@@ -3428,39 +3660,13 @@ class OllamaSettingsQt(QMainWindow):
             QMessageBox.critical(self, "错误", "未找到 Ollama 可执行文件")
             return
         
-        try:
-            if sys.platform == "win32":
-                CREATE_NO_WINDOW = 0x08000000
-                DETACHED_PROCESS = 0x00000008
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                startupinfo.wShowWindow = 0
-                
-                subprocess.Popen(
-                    [str(self.ollama_path), "serve"],
-                    creationflags=CREATE_NO_WINDOW | DETACHED_PROCESS,
-                    startupinfo=startupinfo,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    stdin=subprocess.DEVNULL
-                )
-            else:
-                subprocess.Popen(
-                    [str(self.ollama_path), "serve"],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    stdin=subprocess.DEVNULL
-                )
-            
-            self.update_status("正在启动 Ollama 服务...")
-            QTimer.singleShot(2000, self.check_ollama_status)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"启动 Ollama 服务失败: {e}")
+        # 由监视线程在后台启动并等待就绪，就绪后自动刷新模型列表
+        self.ollama_supervisor.request_start()
     
     def stop_ollama_service(self):
         """停止Ollama服务"""
         try:
+            self.ollama_supervisor.auto_restart = False  # 手动停止后不自动拉起
             if sys.platform == "win32":
                 subprocess.run(["taskkill", "/f", "/im", "ollama.exe"], 
                              creationflags=subprocess.CREATE_NO_WINDOW)
@@ -3468,6 +3674,7 @@ class OllamaSettingsQt(QMainWindow):
                 subprocess.run(["pkill", "ollama"])
             
             self.update_status("Ollama 服务已停止")
+            self.ollama_supervisor.request_check()
             
         except Exception as e:
             QMessageBox.critical(self, "错误", f"停止 Ollama 服务失败: {e}")
@@ -3475,8 +3682,7 @@ class OllamaSettingsQt(QMainWindow):
     def check_ollama_status(self):
         """检查Ollama服务状态"""
         try:
-            url = f"http://{self.ollama_host}:{self.ollama_port}/api/tags"
-            response = requests.get(url, timeout=5)
+            response = ollama_client.get_client(self.ollama_host, self.ollama_port).get("/api/tags", timeout=5)
             if response.status_code == 200:
                 self.update_status("Ollama 服务运行正常")
                 return True
@@ -3506,10 +3712,9 @@ class OllamaSettingsQt(QMainWindow):
         try:
             host = self.host_input.text()
             port = self.port_input.text()
-            url = f"http://{host}:{port}/api/tags"
             
             self.update_status("正在测试连接...")
-            response = requests.get(url, timeout=5)
+            response = ollama_client.get_client(host, port).get("/api/tags", timeout=5)
             
             if response.status_code == 200:
                 self.update_status("连接成功")
@@ -3588,6 +3793,7 @@ class OllamaSettingsQt(QMainWindow):
         else:
             os.environ.pop('OLLAMA_KEEP_ALIVE', None)
         
+        self.ollama_supervisor.set_address(self.ollama_host, self.ollama_port)
         self.update_env_info()
     
     def update_status(self, message):
@@ -3649,7 +3855,7 @@ class OllamaSettingsQt(QMainWindow):
             
             # 检查服务是否运行
             try:
-                response = requests.get("http://localhost:11434/api/tags", timeout=5)
+                response = ollama_client.get_client("localhost", "11434").get("/api/tags", timeout=5)
                 if response.status_code == 200:
                     print("Ollama service is running and responding")
                     return True
@@ -3749,7 +3955,14 @@ def main():
         window = OllamaSettingsQt()
         window.show()
         
-        sys.exit(app.exec_())
+        exit_code = app.exec_()
+        window.ollama_supervisor.stop()
+        ollama_client.close_all()
+        review_cache.close()
+        chat_store.close()
+        async_runner.shutdown()
+        search_cache.close()
+        sys.exit(exit_code)
 
 
 if __name__ == "__main__":
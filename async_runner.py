@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台asyncio事件循环
+应用程序持有一个常驻的事件循环线程，界面侧通过submit()提交协程并得到concurrent.futures.Future，
+共享的HTTP连接池和搜索缓存的后台刷新都在这个循环中长期存在
+"""
+
+import asyncio
+import threading
+
+import search_http
+
+
+class AsyncLoopThread:
+    """在独立线程中运行的事件循环"""
+
+    def __init__(self, name="miniai-async"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """提交协程（线程安全），返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """提交协程并阻塞等待结果，超时抛出concurrent.futures.TimeoutError"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    async def _shutdown(self):
+        """取消未完成的任务并关闭连接池"""
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await search_http.aclose()
+
+    def stop(self, timeout=5):
+        """停止事件循环并等待线程退出"""
+        if not self.loop.is_running():
+            return
+        try:
+            self.run(self._shutdown(), timeout)
+        except Exception as e:
+            print(f"关闭后台事件循环时出错: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.loop.close()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """获取应用共享的事件循环线程，首次使用时启动"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = AsyncLoopThread()
+        return _runner
+
+
+def shutdown():
+    """停止共享的事件循环线程，在程序退出时调用"""
+    global _runner
+    with _runner_lock:
+        runner, _runner = _runner, None
+    if runner is not None:
+        runner.stop()
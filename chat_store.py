@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对话记录存储
+使用SQLite（WAL模式）按会话保存聊天消息：每条消息只追加一行，
+构建提示时按索引读取最近N条，导出时分批读取写入文件，耗时与会话长度无关
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+# 配置
+STORE_FILE = os.environ.get("MINIAI_CHAT_DB", "chat_history.db")
+EXPORT_BATCH = 500
+
+ROLE_USER = "user"
+ROLE_ASSISTANT = "assistant"
+ROLE_SYSTEM = "system"
+
+
+class ChatStore:
+    """会话与消息的持久化存储，可在多个线程之间共享"""
+
+    def __init__(self, db_path=STORE_FILE):
+        self.lock = threading.Lock()
+        try:
+            self.db = self._open(db_path)
+        except sqlite3.Error as e:
+            print(f"对话记录数据库不可用，仅保存在内存中: {e}")
+            self.db = self._open(":memory:")
+
+    @staticmethod
+    def _open(db_path):
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA foreign_keys=ON")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL DEFAULT '',
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+                role TEXT NOT NULL,
+                sender TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_role ON messages (session_id, role, id)")
+        db.commit()
+        return db
+
+    @staticmethod
+    def _entry(row):
+        """数据库行转换为对话历史条目（与界面使用的字典格式一致）"""
+        return {
+            "id": row["id"],
+            "role": row["role"],
+            "sender": row["sender"],
+            "message": row["content"],
+            "timestamp": row["timestamp"],
+        }
+
+    def create_session(self, title=""):
+        """新建会话，返回会话ID"""
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO sessions (title, created, updated) VALUES (?, ?, ?)", (title, now, now)
+            )
+            self.db.commit()
+            return cursor.lastrowid
+
+    def latest_session(self):
+        """最近更新的会话ID，没有会话时返回None"""
+        with self.lock:
+            row = self.db.execute("SELECT id FROM sessions ORDER BY updated DESC, id DESC LIMIT 1").fetchone()
+        return row["id"] if row else None
+
+    def prune_empty_sessions(self, keep=None):
+        """删除没有用户消息的会话（例如只有欢迎语），keep指定的会话保留"""
+        with self.lock:
+            self.db.execute(
+                "DELETE FROM sessions WHERE id IS NOT ? AND NOT EXISTS ("
+                "SELECT 1 FROM messages WHERE messages.session_id = sessions.id AND role = ?)",
+                (keep, ROLE_USER)
+            )
+            self.db.commit()
+
+    def append(self, session_id, role, sender, content, timestamp):
+        """追加一条消息，返回消息ID"""
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO messages (session_id, role, sender, content, timestamp, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, role, sender, content, timestamp, now)
+            )
+            self.db.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+            self.db.commit()
+            return cursor.lastrowid
+
+    def append_many(self, session_id, entries):
+        """批量追加 (role, sender, content, timestamp) 消息"""
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                "INSERT INTO messages (session_id, role, sender, content, timestamp, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(session_id, role, sender, content, timestamp, now) for role, sender, content, timestamp in entries]
+            )
+            self.db.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+            self.db.commit()
+
+    def count(self, session_id):
+        """会话中的消息数"""
+        with self.lock:
+            row = self.db.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0]
+
+    def recent(self, session_id, limit, roles=(ROLE_USER, ROLE_ASSISTANT)):
+        """按时间顺序返回会话中最近的limit条消息，默认只包含用户和助手消息"""
+        placeholders = ", ".join("?" * len(roles))
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT * FROM messages WHERE session_id = ? AND role IN ({placeholders}) "
+                "ORDER BY id DESC LIMIT ?",
+                (session_id, *roles, limit)
+            ).fetchall()
+        return [self._entry(row) for row in reversed(rows)]
+
+    def before(self, session_id, before_id=None, limit=50):
+        """按时间顺序返回会话中ID小于before_id的最近limit条消息，before_id为None时返回最新的limit条
+        
+        按索引上的ID分页，耗时与会话长度无关
+        """
+        with self.lock:
+            if before_id is None:
+                rows = self.db.execute(
+                    "SELECT * FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                    (session_id, limit)
+                ).fetchall()
+            else:
+                rows = self.db.execute(
+                    "SELECT * FROM messages WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                    (session_id, before_id, limit)
+                ).fetchall()
+        return [self._entry(row) for row in reversed(rows)]
+
+    def iter_messages(self, session_id, batch=EXPORT_BATCH):
+        """按时间顺序分批读取会话的全部消息"""
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT * FROM messages WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (session_id, last_id, batch)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._entry(row)
+            last_id = rows[-1]["id"]
+
+    def export_text(self, session_id, path):
+        """将会话导出为文本文件，返回导出的消息数"""
+        exported = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for entry in self.iter_messages(session_id):
+                f.write(f"[{entry['timestamp']}] {entry['sender']}:\n{entry['message']}\n\n")
+                exported += 1
+        return exported
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """获取共享的对话记录存储"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChatStore()
+        return _store
+
+
+def close():
+    """关闭共享存储，在程序退出时调用"""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对话上下文构建
+按token预算（可按模型配置）从最新的对话开始向前选取历史消息，预算不足时截断较早的消息，
+使提示长度（以及CPU上的prefill时间）有上限。每条消息的token估算按消息ID缓存
+"""
+
+import os
+import re
+import fnmatch
+import threading
+from collections import OrderedDict
+
+# 配置
+DEFAULT_BUDGET = int(os.environ.get("MINIAI_CONTEXT_BUDGET", "2048"))  # 每次请求的提示token预算
+MAX_HISTORY_MESSAGES = 50  # 从对话记录中读取的候选消息数
+MIN_TRUNCATED_TOKENS = 64  # 剩余预算少于此值时不再截断放入更早的消息
+SEARCH_RESULTS_SHARE = 0.6  # 联网增强时搜索结果最多占用的预算比例
+TOKEN_CACHE_SIZE = 2048
+
+TRUNCATED_MARK = "…（后续内容已截断）"
+
+# 中日韩字符大致每个字符一个token，其余文本大致每4个字符一个token
+_CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+_token_cache = OrderedDict()  # 消息ID -> token数
+_token_cache_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """估算文本的token数"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 1
+
+
+def entry_tokens(entry):
+    """估算一条历史消息的token数，有消息ID时缓存结果"""
+    message_id = entry.get('id')
+    if message_id is None:
+        return estimate_tokens(entry.get('message', ''))
+
+    with _token_cache_lock:
+        tokens = _token_cache.get(message_id)
+        if tokens is not None:
+            _token_cache.move_to_end(message_id)
+            return tokens
+
+    tokens = estimate_tokens(entry.get('message', ''))
+    with _token_cache_lock:
+        _token_cache[message_id] = tokens
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return tokens
+
+
+def budget_for(model, budgets=None):
+    """模型对应的token预算：budgets为 {模型名或通配符: token数}，未匹配时使用默认值"""
+    if budgets:
+        if model in budgets:
+            return int(budgets[model])
+        for pattern, budget in budgets.items():
+            if fnmatch.fnmatch(model, pattern):
+                return int(budget)
+    return DEFAULT_BUDGET
+
+
+def truncate_text(text, max_tokens):
+    """将文本截断到大约max_tokens个token，保留开头部分"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = max(0, int(len(text) * max_tokens / tokens) - len(TRUNCATED_MARK))
+    return text[:keep] + TRUNCATED_MARK
+
+
+def select_history(entries, budget):
+    """从最新的消息开始向前选取不超过budget个token的历史，返回 (按时间顺序的消息, 使用的token数)
+
+    放不下的最早一条消息在剩余预算足够时截断后放入，更早的消息丢弃；
+    开头只剩助手回答时一并丢弃，保证对话以用户问题开始。
+    """
+    selected = []
+    used = 0
+    for entry in reversed(entries):
+        tokens = entry_tokens(entry)
+        if used + tokens <= budget:
+            selected.append(entry)
+            used += tokens
+            continue
+
+        remaining = budget - used
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            message = truncate_text(entry.get('message', ''), remaining)
+            selected.append(dict(entry, id=None, message=message))
+            used += estimate_tokens(message)
+        break
+
+    selected.reverse()
+    while selected and selected[0].get('role') == 'assistant':
+        used -= entry_tokens(selected.pop(0))
+    return selected, used
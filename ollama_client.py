@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ollama API 客户端
+所有对Ollama服务的HTTP调用共享同一个长连接池，避免每次请求重新建立TCP连接
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 配置
+CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "8"))
+MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.environ.get("OLLAMA_RETRY_BACKOFF", "0.3"))
+
+
+class OllamaClient:
+    """持有keep-alive连接池的Ollama客户端，可在多个QThread之间共享"""
+
+    def __init__(self, host, port, connect_timeout=CONNECT_TIMEOUT, pool_size=POOL_SIZE,
+                 max_retries=MAX_RETRIES, backoff_factor=RETRY_BACKOFF):
+        self.base_url = f"http://{host}:{port}"
+        self.connect_timeout = connect_timeout
+
+        # 连接失败（请求尚未发出）对所有方法都可以安全重试；
+        # 服务端临时不可用的状态码只对幂等的GET重试，生成请求不会被重复执行
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        # 会话创建后不再修改，连接池本身是线程安全的
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        """拼接API地址"""
+        return f"{self.base_url}{path}"
+
+    def get(self, path, timeout=5, **kwargs):
+        """发送GET请求，timeout为读取超时"""
+        return self.session.get(self.url(path), timeout=(self.connect_timeout, timeout), **kwargs)
+
+    def post(self, path, payload, timeout=60, stream=False, **kwargs):
+        """发送POST请求；流式模式下timeout为两次数据块之间的最大间隔"""
+        return self.session.post(
+            self.url(path), json=payload, timeout=(self.connect_timeout, timeout),
+            stream=stream, **kwargs
+        )
+
+    def is_available(self, timeout=3):
+        """检查Ollama服务是否可访问"""
+        try:
+            return self.get("/api/tags", timeout=timeout).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def ping(self, timeout=2):
+        """轻量健康探测，/api/version不需要扫描模型目录"""
+        try:
+            return self.get("/api/version", timeout=timeout).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def list_models(self, timeout=10):
+        """获取本地模型名称列表"""
+        response = self.get("/api/tags", timeout=timeout)
+        response.raise_for_status()
+        return [model['name'] for model in response.json().get('models', [])]
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(host, port):
+    """获取指定地址共享的客户端实例（线程安全）"""
+    key = (str(host), str(port))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OllamaClient(host, port)
+            _clients[key] = client
+        return client
+
+
+def close_all():
+    """关闭所有客户端的连接池，在程序退出时调用"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
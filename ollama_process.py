@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ollama进程跟踪
+记住MiniAI启动的ollama serve进程，之后只需廉价地校验该PID；没有记录时按进程名查找，
+有多个Ollama进程时优先选择监听服务端口的那个（只查询候选进程的连接，不枚举系统全部连接）
+"""
+
+import sys
+import time
+import threading
+import subprocess
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROCESS_NAME = "ollama"
+
+
+def _is_ollama(proc):
+    """进程名是否为Ollama"""
+    try:
+        return PROCESS_NAME in proc.name().lower()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+
+class OllamaProcessTracker:
+    """跟踪Ollama服务进程，可在多个线程中使用"""
+
+    def __init__(self, port):
+        self.port = int(port)
+        self.process = None  # 最近一次找到的psutil.Process
+        self.lock = threading.Lock()
+
+    def set_port(self, port):
+        """修改服务端口，丢弃按旧端口找到的进程"""
+        with self.lock:
+            self.port = int(port)
+            self.process = None
+
+    def remember(self, pid):
+        """记录刚启动的进程"""
+        if psutil is None:
+            return
+        try:
+            process = psutil.Process(pid)
+        except psutil.Error:
+            return
+        with self.lock:
+            self.process = process
+
+    def find(self):
+        """返回Ollama服务进程，依次尝试：已记录的PID、监听服务端口的Ollama进程、任一Ollama进程"""
+        with self.lock:
+            process = self.process
+            port = self.port
+        # psutil.Process.is_running()会比较创建时间，PID被复用时返回False
+        if process is not None and process.is_running() and _is_ollama(process):
+            return process
+
+        candidates = self._find_by_scan()
+        process = self._find_by_port(port, candidates) or (candidates[0] if candidates else None)
+        with self.lock:
+            self.process = process
+        return process
+
+    def is_running(self):
+        """检查Ollama进程是否在运行"""
+        if psutil is None:
+            return self._tasklist_running()
+        return self.find() is not None
+
+    def terminate(self, timeout=5, cancel=None):
+        """终止Ollama服务进程及其子进程（模型runner）
+        
+        最多等待timeout秒让进程退出；cancel为threading.Event时，事件被设置后不再等待
+        """
+        if psutil is None:
+            self._taskkill()
+            return
+
+        process = self.find()
+        if process is None:
+            return
+        try:
+            procs = process.children(recursive=True) + [process]
+        except psutil.NoSuchProcess:
+            procs = [process]
+        for proc in procs:
+            try:
+                proc.terminate()
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.AccessDenied as e:
+                print(f"无法终止Ollama进程 {proc.pid}: {e}")
+        deadline = time.monotonic() + timeout
+        while procs and time.monotonic() < deadline:
+            # 分段等待，以便及时响应cancel
+            _, procs = psutil.wait_procs(procs, timeout=min(0.25, max(0.0, deadline - time.monotonic())))
+            if cancel is not None and cancel.is_set():
+                break
+        with self.lock:
+            self.process = None
+
+    @staticmethod
+    def _find_by_port(port, candidates):
+        """在候选进程中查找监听服务端口的进程
+        
+        psutil.net_connections()需要枚举整个系统的连接（Linux上很慢，macOS上需要管理员权限），
+        这里只查询按名称匹配到的少数进程；无权查询的进程直接跳过
+        """
+        if len(candidates) < 2:
+            return candidates[0] if candidates else None
+        for proc in candidates:
+            try:
+                connections = proc.net_connections(kind="tcp") if hasattr(proc, "net_connections") \
+                    else proc.connections(kind="tcp")  # psutil < 6.0
+            except (psutil.Error, OSError):
+                continue
+            for conn in connections:
+                if conn.status == psutil.CONN_LISTEN and conn.laddr and conn.laddr.port == port:
+                    return proc
+        return None
+
+    @staticmethod
+    def _find_by_scan():
+        """遍历进程表，返回所有Ollama进程"""
+        candidates = []
+        for proc in psutil.process_iter(['name']):
+            name = proc.info['name']
+            if name and PROCESS_NAME in name.lower():
+                candidates.append(proc)
+        return candidates
+
+    @staticmethod
+    def _tasklist_running():
+        """没有psutil时使用tasklist命令检查"""
+        try:
+            result = subprocess.run(
+                ["tasklist", "/FI", "IMAGENAME eq ollama.exe"],
+                capture_output=True, text=True,
+                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+            )
+            return "ollama.exe" in result.stdout.lower()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _taskkill():
+        """没有psutil时使用taskkill命令"""
+        if sys.platform == "win32":
+            subprocess.run(
+                ["taskkill", "/F", "/IM", "ollama.exe"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                creationflags=subprocess.CREATE_NO_WINDOW
+            )
+
+
+def benchmark(port=11434, rounds=20):
+    """比较枚举系统全部连接、按名称扫描进程与跟踪器查找的耗时"""
+    tracker = OllamaProcessTracker(port)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        try:
+            psutil.net_connections(kind="tcp")
+        except (psutil.AccessDenied, OSError):
+            pass
+    connections = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        tracker._find_by_port(port, tracker._find_by_scan())
+    scan = (time.perf_counter() - start) / rounds
+
+    tracker.find()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        tracker.find()
+    cached = (time.perf_counter() - start) / rounds
+
+    print(f"进程数: {len(psutil.pids())}，找到: {tracker.process}")
+    print(f"枚举全部连接: {connections * 1000:.2f} ms")
+    print(f"按名称扫描: {scan * 1000:.2f} ms")
+    print(f"已记录PID: {cached * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 11434)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+搜索请求速率限制
+每个SearXNG实例一个令牌桶，令牌不足时按先来先到排队等待（队列长度和等待时间有上限），
+而不是直接拒绝；另有按月的请求配额，计数保存在磁盘上，服务重启后继续累计。
+令牌按预约时间分配（不需要锁住事件循环），可在多个协程、线程和事件循环中使用
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 配置
+RATE_PER_SECOND = float(os.environ.get("SEARXNG_RATE_PER_SECOND", "1"))  # 每个实例每秒请求数
+RATE_BURST = int(os.environ.get("SEARXNG_RATE_BURST", "1"))  # 每个实例允许的突发请求数
+MONTHLY_QUOTA = int(os.environ.get("SEARXNG_MONTHLY_QUOTA", "15000"))  # 所有实例合计的每月请求数，0表示不限
+MAX_QUEUE = int(os.environ.get("SEARXNG_RATE_MAX_QUEUE", "32"))  # 每个实例最多排队等待的请求数
+MAX_WAIT = float(os.environ.get("SEARXNG_RATE_MAX_WAIT", "10"))  # 默认最多等待的秒数
+QUOTA_FILE = os.environ.get("SEARXNG_QUOTA_FILE", "search_quota.json")  # 为空时不保存配额计数
+QUOTA_SAVE_INTERVAL = 30  # 配额计数写入磁盘的最短间隔（秒）
+
+
+class RateLimitExceeded(RuntimeError):
+    """排队已满、等待会超过期限或月度配额已用完"""
+
+
+class TokenBucket:
+    """一个实例的令牌桶：按预约顺序分配令牌，返回需要等待的时间"""
+
+    def __init__(self, rate, burst):
+        self.interval = 1.0 / rate
+        self.burst = max(1, burst)
+        self.next_free = 0.0  # 下一个令牌的理论发放时间（GCRA）
+        self.waiting = 0  # 正在排队等待的请求数
+        self.stats = {"acquired": 0, "rejected": 0, "waited": 0, "wait_total": 0.0, "wait_max": 0.0, "queue_max": 0}
+
+    def reserve(self, now, max_wait, max_queue):
+        """预约一个令牌，返回需要等待的秒数；超过max_wait或队列已满时返回None（不占用令牌）"""
+        start = max(self.next_free, now)
+        wait = max(0.0, start - now - (self.burst - 1) * self.interval)
+        if wait > max_wait or (wait > 0 and self.waiting >= max_queue):
+            self.stats["rejected"] += 1
+            return None
+        self.next_free = start + self.interval
+        self.stats["acquired"] += 1
+        if wait > 0:
+            self.waiting += 1
+            self.stats["waited"] += 1
+            self.stats["wait_total"] += wait
+            self.stats["wait_max"] = max(self.stats["wait_max"], wait)
+            self.stats["queue_max"] = max(self.stats["queue_max"], self.waiting)
+        return wait
+
+    def release(self, reserved_at):
+        """等待中被取消时归还令牌：只有这是最后一个预约时才能收回"""
+        if abs(self.next_free - (reserved_at + self.interval)) < 1e-9:
+            self.next_free = reserved_at
+
+
+class RateLimiter:
+    """按实例分桶的速率限制和月度配额，所有方法都可以在任意线程调用"""
+
+    def __init__(self, rate=RATE_PER_SECOND, burst=RATE_BURST, monthly_quota=MONTHLY_QUOTA,
+                 max_queue=MAX_QUEUE, max_wait=MAX_WAIT, quota_file=QUOTA_FILE):
+        self.rate = rate
+        self.burst = burst
+        self.monthly_quota = monthly_quota
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.quota_file = quota_file
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # 串行化写文件（后台保存与退出时的保存可能同时进行）
+        self.buckets = {}  # 实例地址 -> TokenBucket
+        self.month = time.strftime("%Y-%m")
+        self.month_counts = {}  # 实例地址 -> 本月请求数
+        self.saved = 0.0
+        self.dirty = False
+        self._load()
+
+    @property
+    def month_total(self):
+        return sum(self.month_counts.values())
+
+    async def acquire(self, key="", max_wait=None):
+        """为实例key取得一个请求令牌，必要时排队等待；不能在max_wait秒内取得时抛出RateLimitExceeded"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        now = time.monotonic()
+        with self.lock:
+            self._roll_month()
+            if self.monthly_quota and self.month_total >= self.monthly_quota:
+                raise RateLimitExceeded(f"Rate limit exceeded: monthly quota of {self.monthly_quota} requests used up")
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+            wait = bucket.reserve(now, max_wait, self.max_queue)
+            if wait is None:
+                raise RateLimitExceeded(
+                    f"Rate limit exceeded: {bucket.waiting} requests queued for {key or 'search'}"
+                )
+            reserved_at = bucket.next_free - bucket.interval
+            # 预约时即计入配额，排队中的请求不会让本月总数超出配额；等待中被取消时退还
+            month = self.month
+            self.month_counts[key] = self.month_counts.get(key, 0) + 1
+            self.dirty = True
+
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                with self.lock:
+                    bucket.waiting -= 1
+                    bucket.release(reserved_at)
+                    if self.month == month and self.month_counts.get(key):
+                        self.month_counts[key] -= 1
+                raise
+            with self.lock:
+                bucket.waiting -= 1
+
+        with self.lock:
+            save = self.dirty and time.monotonic() - self.saved >= QUOTA_SAVE_INTERVAL
+            if save:
+                self.saved = time.monotonic()
+        if save:
+            # 在线程池中写文件，不阻塞事件循环
+            asyncio.get_running_loop().run_in_executor(None, self.save)
+
+    def metrics(self):
+        """各实例的排队深度、等待时间和拒绝次数，以及本月配额使用情况"""
+        with self.lock:
+            self._roll_month()
+            buckets = {}
+            for key, bucket in self.buckets.items():
+                stats = bucket.stats
+                buckets[key or "default"] = {
+                    "queue_depth": bucket.waiting,
+                    "queue_max": stats["queue_max"],
+                    "acquired": stats["acquired"],
+                    "rejected": stats["rejected"],
+                    "waited": stats["waited"],
+                    "wait_avg": round(stats["wait_total"] / stats["waited"], 3) if stats["waited"] else 0.0,
+                    "wait_max": round(stats["wait_max"], 3),
+                }
+            return {
+                "month": self.month,
+                "month_used": self.month_total,
+                "monthly_quota": self.monthly_quota,
+                "instances": buckets,
+            }
+
+    def save(self):
+        """将本月的请求计数写入磁盘（会阻塞，在事件循环中应放到线程池执行）"""
+        with self.save_lock:
+            with self.lock:
+                if not self.quota_file or not self.dirty:
+                    return
+                data = {"month": self.month, "counts": dict(self.month_counts)}
+                self.dirty = False
+                self.saved = time.monotonic()
+            temp_path = self.quota_file + ".tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(temp_path, self.quota_file)
+            except OSError as e:
+                with self.lock:
+                    self.dirty = True
+                logger.warning(f"保存搜索配额计数失败: {e}")
+
+    def _load(self):
+        if not self.quota_file or not os.path.exists(self.quota_file):
+            return
+        try:
+            with open(self.quota_file, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取搜索配额计数失败: {e}")
+            return
+        if data.get("month") == self.month:
+            self.month_counts = {key: int(count) for key, count in data.get("counts", {}).items()}
+
+    def _roll_month(self):
+        """月份变化时清零计数（调用方需持有锁）"""
+        month = time.strftime("%Y-%m")
+        if month != self.month:
+            self.month = month
+            self.month_counts = {}
+            self.dirty = True
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    """获取共享的速率限制器"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+def close():
+    """保存配额计数，在服务退出时调用"""
+    with _limiter_lock:
+        limiter = _limiter
+    if limiter is not None:
+        limiter.save()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM回复后处理
+过滤规则在导入时预编译，每条规则带有触发子串，文本中不包含触发子串时直接跳过该规则；
+<think>块用字符串查找去除，避免在长推理输出上运行正则。
+ThinkStripper在流式输出时增量去除<think>块，不需要每次重新处理已接收的全部文本
+"""
+
+import re
+import time
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# 过滤规则：(正则, 触发子串)。触发子串均为小写，全部出现在（小写后的）文本中时才运行该规则，
+# 为None时总是运行。规则按顺序依次应用，与原实现的结果一致
+FILTER_RULES = [
+    # 思考过程标记
+    (r'<think>.*?</think>', (THINK_OPEN, THINK_CLOSE)),
+    (r'\*thinks?\*.*?\*thinks?\*', ('*think',)),
+    (r'\[thinking\].*?\[/thinking\]', ('[thinking]', '[/thinking]')),
+    (r'思考：.*?(?=\n|$)', ('思考：',)),
+    (r'让我想想.*?(?=\n|$)', ('让我想想',)),
+
+    # 图片相关
+    (r'!\[.*?\]\(.*?\)', ('![', '](')),  # Markdown图片
+    (r'<img.*?>', ('<img',)),            # HTML图片标签
+    (r'图片：.*?(?=\n|$)', ('图片：',)),
+    (r'image:.*?(?=\n|$)', ('image:',)),
+
+    # 多余的标记
+    (r'<.*?>', ('<', '>')),  # 其他HTML标签
+    (r'\*\*思考\*\*.*?(?=\n|$)', ('**思考**',)),
+    (r'```thinking.*?```', ('```thinking',)),
+
+    # 多余的元信息
+    (r'作为.*?AI.*?，', ('作为', 'ai', '，')),
+    (r'根据我的.*?训练.*?，', ('根据我的', '训练', '，')),
+    (r'我是.*?语言模型.*?，', ('我是', '语言模型', '，')),
+
+    # 重复的标点符号
+    (r'[。！？]{3,}', None),
+    (r'[.!?]{3,}', None),
+
+    # 多余的换行
+    (r'\n{3,}', ('\n\n\n',)),
+]
+
+_THINK_OPEN_PATTERN = re.compile(re.escape(THINK_OPEN), re.IGNORECASE)
+_THINK_CLOSE_PATTERN = re.compile(re.escape(THINK_CLOSE), re.IGNORECASE)
+
+
+class ResponseFilter:
+    """预编译的回复过滤流水线"""
+
+    def __init__(self, rules=FILTER_RULES):
+        self.rules = [(re.compile(pattern, re.DOTALL | re.IGNORECASE), triggers) for pattern, triggers in rules]
+        self.spaces = re.compile(r'[ \t]+')
+        self.blank_lines = re.compile(r'\n\s*\n\s*\n+')
+
+    def apply(self, message):
+        """过滤回复，过滤后为空时返回原消息"""
+        if not message:
+            return message
+
+        # 第一条规则（<think>块）不需要正则，先去除以缩短后续规则处理的文本
+        text = strip_think(message)
+        lowered = _fold(text)
+        for pattern, triggers in self.rules[1:]:
+            if triggers is not None and not all(trigger in lowered for trigger in triggers):
+                continue
+            result = pattern.sub('', text)
+            if result != text:
+                text = result
+                lowered = _fold(text)
+
+        # 清理多余的空白字符
+        if '  ' in text or '\t' in text:
+            text = self.spaces.sub(' ', text)  # 多个空格/制表符变成一个空格
+        if text.count('\n') >= 3:
+            text = self.blank_lines.sub('\n\n', text)  # 多个换行变成两个
+        text = text.strip()  # 去除首尾空白
+
+        return text if text else message
+
+
+def strip_think(text):
+    """去除所有闭合的<think>...</think>块（不区分大小写），未闭合的开始标记保留"""
+    parts = []
+    position = 0
+    while True:
+        opening = _THINK_OPEN_PATTERN.search(text, position)
+        if opening is None:
+            break
+        closing = _THINK_CLOSE_PATTERN.search(text, opening.end())
+        if closing is None:
+            break
+        parts.append(text[position:opening.start()])
+        position = closing.end()
+    if not parts:
+        return text
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+class ThinkStripper:
+    """流式去除<think>块：每次传入新收到的文本，返回其中可见的部分"""
+
+    def __init__(self):
+        self.inside = False  # 是否处于<think>块中
+        self.pending = ""  # 末尾可能是被截断的标签，等待下一段文本
+
+    def feed(self, chunk):
+        """处理新收到的文本，返回可以显示的部分"""
+        text = self.pending + chunk
+        self.pending = ""
+        visible = []
+        while text:
+            tag, pattern = (THINK_CLOSE, _THINK_CLOSE_PATTERN) if self.inside else (THINK_OPEN, _THINK_OPEN_PATTERN)
+            match = pattern.search(text)
+            if match is None:
+                keep = _partial_tag_length(text, tag)
+                if not self.inside:
+                    visible.append(text[:len(text) - keep])
+                self.pending = text[len(text) - keep:]
+                break
+            if not self.inside:
+                visible.append(text[:match.start()])
+            text = text[match.end():]
+            self.inside = not self.inside
+        return ''.join(visible)
+
+    def finish(self):
+        """输出结束时返回暂存的文本（仍在<think>块中时丢弃）"""
+        pending, self.pending = self.pending, ""
+        return "" if self.inside else pending
+
+
+def _partial_tag_length(text, tag):
+    """文本末尾与标签开头重合的最大长度（小于标签长度）"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if _fold(text[-length:]) == tag[:length]:
+            return length
+    return 0
+
+
+def _fold(text):
+    """转换为小写，用于检查触发子串"""
+    lowered = text.lower()
+    # 忽略大小写匹配时与i、s等价的字符：ı、ſ的小写不变，İ的小写带组合附加点
+    if 'ı' in lowered or 'ſ' in lowered or '\u0307' in lowered:
+        lowered = lowered.replace('ı', 'i').replace('ſ', 's').replace('\u0307', '')
+    return lowered
+
+
+_default_filter = ResponseFilter()
+
+
+def filter_response(message):
+    """使用默认规则过滤LLM回复"""
+    return _default_filter.apply(message)
+
+
+def _legacy_filter_llm_response(message):
+    """原filter_llm_response的实现，用于基准测试对比"""
+    if not message:
+        return message
+    filtered_message = message
+    for pattern, _ in FILTER_RULES:
+        filtered_message = re.sub(pattern, '', filtered_message, flags=re.DOTALL | re.IGNORECASE)
+    filtered_message = re.sub(r'[ \t]+', ' ', filtered_message)
+    filtered_message = re.sub(r'\n\s*\n\s*\n+', '\n\n', filtered_message)
+    filtered_message = re.sub(r'^\s+|\s+$', '', filtered_message)
+    return filtered_message if filtered_message else message
+
+
+def benchmark(rounds=50):
+    """在deepseek-r1风格的长推理输出上对比原实现与预编译流水线，以及流式去除<think>块"""
+    reasoning = (
+        "嗯，用户问的是量子计算的基本原理。首先需要解释量子比特和叠加态，然后是纠缠和干涉。"
+        "Wait, maybe I should start with classical bits first, then compare them with qubits. "
+        "另外要注意不要写得太长，用户可能只是想要一个概览。\n"
+    )
+    answer = (
+        "量子计算利用量子比特的叠加和纠缠进行计算。与经典比特不同，量子比特可以同时处于0和1的叠加态。\n\n"
+        "常见的算法包括 Shor 算法和 Grover 算法，详见 https://example.com/quantum 。\n"
+    )
+
+    print(f"回复过滤基准测试（每项 {rounds} 轮）")
+    for size in (4096, 32768, 131072):
+        think = (reasoning * (size // len(reasoning) + 1))[:size]
+        for label, sample in (("纯回答", answer * (size // len(answer))),
+                              ("推理+回答", f"<think>\n{think}\n</think>\n\n{answer * 4}")):
+            assert _legacy_filter_llm_response(sample) == filter_response(sample), (label, size)
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                _legacy_filter_llm_response(sample)
+            legacy_time = (time.perf_counter() - start) / rounds * 1000
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                filter_response(sample)
+            new_time = (time.perf_counter() - start) / rounds * 1000
+
+            print(f"  {len(sample):>7} 字符 {label:<6} 原实现 {legacy_time:.3f} ms  "
+                  f"流水线 {new_time:.3f} ms  加速 {legacy_time / new_time:.1f}x")
+
+        # 流式：原实现每50ms对已接收的全部文本重新过滤，这里按每次刷新约40个token估算
+        sample = f"<think>\n{think}\n</think>\n\n{answer * 4}"
+        chunks = [sample[i:i + 3] for i in range(0, len(sample), 3)]
+        flush_every = 40
+
+        start = time.perf_counter()
+        received = ""
+        for i, chunk in enumerate(chunks):
+            received += chunk
+            if i % flush_every == 0:
+                _legacy_filter_llm_response(received)
+        legacy_time = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        stripper = ThinkStripper()
+        visible = "".join(stripper.feed(chunk) for chunk in chunks) + stripper.finish()
+        new_time = (time.perf_counter() - start) * 1000
+        assert visible.strip() == strip_think(sample).strip()
+
+        print(f"  {len(sample):>7} 字符 流式草稿  原实现 {legacy_time:.1f} ms  "
+              f"ThinkStripper {new_time:.1f} ms  加速 {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+答案审查结果缓存
+以 (模型, 规范化后的问题, 回答摘要) 为键保存LLM审查给出的可信度和审查文本，
+相同的问答再次出现时跳过审查请求；内存中按LRU淘汰，可选持久化到SQLite
+"""
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 配置
+CACHE_SIZE = int(os.environ.get("REVIEW_CACHE_SIZE", "256"))
+CACHE_FILE = os.environ.get("REVIEW_CACHE_FILE", "review_cache.db")  # 设为空字符串则只使用内存缓存
+CACHE_MAX_ROWS = int(os.environ.get("REVIEW_CACHE_MAX_ROWS", "5000"))
+
+_TRAILING_PUNCTUATION = "?？!！。.,，~～ "
+
+
+def normalize_question(question):
+    """规范化问题：小写、合并空白、去掉结尾标点"""
+    question = re.sub(r'\s+', ' ', question.strip().lower())
+    return question.rstrip(_TRAILING_PUNCTUATION)
+
+
+def answer_digest(answer):
+    """回答文本的摘要"""
+    return hashlib.sha256(answer.strip().encode('utf-8')).hexdigest()
+
+
+class ReviewCache:
+    """审查结果缓存，可在多个审查线程之间共享"""
+
+    def __init__(self, max_entries=CACHE_SIZE, db_path=CACHE_FILE, max_rows=CACHE_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.entries = OrderedDict()  # 键 -> (可信度, 审查文本)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.db = None
+        if db_path:
+            try:
+                self.db = sqlite3.connect(db_path, check_same_thread=False)
+                self.db.execute("""
+                    CREATE TABLE IF NOT EXISTS review_cache (
+                        model TEXT NOT NULL,
+                        question TEXT NOT NULL,
+                        answer_digest TEXT NOT NULL,
+                        confidence REAL NOT NULL,
+                        review TEXT NOT NULL,
+                        created REAL NOT NULL,
+                        PRIMARY KEY (model, question, answer_digest)
+                    )
+                """)
+                self.db.execute("CREATE INDEX IF NOT EXISTS idx_review_cache_created ON review_cache (created)")
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"审查缓存数据库不可用，仅使用内存缓存: {e}")
+                self.db = None
+
+    @staticmethod
+    def make_key(model, question, answer):
+        """生成缓存键"""
+        return (model, normalize_question(question), answer_digest(answer))
+
+    def get(self, model, question, answer):
+        """查询缓存，命中时返回 (可信度, 审查文本)，否则返回None"""
+        key = self.make_key(model, question, answer)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            if self.db is not None:
+                try:
+                    row = self.db.execute(
+                        "SELECT confidence, review FROM review_cache "
+                        "WHERE model = ? AND question = ? AND answer_digest = ?", key
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    print(f"读取审查缓存失败: {e}")
+                    row = None
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+                    self.hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, model, question, answer, confidence, review):
+        """保存审查结果"""
+        key = self.make_key(model, question, answer)
+        entry = (float(confidence), review)
+        with self.lock:
+            self._remember(key, entry)
+
+            if self.db is not None:
+                try:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO review_cache "
+                        "(model, question, answer_digest, confidence, review, created) VALUES (?, ?, ?, ?, ?, ?)",
+                        key + entry + (time.time(),)
+                    )
+                    # 只保留最新的 max_rows 条记录
+                    self.db.execute(
+                        "DELETE FROM review_cache WHERE created < ("
+                        "SELECT created FROM review_cache ORDER BY created DESC LIMIT 1 OFFSET ?)",
+                        (self.max_rows,)
+                    )
+                    self.db.commit()
+                except sqlite3.Error as e:
+                    print(f"写入审查缓存失败: {e}")
+
+    def _remember(self, key, entry):
+        """写入内存缓存并按LRU淘汰（调用方需持有锁）"""
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """获取共享的审查缓存实例"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReviewCache()
+        return _cache
+
+
+def close():
+    """关闭共享缓存，在程序退出时调用"""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+答案审查使用的关键词词库
+所有分类的短语合并编译为一个匹配器，对文本扫描一遍即可得到各分类的全部命中
+"""
+
+import os
+import re
+import json
+import threading
+from pathlib import Path
+
+# 额外词库文件，格式为 {"分类": ["短语", ...]}，其中的短语会追加到内置词库
+LEXICON_FILE = Path(os.environ.get("MINIAI_LEXICON_FILE", "review_lexicon.json"))
+
+# 内置词库（短语均为小写，匹配前文本会先转为小写）
+DEFAULT_LEXICON = {
+    # 常见问候语
+    "greeting": [
+        '你好', 'hello', 'hi', '您好', '早上好', '下午好', '晚上好',
+        '早安', '晚安', 'good morning', 'good afternoon', 'good evening',
+        'good night', '嗨', 'hey', '哈喽', '哈罗', '喂', '在吗',
+        '在不在', '有人吗', '请问', '打扰了', '不好意思', 'excuse me',
+        'sorry', '谢谢', 'thank you', 'thanks', '再见', 'bye', 'goodbye',
+        '拜拜', '回见', 'see you', '怎么样', 'how are you', '最近怎么样',
+        '近来可好', '还好吗', '一切都好吗', '身体好吗'
+    ],
+
+    # 时间查询的关键词
+    "time": [
+        # 直接时间询问
+        '今天', '明天', '昨天', '现在', '当前',
+        '今日', '明日', '昨日', '本日', '今晚',
+        # 日期询问
+        '日期', '几号', '号数', '多少号',
+        '年月日', '月份', '年份',
+        # 时间询问
+        '时间', '几点', '点钟', '现在时间',
+        '当前时间', '现在几点', '什么时候',
+        # 星期询问
+        '星期', '礼拜', '周几', '星期几',
+        '礼拜几', '今天星期', '今天礼拜',
+        # 时间状态
+        '现在是', '今天是', '当前是',
+        '现在几', '今天几', '当前几'
+    ],
+
+    # 智力问题的关键词
+    "intellectual": [
+        # 知识性问题
+        '什么是', 'what is', '如何', 'how to', 'how do', '为什么', 'why',
+        '怎么样', '怎么办', '原理', '定义', '概念', '解释', '说明',
+        '介绍', '区别', '差异', '比较', '优缺点', '特点', '特征',
+        # 技术性问题
+        '编程', '代码', 'python', 'java', 'javascript', 'html', 'css',
+        '算法', '数据结构', '机器学习', '人工智能', 'ai', 'ml', 'dl',
+        '数据库', 'sql', '网络', '服务器', '系统', '软件', '硬件',
+        # 学术性问题
+        '数学', '物理', '化学', '生物', '历史', '地理', '经济', '政治',
+        '哲学', '心理学', '社会学', '文学', '艺术', '科学', '研究',
+        # 分析性问题
+        '分析', '计算', '求解', '证明', '推导', '解决', '方案', '策略',
+        '方法', '步骤', '流程', '过程', '原因', '结果', '影响', '效果',
+        # 信息查询
+        '最新', '当前', '现在', '目前', '2020', '2021', '2022', '2023', '2024', '2025',
+        '价格', '多少钱', '费用', '成本', '市场', '股票', '汇率', '天气',
+        '新闻', '事件', '发生', '时间', '地点', '人物', '公司', '产品',
+        # 专业领域
+        '医学', '法律', '金融', '投资', '管理', '营销', '设计', '工程',
+        '建筑', '教育', '培训', '考试', '证书', '资格', '职业', '工作'
+    ],
+
+    # 智力问题的句式（原 r'.*xxx.*' 模式，只在第一行内匹配）
+    "intellectual_pattern": [
+        '是什么', '怎么', '如何', '为什么',
+        '什么', '哪', '多少', '几',
+        '能否', '可以', '应该', '需要',
+        '有没有', '是否', '会不会', '能不能',
+        '请问', '想知道', '了解', '学习'
+    ],
+
+    # 非智力问题的关键词（日常对话、情感交流等）
+    "non_intellectual": [
+        # 情感表达
+        '开心', '高兴', '快乐', '伤心', '难过', '生气', '愤怒', '担心', '害怕',
+        '喜欢', '讨厌', '爱', '恨', '想念', '思念', '感谢', '抱歉', '对不起',
+        # 日常闲聊
+        '聊天', '闲聊', '说话', '陪我', '无聊', '有趣', '好玩', '搞笑',
+        '天气真好', '今天心情', '最近怎样', '过得如何', '身体好吗',
+        # 简单互动
+        '再见', '拜拜', '晚安', '早安', '保重', '加油', '努力', '坚持',
+        '祝福', '祝贺', '恭喜', '节日快乐', '生日快乐', '新年快乐'
+    ],
+
+    # 疑问词
+    "question_word": [
+        '什么', '怎么', '如何', '为什么', '哪', '多少', '几',
+        'what', 'how', 'why', 'where', 'when', 'who'
+    ],
+
+    # 主观性问句
+    "subjective": ['你觉得', '你认为', '你喜欢', '你想', '感觉如何', '怎么样'],
+
+    # 回答中的不确定性表达
+    "uncertainty": [
+        # 直接承认不知道
+        '不知道', '不清楚', '不了解', '不确定', '不太清楚', '不太了解',
+        '我不知道', '我不清楚', '我不了解', '我不确定', '我不太清楚',
+        # 无法回答的表达
+        '无法回答', '不能回答', '无法解答', '不能解答', '无法答复', '不能答复',
+        '我无法回答', '我不能回答', '我无法解答', '我不能解答',
+        '对不起，我无法回答', '抱歉，我无法回答', '很抱歉，我无法回答',
+        '对不起，我不能回答', '抱歉，我不能回答', '很抱歉，我不能回答',
+        'cannot answer', 'unable to answer', 'can\'t answer', 'i cannot answer',
+        'i am unable to answer', 'i can\'t answer', 'sorry, i cannot answer',
+        'sorry, i can\'t answer', 'i\'m sorry, i cannot answer',
+        # 拒绝回答的表达
+        '拒绝回答', '不便回答', '不适合回答', '不宜回答', '不方便回答',
+        '我拒绝回答', '我不便回答', '我不适合回答', '我不宜回答',
+        'refuse to answer', 'decline to answer', 'not appropriate to answer',
+        'i refuse to answer', 'i decline to answer', 'not suitable to answer',
+        # 英文表达
+        "i don't know", "i'm not sure", "i'm uncertain", "not sure",
+        "don't know", "unclear", "uncertain", "i have no idea",
+        "no idea", "i'm not certain", "not certain", "i can't say",
+        # 模糊表达
+        '可能', '也许', '大概', '估计', '应该是', '似乎', '好像',
+        '据我所知', '据了解', '听说', '据说', '可能是', '或许',
+        'maybe', 'perhaps', 'possibly', 'probably', 'might be',
+        'could be', 'seems like', 'appears to be', 'i think',
+        # 信息缺乏表达
+        '没有足够信息', '没有足够的信息', '信息不足', '缺乏信息', '无法确定', '难以确定',
+        '无法给出', '无法提供', '没有相关信息', '缺少数据', '信息有限',
+        'insufficient information', 'lack of information', 'no information',
+        'cannot determine', 'unable to determine', 'cannot provide',
+        # 需要更多信息
+        '需要更多信息', '需要进一步', '需要查证', '建议查询', '建议搜索',
+        '请查询', '请搜索', '请核实', '需要核实', '需要确认',
+        'need more information', 'need to check', 'need to verify',
+        'suggest checking', 'recommend checking', 'please verify',
+        # 时效性不确定
+        '可能已过时', '信息可能过时', '可能不是最新', '需要最新信息',
+        '建议查看最新', '可能有变化', '情况可能改变',
+        'might be outdated', 'information may be outdated', 'may have changed',
+        'might have changed', 'need latest information', 'check latest',
+        # 谦逊表达
+        '我的知识有限', '知识有限', '了解有限', '可能有误', '如有错误',
+        '仅供参考', '请以实际为准', '建议核实', '请确认',
+        'my knowledge is limited', 'limited knowledge', 'may be incorrect',
+        'for reference only', 'please verify', 'please confirm',
+        # 推测性表达
+        '我猜测', '我推测', '我认为可能', '估计可能', '大致上',
+        '粗略地说', '一般来说', '通常情况下', '在我印象中',
+        'i guess', 'i assume', 'i suppose', 'roughly speaking',
+        'generally speaking', 'typically', 'usually', 'in my understanding',
+        # 道德/伦理拒绝表达
+        '我的目的是', '我不会参与', '我不能参与', '不实信息', '不当信息',
+        '有害信息', '违法信息', '不合适的内容', '不适当的内容',
+        'my purpose is', 'i will not participate', 'i cannot participate',
+        'inappropriate content', 'harmful content', 'illegal content',
+        'misinformation', 'false information', 'not appropriate',
+        # 技术限制表达
+        '无法访问', '不能访问', '无法连接', '不能连接', '无法获取', '不能获取',
+        '无法追踪', '不能追踪', '无法检测', '不能检测', '无法查看', '不能查看',
+        '无法读取', '不能读取', '无法浏览', '不能浏览', '无法打开', '不能打开',
+        '我无法访问', '我不能访问', '我无法连接', '我不能连接',
+        '我无法追踪', '我不能追踪', '我无法检测', '我不能检测',
+        '我是一个文本模型', '我是文本模型', '作为文本模型', '作为ai模型',
+        '我是ai助手', '作为ai助手', '我没有能力', '我不具备能力',
+        'cannot access', 'unable to access', 'can\'t access', 'cannot connect',
+        'unable to connect', 'can\'t connect', 'cannot track', 'unable to track',
+        'can\'t track', 'cannot browse', 'unable to browse', 'can\'t browse',
+        'i cannot access', 'i am unable to access', 'i can\'t access',
+        'i cannot connect', 'i am unable to connect', 'i can\'t connect',
+        'i am a text model', 'i am an ai model', 'as an ai model',
+        'as a text model', 'i don\'t have the ability', 'i lack the ability',
+        # 图片/视觉相关技术限制
+        '无法提供图片', '不能提供图片', '无法生成图片', '不能生成图片',
+        '无法显示图片', '不能显示图片', '无法创建图片', '不能创建图片',
+        '无法处理图片', '不能处理图片', '没有图片功能', '无图片生成功能',
+        '无法提供视觉', '不能提供视觉', '无法处理视觉', '不能处理视觉',
+        '目前我无法提供图片', '目前无法提供图片', '我无法生成图片',
+        '我不能显示图片', '作为文本ai无法', '作为语言模型无法',
+        # 多媒体限制
+        '无法播放', '不能播放', '无法显示视频', '不能显示视频',
+        '无法处理音频', '不能处理音频', '无法生成音频', '不能生成音频',
+        # 实时信息限制
+        '无法获取实时', '不能获取实时', '无法访问实时', '不能访问实时',
+        '无法联网', '不能联网', '无法上网', '不能上网'
+    ],
+
+    # 不视为不确定的常见表达
+    "uncertainty_exclude": [
+        '通常情况下', '一般来说', '通常', '一般而言', 'generally', 'usually', 'typically'
+    ],
+
+    # 计数用的不确定词汇
+    "maybe_word": ['可能', '也许', '大概', '估计', 'maybe', 'perhaps', 'possibly', 'probably'],
+
+    # 不确定的结尾（出现在最后100个字符内）
+    "uncertain_ending": [
+        '不太确定', '不太清楚', '可能有误', '仅供参考', '请核实',
+        '建议查证', '需要确认', '可能不准确', '请以实际为准',
+        'not sure', 'not certain', 'may be wrong', 'please verify',
+        'please check', 'for reference only', 'need confirmation'
+    ],
+}
+
+
+class PhraseMatcher:
+    """多分类短语匹配器
+
+    所有短语构建为一棵字典树并编译成单个正则，正则引擎按首字符集合跳过不可能命中的位置；
+    每个命中位置只取最长的短语，其余以该位置开头的短语都是它的前缀，由预先计算的前缀表补全，
+    因此一次扫描即可得到所有（包括相互重叠的）命中
+    """
+
+    def __init__(self, lexicon):
+        self.categories = {}  # 短语 -> 所属分类
+        for category, phrases in lexicon.items():
+            for phrase in phrases:
+                phrase = phrase.lower()
+                if phrase:
+                    owners = self.categories.setdefault(phrase, [])
+                    if category not in owners:
+                        owners.append(category)
+
+        # 每个短语在同一起点上同时命中的所有短语（自身及其前缀）展开为 (分类, 短语) 列表
+        self.expansions = {
+            phrase: [(category, phrase[:i])
+                     for i in range(1, len(phrase) + 1) if phrase[:i] in self.categories
+                     for category in self.categories[phrase[:i]]]
+            for phrase in self.categories
+        }
+
+        self.pattern = re.compile(self.build_trie_pattern()) if self.categories else None
+
+    def build_trie_pattern(self):
+        """将短语表转换为按字典树展开的正则，共同前缀只比较一次"""
+        trie = {}
+        for phrase in self.categories:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[""] = True
+
+        def to_pattern(node):
+            # 各分支首字符互不相同，可选部分为贪婪匹配，因此总是取到最长命中
+            branches = [re.escape(char) + to_pattern(child)
+                        for char, child in sorted(node.items()) if char]
+            if not branches:
+                return ""
+            body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+            return f"(?:{body})?" if "" in node else body
+
+        return to_pattern(trie)
+
+    def scan(self, text):
+        """扫描文本，返回 {分类: [(起始位置, 短语), ...]}，文本会先转为小写"""
+        hits = {}
+        if self.pattern is None:
+            return hits
+        text = text.lower()
+        search = self.pattern.search
+        match = search(text)
+        while match:
+            start = match.start()
+            for category, phrase in self.expansions[match.group()]:
+                hits.setdefault(category, []).append((start, phrase))
+            # 从下一个字符继续，保留与当前命中重叠的短语
+            match = search(text, start + 1)
+        return hits
+
+
+def load_lexicon(path=LEXICON_FILE):
+    """读取内置词库并合并额外词库文件"""
+    lexicon = {category: list(phrases) for category, phrases in DEFAULT_LEXICON.items()}
+    if path and Path(path).exists():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                extra = json.load(f)
+            for category, phrases in extra.items():
+                lexicon.setdefault(category, []).extend(phrases)
+            print(f"[DEBUG] 已加载额外审查词库: {path}")
+        except Exception as e:
+            print(f"加载审查词库失败: {e}")
+    return lexicon
+
+
+_lexicon = None
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def get_matcher(categories=None):
+    """获取共享的匹配器，首次调用时构建；只需要部分分类时使用更小的专用匹配器"""
+    global _lexicon
+    key = frozenset(categories) if categories else None
+    with _matchers_lock:
+        matcher = _matchers.get(key)
+        if matcher is None:
+            if _lexicon is None:
+                _lexicon = load_lexicon()
+            lexicon = _lexicon if key is None else {
+                category: phrases for category, phrases in _lexicon.items() if category in key
+            }
+            matcher = PhraseMatcher(lexicon)
+            _matchers[key] = matcher
+        return matcher
+
+
+def scan(text, categories=None):
+    """使用共享匹配器扫描文本，categories为需要的分类（默认全部）"""
+    return get_matcher(categories).scan(text)
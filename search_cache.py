@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+搜索结果缓存
+按 (查询, 类别, 语言, 安全等级, 时间范围, 输出格式) 缓存格式化后的搜索结果，
+不同类别使用不同的有效期；内存LRU为第一层，可选SQLite为第二层。
+过期但仍在容忍期内的结果会立即返回，同时在后台刷新（stale-while-revalidate）；
+未命中时相同键的并发请求合并为一次上游请求（single-flight）
+"""
+
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import singleflight
+
+logger = logging.getLogger(__name__)
+
+# 配置
+CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "512"))  # 设为0则禁用缓存
+CACHE_FILE = os.environ.get("SEARCH_CACHE_FILE", "")  # 磁盘缓存文件，为空时只使用内存缓存
+STALE_FACTOR = float(os.environ.get("SEARCH_CACHE_STALE_FACTOR", "1"))  # 过期后可继续返回的时间（有效期的倍数）
+NEGATIVE_TTL = float(os.environ.get("SEARCH_CACHE_NEGATIVE_TTL", "60"))  # "未找到结果"的有效期（秒），不会过期后继续返回
+
+# 各类别的有效期（秒）：新闻和社交内容变化快，科学和IT资料相对稳定
+CATEGORY_TTLS = {
+    "news": 5 * 60,
+    "social media": 10 * 60,
+    "general": 60 * 60,
+    "videos": 6 * 60 * 60,
+    "images": 24 * 60 * 60,
+    "music": 24 * 60 * 60,
+    "map": 24 * 60 * 60,
+    "files": 24 * 60 * 60,
+    "it": 24 * 60 * 60,
+    "science": 7 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+FRESH = "fresh"
+STALE = "stale"
+
+# 解析结果为空时返回的提示文本（可能只是实例暂时返回了空页面或被拦截）
+NO_RESULTS_PREFIXES = ("未找到相关结果", "未找到搜索结果")
+
+
+def is_no_results(result):
+    """结果是否为"未找到结果"提示"""
+    return isinstance(result, str) and result.lstrip().startswith(NO_RESULTS_PREFIXES)
+
+
+def make_key(query, category, language, safe_search, time_range, output_format):
+    """生成缓存键"""
+    return (query.strip(), category, language, str(safe_search), time_range or "", output_format)
+
+
+class SearchCache:
+    """两级搜索结果缓存，可在多个线程和事件循环之间共享"""
+
+    def __init__(self, max_entries=CACHE_SIZE, db_path=CACHE_FILE, ttls=None, stale_factor=STALE_FACTOR,
+                 negative_ttl=NEGATIVE_TTL):
+        self.max_entries = max_entries
+        self.ttls = dict(CATEGORY_TTLS if ttls is None else ttls)
+        self.stale_factor = stale_factor
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()  # 键 -> (结果, 写入时间)
+        self.lock = threading.Lock()
+        self.refreshing = set()  # 正在后台刷新的键
+        self.tasks = set()  # 后台刷新任务
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+        self.flights = singleflight.SingleFlight()  # 未命中时合并相同键的并发请求
+
+        self.db = None
+        if db_path:
+            try:
+                self.db = sqlite3.connect(db_path, check_same_thread=False)
+                self.db.execute("""
+                    CREATE TABLE IF NOT EXISTS search_cache (
+                        key TEXT PRIMARY KEY,
+                        result TEXT NOT NULL,
+                        stored REAL NOT NULL
+                    )
+                """)
+                # 清理已超出容忍期的旧记录
+                oldest = time.time() - max(self.ttls.values(), default=DEFAULT_TTL) * (1 + self.stale_factor)
+                self.db.execute("DELETE FROM search_cache WHERE stored < ?", (oldest,))
+                self.db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"搜索缓存数据库不可用，仅使用内存缓存: {e}")
+                self.db = None
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def ttl_for(self, category):
+        """类别对应的有效期"""
+        return self.ttls.get(category, DEFAULT_TTL)
+
+    def lookup(self, key, category):
+        """查询缓存，返回 (结果, FRESH/STALE)，未命中或已超出容忍期时返回 (None, None)"""
+        ttl = self.ttl_for(category)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.db is not None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._remember(key, entry)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None, None
+
+            result, stored = entry
+            age = now - stored
+            if is_no_results(result):
+                # "未找到结果"只短暂缓存，过期后直接重新请求
+                ttl = self.negative_ttl
+                if age > ttl:
+                    self.entries.pop(key, None)
+                    self.stats["misses"] += 1
+                    return None, None
+            if age <= ttl:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return result, FRESH
+            if age <= ttl * (1 + self.stale_factor):
+                self.entries.move_to_end(key)
+                self.stats["stale_hits"] += 1
+                return result, STALE
+
+            # 超出容忍期，视为未命中
+            self.entries.pop(key, None)
+            self.stats["misses"] += 1
+            return None, None
+
+    def store(self, key, result):
+        """写入缓存；"未找到结果"只保存在内存中，按negative_ttl过期"""
+        if is_no_results(result) and self.negative_ttl <= 0:
+            return
+        entry = (result, time.time())
+        with self.lock:
+            self._remember(key, entry)
+            if self.db is not None and not is_no_results(result):
+                try:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO search_cache (key, result, stored) VALUES (?, ?, ?)",
+                        (repr(key), result, entry[1])
+                    )
+                    self.db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"写入搜索缓存失败: {e}")
+
+    async def get_or_fetch(self, key, category, fetch):
+        """返回缓存结果或调用fetch()获取新结果；过期结果先返回再后台刷新。
+        相同键的并发未命中共享一次fetch()"""
+        if not self.enabled:
+            return await self.flights.do(key, fetch)
+
+        result, state = self.lookup(key, category)
+        if state == FRESH:
+            return result
+        if state == STALE:
+            self.schedule_refresh(key, fetch)
+            return result
+
+        async def fetch_and_store():
+            result = await fetch()
+            self.store(key, result)
+            return result
+
+        return await self.flights.do(key, fetch_and_store)
+
+    def schedule_refresh(self, key, fetch):
+        """在当前事件循环中后台刷新过期结果，同一个键同时只刷新一次"""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        task = asyncio.get_running_loop().create_task(self._refresh(key, fetch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _refresh(self, key, fetch):
+        try:
+            result = await fetch()
+            # 刷新得到"未找到结果"时保留原有的结果
+            if not is_no_results(result):
+                self.store(key, result)
+            self.stats["refreshes"] += 1
+        except Exception as e:
+            # 刷新失败时保留旧结果
+            self.stats["refresh_errors"] += 1
+            logger.debug(f"后台刷新搜索结果失败: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    async def wait_for_refreshes(self):
+        """等待当前事件循环中的后台刷新完成，在关闭事件循环前调用"""
+        loop = asyncio.get_running_loop()
+        pending = [task for task in list(self.tasks) if task.get_loop() is loop]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _load(self, key):
+        """从磁盘缓存读取（调用方需持有锁）"""
+        try:
+            row = self.db.execute(
+                "SELECT result, stored FROM search_cache WHERE key = ?", (repr(key),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取搜索缓存失败: {e}")
+            return None
+        return (row[0], row[1]) if row else None
+
+    def _remember(self, key, entry):
+        """写入内存缓存并按LRU淘汰（调用方需持有锁）"""
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """获取进程内共享的搜索缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
+
+
+def close():
+    """关闭共享缓存，在程序退出时调用"""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
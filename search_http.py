@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+搜索请求共享的HTTP客户端
+每个事件循环持有一个长期存在的httpx.AsyncClient，复用连接池和TLS会话，
+simple_search（GUI搜索）和server.py（MCP服务）共同使用
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import weakref
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 配置
+MAX_CONNECTIONS = int(os.environ.get("SEARXNG_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.environ.get("SEARXNG_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.environ.get("SEARXNG_KEEPALIVE_EXPIRY", "60"))
+USE_HTTP2 = os.environ.get("SEARXNG_HTTP2", "0").lower() in ("1", "true", "yes")
+
+# httpx的连接绑定在创建它的事件循环上，因此按事件循环分别保存客户端
+_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def _http2_available():
+    """HTTP/2需要可选依赖h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("未安装h2，SEARXNG_HTTP2被忽略，使用HTTP/1.1")
+        return False
+
+
+def _create_client():
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(limits=limits, http2=USE_HTTP2 and _http2_available())
+
+
+def get_client():
+    """获取当前事件循环共享的客户端，首次使用时创建"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            client = _create_client()
+            _clients[loop] = client
+        return client
+
+
+async def aclose():
+    """关闭当前事件循环的客户端，在关闭事件循环之前调用"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
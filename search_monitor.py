@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+搜索引擎连通性监控
+在后台事件循环中探测SearXNG实例，缓存最近一次的状态；真实搜索的成败也会更新状态。
+不可用时按指数退避重试探测，界面侧读取状态不需要等待网络
+"""
+
+import os
+import time
+import asyncio
+import threading
+
+import async_runner
+import search_http
+import searx_pool
+
+# 配置
+STATUS_TTL = float(os.environ.get("SEARCH_STATUS_TTL", "120"))  # 状态有效期（秒），过期后读取时触发后台探测
+PROBE_TIMEOUT = float(os.environ.get("SEARCH_PROBE_TIMEOUT", "5"))
+MIN_BACKOFF = float(os.environ.get("SEARCH_PROBE_MIN_BACKOFF", "5"))
+MAX_BACKOFF = float(os.environ.get("SEARCH_PROBE_MAX_BACKOFF", "300"))
+
+
+async def probe_searxng():
+    """并发探测各SearXNG实例首页是否可访问，任一实例可访问即为可用。
+    探测直接请求各实例，不经过实例池：首页请求的耗时和成败与搜索请求不同，不计入实例的健康状态"""
+    async def probe(api_url):
+        response = await search_http.get_client().get(api_url + "/", timeout=PROBE_TIMEOUT)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return True
+
+    tasks = [asyncio.ensure_future(probe(url)) for url in searx_pool.get_pool().urls]
+    last_error = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except Exception as e:
+                last_error = e
+    finally:
+        for task in tasks:
+            task.cancel()
+    if last_error is not None:
+        raise last_error
+    return False
+
+
+class ConnectivityMonitor:
+    """搜索引擎连通性状态，所有方法都可以在任意线程调用"""
+
+    def __init__(self, runner, probe=probe_searxng, ttl=STATUS_TTL,
+                 min_backoff=MIN_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.runner = runner  # async_runner.AsyncLoopThread
+        self.probe = probe  # 无参数的协程函数，返回是否可用
+        self.ttl = ttl
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.available = None  # None表示尚未探测过
+        self.updated = 0.0
+        self.failures = 0
+        self.probing = False
+        self.retry_handle = None
+
+    def start(self):
+        """启动首次探测"""
+        self.refresh()
+
+    def is_available(self):
+        """立即返回缓存的状态（True/False/None），状态过期时在后台重新探测"""
+        with self.lock:
+            available = self.available
+            expired = time.time() - self.updated > self.ttl
+        if expired:
+            self.refresh()
+        return available
+
+    def refresh(self):
+        """在后台发起一次探测，已有探测进行中时忽略"""
+        with self.lock:
+            if self.probing:
+                return
+            self.probing = True
+        probe = self._probe()
+        try:
+            self.runner.submit(probe)
+        except RuntimeError:
+            # 事件循环已关闭（程序退出中）
+            probe.close()
+            with self.lock:
+                self.probing = False
+
+    def report(self, available):
+        """根据真实搜索的结果更新状态"""
+        self._record(available, "搜索结果")
+
+    async def _probe(self):
+        try:
+            available = bool(await self.probe())
+        except Exception as e:
+            print(f"[DEBUG] 搜索引擎探测失败: {e}")
+            available = False
+        finally:
+            with self.lock:
+                self.probing = False
+        self._record(available, "后台探测")
+
+    def _record(self, available, source):
+        with self.lock:
+            changed = available != self.available
+            self.available = available
+            self.updated = time.time()
+            self.failures = 0 if available else self.failures + 1
+            delay = min(self.min_backoff * 2 ** (self.failures - 1), self.max_backoff) if not available else None
+        if changed:
+            print(f"[DEBUG] 搜索引擎状态（{source}）: {'可用' if available else '不可用'}")
+        # 在事件循环线程中安排（或取消）下一次重试
+        try:
+            self.runner.loop.call_soon_threadsafe(self._schedule_retry, delay)
+        except RuntimeError:
+            pass  # 事件循环已关闭（程序退出中）
+
+    def _schedule_retry(self, delay):
+        if self.retry_handle is not None:
+            self.retry_handle.cancel()
+            self.retry_handle = None
+        if delay is not None:
+            self.retry_handle = self.runner.loop.call_later(delay, self.refresh)
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor():
+    """获取应用共享的连通性监控，首次使用时启动探测"""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = ConnectivityMonitor(async_runner.get_runner())
+            _monitor.start()
+        return _monitor
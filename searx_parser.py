@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SearXNG HTML结果页解析
+只提取 div#urls > article.result，优先使用C实现的解析器（selectolax/lexbor，其次lxml），
+CSS选择器只编译一次；两者都未安装或解析失败时退回BeautifulSoup。
+返回的节点提供结果解析用到的BeautifulSoup接口子集（find、find_all、get_text、[]、get、next_sibling），
+simple_search和server.py中按类别解析单条结果的代码无需区分后端
+"""
+
+import os
+import re
+import sys
+import time
+import logging
+from functools import lru_cache
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+    from lxml import etree
+    from cssselect import GenericTranslator
+except ImportError:
+    lxml = None
+
+logger = logging.getLogger(__name__)
+
+# 配置：auto（按selectolax、lxml、bs4顺序选择第一个可用的）或指定后端
+PARSER_BACKEND = os.environ.get("SEARXNG_HTML_PARSER", "auto").lower()
+
+RESULTS_SELECTOR = "div#urls > article.result"
+
+
+def _css(name, class_=None, href=False):
+    """BeautifulSoup风格的查找条件转换为CSS选择器"""
+    selector = name
+    if class_:
+        selector += "." + class_
+    if href:
+        selector += "[href]"
+    return selector
+
+
+# ---------- selectolax（lexbor）后端 ----------
+
+class _LexborNode:
+    """selectolax节点的BeautifulSoup风格包装"""
+
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    def find(self, name, class_=None, href=False):
+        node = self.node.css_first(_css(name, class_, href))
+        return _LexborNode(node) if node is not None else None
+
+    def find_all(self, name, class_=None, href=False):
+        return [_LexborNode(node) for node in self.node.css(_css(name, class_, href))]
+
+    def get_text(self, strip=False):
+        return self.node.text(deep=True, strip=strip)
+
+    def get(self, key, default=None):
+        value = self.node.attributes.get(key, default)
+        return "" if value is None else value  # 无值属性，与BeautifulSoup一致返回空字符串
+
+    def __getitem__(self, key):
+        attributes = self.node.attributes
+        if key not in attributes:
+            raise KeyError(key)
+        return attributes[key] or ""
+
+    @property
+    def next_sibling(self):
+        node = self.node.next
+        if node is None:
+            return None
+        if node.is_text_node:
+            return node.text_content
+        return _LexborNode(node)
+
+
+def _lexbor_articles(data):
+    return [_LexborNode(node) for node in LexborHTMLParser(data).css(RESULTS_SELECTOR)]
+
+
+# ---------- lxml后端 ----------
+
+@lru_cache(maxsize=None)
+def _xpath(selector):
+    """CSS选择器编译为XPath，只在第一次使用时编译"""
+    return etree.XPath(GenericTranslator().css_to_xpath(selector, prefix="descendant::"))
+
+
+class _LxmlNode:
+    """lxml元素的BeautifulSoup风格包装（lxml元素按子元素数判断真假，不能直接使用）"""
+
+    __slots__ = ("element",)
+
+    def __init__(self, element):
+        self.element = element
+
+    def find(self, name, class_=None, href=False):
+        elements = _xpath(_css(name, class_, href))(self.element)
+        return _LxmlNode(elements[0]) if elements else None
+
+    def find_all(self, name, class_=None, href=False):
+        return [_LxmlNode(element) for element in _xpath(_css(name, class_, href))(self.element)]
+
+    def get_text(self, strip=False):
+        texts = _xpath_text(self.element)
+        if strip:
+            return "".join(text.strip() for text in texts)
+        return "".join(texts)
+
+    def get(self, key, default=None):
+        return self.element.get(key, default)
+
+    def __getitem__(self, key):
+        value = self.element.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    @property
+    def next_sibling(self):
+        if self.element.tail:
+            return self.element.tail
+        element = self.element.getnext()
+        return _LxmlNode(element) if element is not None else None
+
+
+if lxml is not None:
+    _xpath_text = etree.XPath("descendant::text()[not(parent::script or parent::style)]", smart_strings=False)
+
+
+def _lxml_articles(data):
+    try:
+        document = lxml.html.document_fromstring(data)
+    except ValueError:
+        # 带有XML编码声明的字符串需要按字节解析
+        document = lxml.html.document_fromstring(data.encode("utf-8"))
+    return [_LxmlNode(element) for element in _xpath(RESULTS_SELECTOR)(document)]
+
+
+# ---------- BeautifulSoup后端 ----------
+
+_URLS_STRAINER = SoupStrainer("div", id="urls")
+
+
+def _bs4_articles(data):
+    # 只为 div#urls 建树，跳过页头、脚本和侧栏
+    soup = BeautifulSoup(data, "html.parser", parse_only=_URLS_STRAINER)
+    urls_div = soup.find("div", id="urls")
+    if not urls_div:
+        return []
+    return urls_div.find_all("article", class_="result")
+
+
+BACKENDS = {"bs4": _bs4_articles}
+if lxml is not None:
+    BACKENDS["lxml"] = _lxml_articles
+if LexborHTMLParser is not None:
+    BACKENDS["selectolax"] = _lexbor_articles
+
+
+def _select_backend(name):
+    if name in BACKENDS:
+        return name
+    if name != "auto":
+        logger.warning(f"HTML解析后端 {name} 不可用，自动选择")
+    for candidate in ("selectolax", "lxml", "bs4"):
+        if candidate in BACKENDS:
+            return candidate
+
+
+backend = _select_backend(PARSER_BACKEND)
+
+
+def find_articles(data, parser=None):
+    """提取页面中 div#urls 下的全部 article.result 节点，没有结果时返回空列表"""
+    if not data:
+        return []
+    name = parser or backend
+    if name != "bs4":
+        try:
+            return BACKENDS[name](data)
+        except Exception as e:
+            logger.warning(f"{name} 解析失败，改用BeautifulSoup: {e}")
+    return _bs4_articles(data)
+
+
+def url_key(url):
+    """用于结果去重的规范化链接：忽略协议、www前缀、片段和末尾斜杠"""
+    url = re.sub(r"^https?://(www\.)?", "", url.strip().lower())
+    return url.split("#", 1)[0].rstrip("/")
+
+
+# ---------- 基准测试 ----------
+
+_PAGE_TEMPLATE = """<!DOCTYPE html>
+<html class="no-js theme-auto center-alignment-no" lang="zh-CN">
+<head><meta charset="UTF-8"><title>{query} - SearXNG</title>
+<link rel="stylesheet" href="/static/themes/simple/css/searxng.min.css" type="text/css" media="screen">
+<script src="/static/themes/simple/js/searxng.head.min.js" client_settings="eyJhdXRvY29tcGxldGUiOiAiIn0="></script>
+</head>
+<body class="results_endpoint">
+<nav id="links_on_top">{nav}</nav>
+<form id="search" method="POST" action="/search" role="search"><input id="q" name="q" type="text" value="{query}"></form>
+<main id="main_results" class="only_template_images">
+<div id="results" class="">
+<div id="sidebar"><div id="engines_msg">{sidebar}</div></div>
+<div id="urls" role="main">
+{articles}
+</div>
+<nav id="pagination">{nav}</nav>
+</div></main>
+<footer><p>Powered by <a href="https://docs.searxng.org/">SearXNG</a></p></footer>
+<script src="/static/themes/simple/js/searxng.min.js"></script>
+</body></html>"""
+
+_ARTICLE_BODIES = {
+    "general": (
+        '<a href="https://example.com/{i}" class="url_header" rel="noreferrer"><div class="url_wrapper">'
+        '<span class="url_o1"><span class="url_i1">https://example.com</span></span></div></a>'
+        '<h3><a href="https://example.com/{i}" rel="noreferrer">示例 <span class="highlight">结果</span> {i}</a></h3>'
+        '<p class="content">这是第 {i} 条结果的摘要，包含 <span class="highlight">关键词</span> 和一些描述文本。</p>'
+        '<div class="engines"><span>bing</span><span>duckduckgo</span><span>google</span>'
+        '<a href="https://web.archive.org/web/https://example.com/{i}" class="cache_link">缓存</a></div>'
+    ),
+    "images": (
+        '<a href="https://img.example.com/page/{i}" rel="noreferrer">'
+        '<img class="image_thumbnail" src="https://img.example.com/thumb/{i}.jpg" alt="图片 {i}" loading="lazy">'
+        '<span class="title">图片 {i}</span><span class="source">img.example.com</span></a>'
+        '<div class="detail"><p class="result-engine"><span>引擎:</span> bing images</p></div>'
+    ),
+    "videos": (
+        '<h3><a href="https://video.example.com/watch?v={i}">视频 {i}</a></h3>'
+        '<img class="thumbnail" src="https://video.example.com/thumb/{i}.jpg">'
+        '<div class="result_length">长度: 12:{i:02d}</div><div class="result_author">作者: 作者{i}</div>'
+        '<div class="engines"><span>youtube</span></div>'
+    ),
+    "map": (
+        '<h3><a href="https://www.openstreetmap.org/node/{i}">地点 {i}</a></h3>'
+        '<table><tr><td>地址</td><td>某路 {i} 号</td></tr><tr><td>电话</td><td>010-{i:04d}</td></tr>'
+        '<tr><td>网站</td><td>https://place{i}.example.com</td></tr></table>'
+        '<div class="engines"><span>openstreetmap</span></div>'
+    ),
+    "music": (
+        '<h3><a href="https://music.example.com/track/{i}">歌曲 {i}</a></h3>'
+        '<img src="https://music.example.com/cover/{i}.jpg">'
+        '<p class="content">艺术家 {i} | Published: 2024-01-{day:02d}</p>'
+        '<div class="engines"><span>soundcloud</span></div>'
+    ),
+    "news": (
+        '<h3><a href="https://news.example.com/article/{i}">新闻标题 {i}</a></h3>'
+        '<div class="highlight">2024-05-{day:02d} | 新闻来源 {i}</div>'
+        '<p class="content">新闻 {i} 的内容摘要，介绍事件的经过和影响。</p>'
+        '<div class="engines"><span>bing news</span><span>yahoo news</span></div>'
+    ),
+    "it": (
+        '<h3><a href="https://pypi.org/project/pkg{i}">pkg{i}</a></h3>'
+        '<p class="content">软件包 {i} 的说明。</p>'
+        '<div class="attributes"><div>package: pkg{i}\n</div><div>maintainer: dev{i}\n</div>'
+        '<div>version: 1.{i}.0\n</div></div>'
+        '<div class="engines"><span>pypi</span></div>'
+    ),
+    "science": (
+        '<h3><a href="https://arxiv.org/abs/2401.{i:05d}">论文 {i}</a></h3>'
+        '<p class="content">论文 {i} 的摘要，描述方法和实验结果。</p>'
+        '<div class="engines"><span>arxiv</span><span>google scholar</span></div>'
+    ),
+    "files": (
+        '<h3><a href="https://files.example.com/{i}">文件 {i}</a></h3>'
+        '<p class="content">文件 {i} 的说明</p>'
+        '<p class="stat">Seeds: {i} Leeches: {day}</p><p>Size: {i}.5 GB\n</p>'
+        '<a href="magnet:?xt=urn:btih:{i:040d}" class="magnetlink">magnet</a>'
+        '<div class="engines"><span>piratebay</span></div>'
+    ),
+    "social media": (
+        '<h3><a href="https://social.example.com/post/{i}">帖子 {i}</a></h3>'
+        '<p class="content">帖子 {i} 的内容 #topic{i} #searxng</p>'
+        '<div class="engines"><span>mastodon</span></div>'
+    ),
+}
+
+
+def _sample_page(category, count=30):
+    """生成与SearXNG simple主题结构一致的结果页"""
+    body = _ARTICLE_BODIES[category]
+    articles = "\n".join(
+        f'<article class="result result-default category-{category.replace(" ", "-")}">'
+        + body.format(i=i, day=i % 28 + 1)
+        + "</article>"
+        for i in range(count)
+    )
+    nav = "".join(f'<a href="/search?q=test&amp;category={c}">{c}</a>' for c in _ARTICLE_BODIES)
+    sidebar = "".join(f'<div class="engine">engine {i}: <span>0.{i}s</span></div>' for i in range(40))
+    return _PAGE_TEMPLATE.format(query=category, nav=nav, sidebar=sidebar, articles=articles)
+
+
+def _snapshot(article):
+    """提取各类别解析代码用到的字段，用于比较不同后端的结果"""
+    title_link = article.find("h3")
+    link_tag = title_link.find("a", href=True) if title_link else None
+    img_tag = article.find("img")
+    content_p = article.find("p", class_="content")
+    engines_div = article.find("div", class_="engines")
+    engine_span = article.find("p", class_="result-engine")
+    engine_span = engine_span.find("span") if engine_span else None
+    return (
+        link_tag["href"] if link_tag else None,
+        link_tag.get_text(strip=True) if link_tag else None,
+        img_tag.get("src", "") if img_tag else None,
+        content_p.get_text(strip=True) if content_p else None,
+        [span.get_text(strip=True) for span in engines_div.find_all("span")] if engines_div else None,
+        [td.get_text(strip=True) for td in article.find_all("td")],
+        engine_span.next_sibling.strip() if engine_span and engine_span.next_sibling else None,
+        article.get_text(),
+    )
+
+
+def _load_pages(directory):
+    """读取保存的结果页（文件名为 <类别>.html），没有时使用生成的页面"""
+    pages = {}
+    for category in _ARTICLE_BODIES:
+        path = os.path.join(directory, f"{category}.html") if directory else None
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                pages[category] = f.read()
+        else:
+            pages[category] = _sample_page(category)
+    return pages
+
+
+def _legacy_articles(data):
+    """原实现：为整个页面建立BeautifulSoup树"""
+    soup = BeautifulSoup(data, "html.parser")
+    urls_div = soup.find("div", id="urls")
+    return urls_div.find_all("article", class_="result") if urls_div else []
+
+
+def benchmark(directory=None, rounds=20):
+    """在每个类别的结果页上比较各解析后端（提取结果节点并读取各字段）的耗时"""
+    pages = _load_pages(directory)
+    runners = {"bs4 (原实现)": _legacy_articles}
+    runners.update({name: BACKENDS[name] for name in ("bs4", "lxml", "selectolax") if name in BACKENDS})
+
+    print(f"SearXNG结果页解析基准测试（每项 {rounds} 轮，默认后端: {backend}）")
+    for category, data in pages.items():
+        expected = [_snapshot(article) for article in _legacy_articles(data)]
+        timings = []
+        for label, runner in runners.items():
+            assert [_snapshot(article) for article in runner(data)] == expected, (category, label)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for article in runner(data):
+                    _snapshot(article)
+            timings.append((label, (time.perf_counter() - start) / rounds * 1000))
+
+        legacy_time = timings[0][1]
+        line = "  ".join(f"{label} {elapsed:.2f} ms ({legacy_time / elapsed:.1f}x)" for label, elapsed in timings)
+        print(f"  {category:<12} {len(data) // 1024:>4} KB {len(expected):>3} 条  {line}")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else None)
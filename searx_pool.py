@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SearXNG实例池
+SEARXNG_API_URLS 配置多个实例（逗号分隔），按延迟和错误率为每个实例评分，优先使用得分最好的实例。
+请求在所有实例近期延迟的p90内没有返回时，向另一个实例发出对冲请求，采用先成功的结果；
+请求失败时立即换一个实例重试。连续失败的实例被暂时剔除，剔除时间到后重新放入，
+再次失败时剔除时间加倍
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 配置
+DEFAULT_URL = "https://searx.bndkt.io"
+HEDGE_PERCENTILE = float(os.environ.get("SEARXNG_HEDGE_PERCENTILE", "0.9"))  # 超过近期延迟的该分位数时发出对冲请求
+HEDGE_DEFAULT_DELAY = float(os.environ.get("SEARXNG_HEDGE_DELAY", "1.5"))  # 延迟样本不足时的对冲等待（秒）
+HEDGE_MIN_DELAY = float(os.environ.get("SEARXNG_HEDGE_MIN_DELAY", "0.2"))
+HEDGE_MAX_DELAY = float(os.environ.get("SEARXNG_HEDGE_MAX_DELAY", "5"))
+MAX_ATTEMPTS = int(os.environ.get("SEARXNG_MAX_ATTEMPTS", "3"))  # 单次搜索最多请求的实例数（含对冲和重试）
+EJECT_AFTER = int(os.environ.get("SEARXNG_EJECT_AFTER", "3"))  # 连续失败多少次后剔除
+EJECT_SECONDS = float(os.environ.get("SEARXNG_EJECT_SECONDS", "30"))  # 首次剔除时长，之后每次加倍
+EJECT_MAX_SECONDS = float(os.environ.get("SEARXNG_EJECT_MAX_SECONDS", "600"))
+ERROR_WINDOW = float(os.environ.get("SEARXNG_ERROR_WINDOW", "120"))  # 只按这段时间内（秒）的请求计算错误率
+
+LATENCY_WINDOW = 64  # 每个实例保留的延迟样本数
+MIN_SAMPLES = 5  # 计算对冲阈值所需的最少样本数
+
+
+class InstanceSkipped(Exception):
+    """请求没有发往该实例（例如该实例的速率限制队列已满），换实例重试但不计入健康状态"""
+
+
+def configured_urls():
+    """读取配置的实例地址：SEARXNG_API_URLS，未设置时使用SEARXNG_API_URL"""
+    urls = os.environ.get("SEARXNG_API_URLS") or os.environ.get("SEARXNG_API_URL") or DEFAULT_URL
+    return [url.strip().rstrip("/") for url in urls.split(",") if url.strip()]
+
+
+class Instance:
+    """一个SearXNG实例的健康状态（由SearxPool加锁访问）"""
+
+    def __init__(self, url):
+        self.url = url
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # 成功请求的耗时
+        self.outcomes = deque(maxlen=20)  # 最近请求的 (时间, 是否成功)
+        self.failures = 0  # 连续失败次数
+        self.ejections = 0  # 连续被剔除的次数，成功后清零
+        self.ejected_until = 0.0
+        self.trial = False  # 剔除期满后的试探请求是否正在进行
+        self.in_flight = 0
+
+    def error_rate(self, now, window):
+        recent = [ok for moment, ok in self.outcomes if now - moment <= window]
+        if not recent:
+            return 0.0
+        return recent.count(False) / len(recent)
+
+    def latency(self):
+        """近期成功请求耗时的中位数（不受偶发长尾影响），没有样本时返回None"""
+        if not self.latencies:
+            return None
+        return sorted(self.latencies)[len(self.latencies) // 2]
+
+    def score(self, now, window):
+        """得分越低越好：延迟中位数按近期错误率放大，并考虑进行中的请求数。
+        没有成功记录的实例近期没有失败时得分为0，会先被尝试一次"""
+        error_rate = self.error_rate(now, window)
+        latency = self.latency()
+        if latency is None:
+            latency = HEDGE_MAX_DELAY if error_rate else 0.0
+        return latency * (1 + 4 * error_rate) * (1 + 0.5 * self.in_flight)
+
+    def is_ejected(self, now):
+        return now < self.ejected_until
+
+
+class SearxPool:
+    """多个SearXNG实例组成的池，可在多个线程和事件循环之间共享"""
+
+    def __init__(self, urls=None, hedge_percentile=HEDGE_PERCENTILE, max_attempts=MAX_ATTEMPTS,
+                 eject_after=EJECT_AFTER, eject_seconds=EJECT_SECONDS, error_window=ERROR_WINDOW):
+        self.instances = [Instance(url) for url in (urls or configured_urls())]
+        self.hedge_percentile = hedge_percentile
+        self.max_attempts = max_attempts
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.error_window = error_window
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "retries": 0, "failures": 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    @property
+    def urls(self):
+        return [instance.url for instance in self.instances]
+
+    def hedge_delay(self):
+        """对冲等待时间：所有实例近期成功请求耗时的p90"""
+        with self.lock:
+            samples = sorted(latency for instance in self.instances for latency in instance.latencies)
+        if len(samples) < MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile))
+        return min(max(samples[index], HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def choose(self, exclude=()):
+        """选择实例：剔除期满的实例先发一次试探请求，试探结束前不再分配其他请求，其余按得分选择；
+        没有可用实例时选择最早到期的实例，没有可选实例时返回None"""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [instance for instance in self.instances if instance not in exclude]
+            if not candidates:
+                return None
+            healthy = [instance for instance in candidates if not instance.is_ejected(now)]
+            for instance in healthy:
+                if instance.ejections and not instance.trial:
+                    instance.trial = True
+                    return instance
+            scored = [instance for instance in healthy if not (instance.ejections and instance.trial)]
+            if not scored:
+                return min(candidates, key=lambda instance: instance.ejected_until)
+            return min(scored, key=lambda instance: instance.score(now, self.error_window))
+
+    def record_success(self, instance, elapsed):
+        with self.lock:
+            instance.latencies.append(elapsed)
+            instance.outcomes.append((time.monotonic(), True))
+            if instance.ejections:
+                logger.info(f"SearXNG实例恢复: {instance.url}")
+            instance.failures = 0
+            instance.ejections = 0
+            instance.ejected_until = 0.0
+            instance.trial = False
+
+    def record_failure(self, instance, error):
+        with self.lock:
+            instance.outcomes.append((time.monotonic(), False))
+            instance.failures += 1
+            instance.trial = False
+            # 剔除期满后重新放入的实例再次失败时立即剔除
+            if instance.failures >= self.eject_after or instance.ejections:
+                duration = min(self.eject_seconds * 2 ** instance.ejections, EJECT_MAX_SECONDS)
+                instance.ejections += 1
+                instance.ejected_until = time.monotonic() + duration
+                logger.warning(f"SearXNG实例暂时剔除 {duration:g} 秒: {instance.url}（{error}）")
+
+    async def _attempt(self, instance, send):
+        with self.lock:
+            instance.in_flight += 1
+        start = time.monotonic()
+        try:
+            result = await send(instance.url)
+        except (asyncio.CancelledError, InstanceSkipped):
+            # 对冲中落败被取消或请求未发出，不计入健康状态；试探没有结果，下次仍可再试探
+            with self.lock:
+                instance.trial = False
+            raise
+        except Exception as e:
+            self.record_failure(instance, e)
+            raise
+        else:
+            self.record_success(instance, time.monotonic() - start)
+            return result
+        finally:
+            with self.lock:
+                instance.in_flight -= 1
+
+    async def request(self, send, deadline=None):
+        """用send(实例地址)发送请求并返回第一个成功的结果。
+        等待超过对冲阈值时向另一个实例发出请求，请求失败时换实例重试；
+        deadline秒后不再发出新的请求。全部失败时抛出最后一个异常
+        """
+        start = time.monotonic()
+        hedge_delay = self.hedge_delay()
+        tried = []
+        tasks = {}  # 任务 -> 实例
+        hedges = set()  # 对冲发出的任务
+        last_error = None
+        self._count("requests")
+
+        def launch():
+            instance = self.choose(exclude=tried)
+            if instance is None or len(tried) >= self.max_attempts:
+                return False
+            if deadline is not None and time.monotonic() - start >= deadline:
+                return False
+            tried.append(instance)
+            task = asyncio.ensure_future(self._attempt(instance, send))
+            tasks[task] = instance
+            return task
+
+        launch()
+        try:
+            while tasks:
+                # 只有一个请求在进行时，等到对冲阈值；之后等任一请求结束
+                timeout = hedge_delay if len(tasks) == 1 and len(tried) < self.max_attempts else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    task = launch()
+                    if task:
+                        hedges.add(task)
+                        self._count("hedged")
+                    else:
+                        hedge_delay = None  # 没有其他实例可用，等待当前请求
+                    continue
+
+                for task in done:
+                    instance = tasks.pop(task)
+                    if task.exception() is None:
+                        if task in hedges:
+                            self._count("hedge_wins")
+                        return task.result()
+                    last_error = task.exception()
+                    logger.debug(f"SearXNG请求失败 {instance.url}: {last_error}")
+
+                # 失败后立即换实例重试
+                if launch():
+                    self._count("retries")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self._count("failures")
+        if last_error is None:
+            raise RuntimeError("没有可用的SearXNG实例")
+        raise last_error
+
+    def snapshot(self):
+        """各实例的健康状态，用于日志和调试"""
+        now = time.monotonic()
+        with self.lock:
+            return [
+                {
+                    "url": instance.url,
+                    "latency": round(instance.latency() or 0.0, 3),
+                    "error_rate": round(instance.error_rate(now, self.error_window), 2),
+                    "ejected": instance.is_ejected(now),
+                    "ejected_for": max(0.0, round(instance.ejected_until - now, 1)),
+                }
+                for instance in self.instances
+            ]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """获取共享的实例池，首次使用时按环境变量创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SearxPool()
+        return _pool
+
+
+# ---------- 本地桩服务器演示 ----------
+
+async def _start_stub(name, delay, slow_rate=0.0, slow_delay=0.0, failing=None, seed=0):
+    """启动一个最简HTTP桩服务器，返回 (server, 地址)。
+    按slow_rate的概率以slow_delay响应（长尾）；failing为字典，其中failing["on"]为True时返回500"""
+    rng = random.Random(seed)
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            await asyncio.sleep(slow_delay if rng.random() < slow_rate else delay)
+            if failing and failing["on"]:
+                status, body = "500 Internal Server Error", b"error"
+            else:
+                status, body = "200 OK", name.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.CancelledError, ConnectionError, asyncio.IncompleteReadError):
+            pass  # 对冲落败的客户端已断开，或演示结束
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+
+async def _demo(rounds):
+    import httpx
+
+    failing = {"on": True}
+    stubs = [
+        await _start_stub("fast", 0.02, slow_rate=0.15, slow_delay=1.0, seed=1),
+        await _start_stub("steady", 0.05, slow_rate=0.05, slow_delay=1.0, seed=2),
+        await _start_stub("flaky", 0.03, failing=failing),
+    ]
+    urls = [url for _, url in stubs]
+
+    async with httpx.AsyncClient() as client:
+        async def send(url):
+            response = await client.get(url + "/search", timeout=5)
+            response.raise_for_status()
+            return response.text
+
+        async def run(pool, label):
+            timings = []
+            for _ in range(rounds):
+                start = time.monotonic()
+                try:
+                    await pool.request(send, deadline=5)
+                except Exception:
+                    pass
+                timings.append(time.monotonic() - start)
+            timings.sort()
+            p = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))] * 1000
+            print(f"  {label:<12} p50 {p(0.5):7.1f} ms  p90 {p(0.9):7.1f} ms  p99 {p(0.99):7.1f} ms  {pool.stats}")
+            return pool
+
+        print(f"SearXNG实例池演示（{rounds} 次请求，第三个实例返回500）")
+        await run(SearxPool(urls[:1], max_attempts=1), "单实例")
+        pool = await run(SearxPool(urls, eject_seconds=0.2, error_window=1), "实例池+对冲")
+        for state in pool.snapshot():
+            print(f"    {state}")
+
+        # 故障实例恢复后，剔除期满（或错误记录过期）时的试探请求成功即重新放入
+        failing["on"] = False
+        await asyncio.sleep(max(state["ejected_for"] for state in pool.snapshot()) + 1.1)
+        await run(pool, "实例恢复后")
+        for state in pool.snapshot():
+            print(f"    {state}")
+
+    for server, _ in stubs:
+        server.close()
+        await server.wait_closed()
+
+
+def demo(rounds=100):
+    """用本地桩服务器比较单实例与实例池（含对冲和剔除）的尾延迟"""
+    asyncio.run(_demo(rounds))
+
+
+if __name__ == "__main__":
+    demo(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -5,13 +5,19 @@ import time
 import logging
 import json
 import re
+from contextlib import asynccontextmanager
 from html import escape
 
 import httpx
 from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
 from mcp.types import TextContent
-from bs4 import BeautifulSoup
+
+import rate_limiter
+import search_cache
+import search_http
+import searx_parser
+import searx_pool
 
 load_dotenv()
 
@@ -31,19 +37,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-API_URL = os.environ.get("SEARXNG_API_URL", "https://searx.bndkt.io")
+API_URLS = searx_pool.configured_urls()  # SEARXNG_API_URLS（逗号分隔的多个实例），未设置时使用SEARXNG_API_URL
 COOKIE = os.environ.get("SEARXNG_COOKIE", "")
 USER_AGENT = os.environ.get(
     "SEARXNG_USER_AGENT",
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
 )
 REQUEST_TIMEOUT = os.environ.get("SEARXNG_REQUEST_TIMEOUT", "10")
+MULTI_SEARCH_CONCURRENCY = int(os.environ.get("MULTI_SEARCH_CONCURRENCY", "4"))  # 批量搜索同时进行的请求数
+MULTI_SEARCH_MAX_ITEMS = int(os.environ.get("MULTI_SEARCH_MAX_ITEMS", "10"))  # 单次批量搜索最多的查询数
 fastmcp_log_level = os.environ.get("ENV_FASTMCP_LOG_LEVEL", "WARNING")
 
+@asynccontextmanager
+async def _lifespan(server):
+    """
+    服务退出时关闭共享的HTTP连接池，并保存搜索配额计数
+    """
+    try:
+        yield {}
+    finally:
+        await search_http.aclose()
+        rate_limiter.close()
+
+
 # Initialize the FastMCP server
 mcp = FastMCP(
     "free-search",
     log_level=fastmcp_log_level,
+    lifespan=_lifespan,
     instructions="""
 # SearXNG Search MCP Server
 
@@ -103,6 +124,11 @@ Use this tool to search for public content on social media platforms. Ideal for
 
 For example: "Top tweets about AI" or "Reddit discussions about remote work"
 
+### 11. free_multi_search
+Use this tool to run several searches in one call, e.g. the same question in general, news and IT, or several related queries. The searches run concurrently and the results are merged and deduplicated by URL; each result lists the (query, category) pairs that returned it. A failed search is reported in "errors" without affecting the others.
+
+For example: [{"query": "rust async runtime", "category": "it"}, {"query": "rust async runtime", "category": "news"}]
+
 ## Usage Guidelines
 
 - Always check if your query is better suited for General, News, Images, or other specialized search categories.
@@ -111,7 +137,7 @@ For example: "Top tweets about AI" or "Reddit discussions about remote work"
 - For visual content, use Image Search; for video content, use Video Search.
 - For technical questions, IT Search is recommended; for academic questions, use Science Search.
 - For best results, keep your query concise and specific.
-- All searches are forwarded through the SearXNG instance; performance depends on the instance status (typically, there is no rate limit).
+- All searches are forwarded through the configured SearXNG instances; performance depends on the instance status. Requests are rate limited per instance; when busy they are queued briefly rather than rejected.
 
 ## Output Format
 
@@ -123,7 +149,7 @@ All search results are formatted as text, with each result item having distinct
 - Video Search: Title, Link, Description, Publication Platform, and Duration (if applicable)
 - Other Categories: Title, Link, Description (and additional information related to the category)
 
-If SEARXNG_API_URL is not configured or is invalid, a corresponding error message will be returned.
+SearXNG instances are configured with SEARXNG_API_URLS (comma-separated) or SEARXNG_API_URL; when neither is set, the public instance https://searx.bndkt.io is used. If no instance can be reached, a corresponding error message will be returned.
 
 ---
     """,
@@ -139,42 +165,6 @@ HEADERS = {
     "Cookie": COOKIE,
 }
 
-# Rate limiting
-RATE_LIMIT = {"per_second": 1, "per_month": 15000}
-request_count = {"second": 0, "month": 0, "last_reset": time.time()}
-
-
-def check_rate_limit():
-    """
-    Check if the rate limit has been exceeded.
-    Returns True if request is allowed, False otherwise.
-    """
-    now = time.time()
-    current_month = time.strftime("%Y-%m", time.localtime(now))
-    last_reset_month = time.strftime(
-        "%Y-%m", time.localtime(request_count["last_reset"])
-    )
-
-    # Reset second counter every second
-    if now - request_count["last_reset"] >= 1:
-        request_count["second"] = 0
-        request_count["last_reset"] = now
-
-    # Reset monthly counter when month changes
-    if current_month != last_reset_month:
-        request_count["month"] = 0
-
-    if (
-        request_count["second"] >= RATE_LIMIT["per_second"]
-        or request_count["month"] >= RATE_LIMIT["per_month"]
-    ):
-        return False
-
-    request_count["second"] += 1
-    request_count["month"] += 1
-    return True
-
-
 def merge_headers(headers):
     """
     Merge headers with default headers.
@@ -184,14 +174,12 @@ def merge_headers(headers):
 
 def validate_environment_vars():
     """
-    Validate that all required environment variables are set.
+    Validate that the configured SearXNG instance URLs are usable.
     """
-    required_vars = ["SEARXNG_API_URL"]
-    missing_vars = [var for var in required_vars if not os.environ.get(var)]
-
-    if missing_vars:
+    invalid = [url for url in API_URLS if not url.startswith(("http://", "https://"))]
+    if invalid:
         raise EnvironmentError(
-            f"Missing required environment variables: {', '.join(missing_vars)}"
+            f"Invalid SEARXNG_API_URLS / SEARXNG_API_URL entries: {', '.join(invalid)}"
         )
 
 
@@ -446,6 +434,137 @@ async def free_social_media_search(
     )
 
 
+@mcp.tool(
+    description="""
+批量搜索：一次执行多个 (查询, 类别) 搜索，并发请求，结果按链接合并去重
+    Args:
+        searches (list): 搜索列表，每项为 {"query": 搜索查询, "category": 类别}，类别默认general，
+            可选 general、news、images、videos、map、music、it、science、files、social media
+        language (str): 搜索语言，默认中文
+        safe_search (int): 安全搜索等级，默认1
+        time_range (str): 时间范围，默认空
+    Returns:
+        JSON text: {"results": [...], "errors": [...]}，每条结果的 sources 列出返回它的查询和类别，
+        errors 列出失败的查询及原因
+"""
+)
+async def free_multi_search(
+    searches: list[dict],
+    language="auto",
+    safe_search=1,
+    time_range="",
+) -> TextContent:
+    if not searches:
+        raise ValueError("searches must contain at least one {query, category} item")
+    if len(searches) > MULTI_SEARCH_MAX_ITEMS:
+        raise ValueError(f"At most {MULTI_SEARCH_MAX_ITEMS} searches per call")
+
+    semaphore = _get_multi_search_semaphore()
+
+    async def run(item):
+        query = item.get("query", "") if isinstance(item, dict) else ""
+        category = (item.get("category") or "general") if isinstance(item, dict) else "general"
+        try:
+            if category not in SEARCH_CATEGORIES:
+                raise ValueError(f"Unknown category: {category}")
+            async with semaphore:
+                result = await _perform_search(
+                    query, category, language, safe_search, time_range, "json"
+                )
+            return query, category, _load_json_results(result.text), None
+        except Exception as e:
+            logger.warning(f"Multi search item failed ({category}: {query}): {e}")
+            return query, category, [], str(e)
+
+    outcomes = await asyncio.gather(*(run(item) for item in searches))
+
+    # 按链接合并去重，保留第一次出现的结果，并记录所有返回它的查询
+    merged = {}
+    errors = []
+    for query, category, results, error in outcomes:
+        if error is not None:
+            errors.append({"query": query, "category": category, "error": error})
+            continue
+        for result in results:
+            key = searx_parser.url_key(result.get("url", "")) or result.get("title", "")
+            source = {"query": query, "category": category}
+            if key in merged:
+                if source not in merged[key]["sources"]:
+                    merged[key]["sources"].append(source)
+            else:
+                merged[key] = dict(result, sources=[source])
+
+    return TextContent(
+        type="text",
+        text=json.dumps(
+            {"results": list(merged.values()), "errors": errors},
+            ensure_ascii=False,
+            indent=2,
+        ),
+    )
+
+
+@mcp.resource("stats://rate-limit", mime_type="application/json")
+def rate_limit_stats() -> str:
+    """
+    速率限制指标：各实例的排队深度、等待时间、拒绝次数和本月配额使用情况
+    """
+    return json.dumps(rate_limiter.get_limiter().metrics(), ensure_ascii=False, indent=2)
+
+
+@mcp.resource("stats://search", mime_type="application/json")
+def search_stats() -> str:
+    """
+    搜索缓存命中情况，以及相同查询的并发请求被合并的次数
+    """
+    cache = search_cache.get_cache()
+    return json.dumps(
+        {
+            "cache": cache.stats,
+            "coalescing": dict(cache.flights.stats, in_flight=cache.flights.in_flight()),
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
+
+
+SEARCH_CATEGORIES = (
+    "general",
+    "news",
+    "images",
+    "videos",
+    "map",
+    "music",
+    "it",
+    "science",
+    "files",
+    "social media",
+)
+
+_multi_search_semaphore = None
+
+
+def _get_multi_search_semaphore() -> asyncio.Semaphore:
+    """
+    所有批量搜索共享的并发限制（MCP服务只运行一个事件循环）
+    """
+    global _multi_search_semaphore
+    if _multi_search_semaphore is None:
+        _multi_search_semaphore = asyncio.Semaphore(MULTI_SEARCH_CONCURRENCY)
+    return _multi_search_semaphore
+
+
+def _load_json_results(text: str) -> list:
+    """
+    解析json输出格式的搜索结果，无结果提示等非JSON文本视为空列表
+    """
+    try:
+        results = json.loads(text)
+    except json.JSONDecodeError:
+        return []
+    return [result for result in results if isinstance(result, dict)] if isinstance(results, list) else []
+
+
 # 通用搜索函数，避免代码重复
 async def _perform_search(
     query: str,
@@ -461,39 +580,59 @@ async def _perform_search(
     if not query or not isinstance(query, str):
         raise ValueError("Query parameter is required and must be a string")
 
-    if not API_URL:
-        raise ValueError("SEARXNG_API_URL environment variable is not set")
+    # 缓存命中时不占用速率限制，过期结果先返回再在后台刷新
+    async def fetch():
+        result = await _fetch_search(
+            query, category, language, safe_search, time_range, output_format
+        )
+        return result.text
+
+    key = search_cache.make_key(
+        query, category, language, safe_search, time_range, output_format
+    )
+    text = await search_cache.get_cache().get_or_fetch(key, category, fetch)
+    return TextContent(type="text", text=text)
 
-    if not check_rate_limit():
-        raise RuntimeError("Rate limit exceeded")
 
+async def _fetch_search(
+    query: str,
+    category: str,
+    language: str,
+    safe_search,
+    time_range: str,
+    output_format: str,
+) -> TextContent:
+    """
+    向SearXNG发送搜索请求并解析结果
+    """
     headers = merge_headers({})
-    params = {
-        "q": query,
-        "language": language,
-        "time_range": time_range,
-        "safe_search": safe_search,
-        "categories": category,
-        "theme": "simple",
-        "format": "html" if "searx.bndkt.io" in API_URL else "json",
-    }
-
-    api_url = API_URL
-    if api_url.endswith("/"):
-        api_url = api_url[:-1]
-
-    search_url = f"{api_url}/search"
 
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                search_url, data=params, headers=headers, timeout=REQUEST_TIMEOUT
-            )
-            response.raise_for_status()
-            if params["format"] == "json":
-                data = response.json()
-            else:
-                data = response.text
+    async def send(api_url):
+        # 按实例限速：令牌不足时排队等待，队列已满或等待过久时换其他实例
+        try:
+            await rate_limiter.get_limiter().acquire(api_url)
+        except rate_limiter.RateLimitExceeded as e:
+            raise searx_pool.InstanceSkipped(str(e)) from e
+
+        params = {
+            "q": query,
+            "language": language,
+            "time_range": time_range,
+            "safe_search": safe_search,
+            "categories": category,
+            "theme": "simple",
+            "format": "html" if "searx.bndkt.io" in api_url else "json",
+        }
+
+        client = search_http.get_client()
+        response = await client.post(
+            f"{api_url}/search", data=params, headers=headers, timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        if params["format"] == "json":
+            data = response.json()
+        else:
+            data = response.text
 
         if params["format"] == "json":
             return _parse_response_json(data, output_format, category)
@@ -501,6 +640,13 @@ async def _perform_search(
             # 解析HTML响应
             return _parse_response_html(data, output_format, category)
 
+    # 慢请求对冲到其他实例、失败换实例重试（见searx_pool）
+    try:
+        return await searx_pool.get_pool().request(send, deadline=REQUEST_TIMEOUT)
+
+    except searx_pool.InstanceSkipped as e:
+        logger.warning(f"{category} search not sent: {str(e)}")
+        raise RuntimeError(str(e))
     except httpx.HTTPError as e:
         logger.error(f"HTTP Error in {category} search: {str(e)}")
         raise RuntimeError(f"HTTP Error: {str(e)}")
@@ -548,16 +694,8 @@ def _parse_response_html(data: str, output_format: str, category: str) -> TextCo
             text="未找到相关结果。您可以尝试：\n- 使用不同的关键词\n- 简化搜索查询\n- 检查拼写错误",
         )
 
-    # 使用 BeautifulSoup 解析 HTML
-    soup = BeautifulSoup(data, "html.parser")
-
-    # 找到 id="urls" 的 div
-    urls_div = soup.find("div", id="urls")
-    if not urls_div:
-        return TextContent(type="text", text="未找到搜索结果")
-
-    # 提取所有 article 标签
-    articles = urls_div.find_all("article", class_="result")
+    # 只提取 div#urls > article.result（后端见searx_parser）
+    articles = searx_parser.find_articles(data)
 
     if not articles:
         return TextContent(type="text", text="未找到搜索结果")
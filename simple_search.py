@@ -12,10 +12,15 @@ import logging
 from html import escape
 
 import httpx
-from bs4 import BeautifulSoup
+
+import context_builder
+import search_cache
+import search_http
+import searx_parser
+import searx_pool
 
 # 配置
-API_URL = os.environ.get("SEARXNG_API_URL", "https://searx.bndkt.io")
+API_URLS = searx_pool.configured_urls()  # SEARXNG_API_URLS（逗号分隔的多个实例），未设置时使用SEARXNG_API_URL
 COOKIE = os.environ.get("SEARXNG_COOKIE", "")
 USER_AGENT = os.environ.get(
     "SEARXNG_USER_AGENT",
@@ -23,6 +28,11 @@ USER_AGENT = os.environ.get(
 )
 REQUEST_TIMEOUT = int(os.environ.get("SEARXNG_REQUEST_TIMEOUT", "10"))
 
+# llm输出格式（用于提示）：每条摘要的字符上限、结果总token预算和最多结果数
+LLM_SNIPPET_CHARS = int(os.environ.get("SEARCH_LLM_SNIPPET_CHARS", "300"))
+LLM_TOKEN_BUDGET = int(os.environ.get("SEARCH_LLM_TOKEN_BUDGET", "1024"))
+LLM_MAX_RESULTS = int(os.environ.get("SEARCH_LLM_MAX_RESULTS", "8"))
+
 HEADERS = {
     "User-Agent": USER_AGENT,
     "content-type": "application/x-www-form-urlencoded",
@@ -37,45 +47,61 @@ async def perform_search(
     safe_search: int = 1,
     time_range: str = "",
     output_format: str = "html",
+    use_cache: bool = True,
 ) -> str:
     """
-    执行搜索并返回结果
+    执行搜索并返回结果，use_cache为False时跳过缓存直接请求（如连通性检查）
+    output_format: html（界面显示）、json，或llm（去重、排序并限制长度的纯文本，用于提示）
     """
     if not query or not isinstance(query, str):
         raise ValueError("Query parameter is required and must be a string")
 
-    if not API_URL:
-        raise ValueError("SEARXNG_API_URL environment variable is not set")
+    async def fetch():
+        return await _fetch_search(query, category, language, safe_search, time_range, output_format)
+
+    if not use_cache:
+        return await fetch()
 
-    params = {
-        "q": query,
-        "language": language,
-        "time_range": time_range,
-        "safe_search": safe_search,
-        "categories": category,
-        "theme": "simple",
-        "format": "html" if "searx.bndkt.io" in API_URL else "json",
-    }
+    key = search_cache.make_key(query, category, language, safe_search, time_range, output_format)
+    return await search_cache.get_cache().get_or_fetch(key, category, fetch)
+
+async def _fetch_search(
+    query: str,
+    category: str,
+    language: str,
+    safe_search: int,
+    time_range: str,
+    output_format: str,
+) -> str:
+    """
+    向SearXNG实例池发送搜索请求并解析结果（慢请求对冲、失败换实例见searx_pool）
+    """
+    async def send(api_url):
+        params = {
+            "q": query,
+            "language": language,
+            "time_range": time_range,
+            "safe_search": safe_search,
+            "categories": category,
+            "theme": "simple",
+            "format": "html" if "searx.bndkt.io" in api_url else "json",
+        }
 
-    api_url = API_URL
-    if api_url.endswith("/"):
-        api_url = api_url[:-1]
+        client = search_http.get_client()
+        response = await client.post(
+            f"{api_url}/search", data=params, headers=HEADERS, timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
 
-    search_url = f"{api_url}/search"
+        if params["format"] == "json":
+            data = response.json()
+            return parse_json_response(data, output_format, category)
+        else:
+            data = response.text
+            return parse_html_response(data, output_format, category)
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                search_url, data=params, headers=HEADERS, timeout=REQUEST_TIMEOUT
-            )
-            response.raise_for_status()
-            
-            if params["format"] == "json":
-                data = response.json()
-                return parse_json_response(data, output_format, category)
-            else:
-                data = response.text
-                return parse_html_response(data, output_format, category)
+        return await searx_pool.get_pool().request(send, deadline=REQUEST_TIMEOUT)
 
     except httpx.HTTPError as e:
         raise RuntimeError(f"HTTP Error: {str(e)}")
@@ -92,16 +118,8 @@ def parse_html_response(data: str, output_format: str, category: str) -> str:
     if """<div class="dialog-error-block" role="alert">""" in data:
         return "未找到相关结果。您可以尝试：\n- 使用不同的关键词\n- 简化搜索查询\n- 检查拼写错误"
 
-    # 使用 BeautifulSoup 解析 HTML
-    soup = BeautifulSoup(data, "html.parser")
-
-    # 找到 id="urls" 的 div
-    urls_div = soup.find("div", id="urls")
-    if not urls_div:
-        return "未找到搜索结果"
-
-    # 提取所有 article 标签
-    articles = urls_div.find_all("article", class_="result")
+    # 只提取 div#urls > article.result（后端见searx_parser）
+    articles = searx_parser.find_articles(data)
 
     if not articles:
         return "未找到搜索结果"
@@ -113,7 +131,13 @@ def parse_general_html_results(articles: list, output_format: str) -> str:
     """
     解析通用搜索结果
     """
-    parsed_results = []
+    return format_results(extract_html_results(articles), output_format)
+
+def extract_html_results(articles: list) -> list:
+    """
+    从HTML结果中提取标题、链接、描述和搜索引擎
+    """
+    results = []
 
     for article in articles:
         # 提取标题和链接 - 查找 h3 > a 结构
@@ -145,34 +169,9 @@ def parse_general_html_results(articles: list, output_format: str) -> str:
                 if span.get_text(strip=True)
             ]
 
-        if output_format == "json":
-            result_data = {
-                "title": escape(title),
-                "url": escape(url),
-                "description": escape(description),
-            }
-            if engines:
-                result_data["engines"] = engines
-            parsed_results.append(result_data)
-        else:
-            # HTML格式输出
-            engines_info = (
-                f"<small>搜索引擎: {', '.join(engines)}</small><br>" if engines else ""
-            )
-            html = (
-                f"<div style='margin-bottom: 1.5em; border-left: 3px solid #007acc; padding-left: 15px;'>"
-                f"<h3><a href='{escape(url)}' target='_blank' style='color: #007acc; text-decoration: none;'>{escape(title)}</a></h3>"
-                f"<p style='color: #666; margin: 5px 0;'>{escape(description)}</p>"
-                f"{engines_info}"
-                f"<small style='color: #999;'>{escape(url)}</small>"
-                f"</div>"
-            )
-            parsed_results.append(html)
+        results.append({"title": title, "url": url, "description": description, "engines": engines})
 
-    if output_format == "json":
-        return json.dumps(parsed_results, ensure_ascii=False, indent=2)
-    else:
-        return "\n".join(parsed_results)
+    return results
 
 def parse_json_response(data: dict, output_format: str, category: str) -> str:
     """
@@ -181,42 +180,114 @@ def parse_json_response(data: dict, output_format: str, category: str) -> str:
     if "results" not in data or not data["results"]:
         return "未找到相关结果"
 
-    parsed_results = []
-    
-    for result in data["results"]:
-        title = result.get("title", "")
-        url = result.get("url", "")
-        description = result.get("content", "")
-        engines = result.get("engines", [])
+    results = [
+        {
+            "title": result.get("title", ""),
+            "url": result.get("url", ""),
+            "description": result.get("content", ""),
+            "engines": result.get("engines", []),
+            "score": result.get("score"),
+        }
+        for result in data["results"]
+    ]
+    return format_results(results, output_format)
 
-        if output_format == "json":
+def format_results(results: list, output_format: str) -> str:
+    """
+    按输出格式生成结果文本：json、llm（用于提示的纯文本）或html（界面显示）
+    """
+    if output_format == "json":
+        parsed_results = []
+        for result in results:
             result_data = {
-                "title": escape(title),
-                "url": escape(url),
-                "description": escape(description),
+                "title": escape(result["title"]),
+                "url": escape(result["url"]),
+                "description": escape(result["description"]),
             }
-            if engines:
-                result_data["engines"] = engines
+            if result["engines"]:
+                result_data["engines"] = result["engines"]
             parsed_results.append(result_data)
-        else:
-            # HTML格式输出
-            engines_info = (
-                f"<small>搜索引擎: {', '.join(engines)}</small><br>" if engines else ""
-            )
-            html = (
-                f"<div style='margin-bottom: 1.5em; border-left: 3px solid #007acc; padding-left: 15px;'>"
-                f"<h3><a href='{escape(url)}' target='_blank' style='color: #007acc; text-decoration: none;'>{escape(title)}</a></h3>"
-                f"<p style='color: #666; margin: 5px 0;'>{escape(description)}</p>"
-                f"{engines_info}"
-                f"<small style='color: #999;'>{escape(url)}</small>"
-                f"</div>"
-            )
-            parsed_results.append(html)
-
-    if output_format == "json":
         return json.dumps(parsed_results, ensure_ascii=False, indent=2)
-    else:
-        return "\n".join(parsed_results)
+    if output_format == "llm":
+        return render_llm_results(results)
+    return render_html_results(results)
+
+def render_html_results(results: list) -> str:
+    """
+    生成界面显示用的HTML结果
+    """
+    parsed_results = []
+    for result in results:
+        url, title, description, engines = result["url"], result["title"], result["description"], result["engines"]
+        engines_info = (
+            f"<small>搜索引擎: {', '.join(engines)}</small><br>" if engines else ""
+        )
+        html = (
+            f"<div style='margin-bottom: 1.5em; border-left: 3px solid #007acc; padding-left: 15px;'>"
+            f"<h3><a href='{escape(url)}' target='_blank' style='color: #007acc; text-decoration: none;'>{escape(title)}</a></h3>"
+            f"<p style='color: #666; margin: 5px 0;'>{escape(description)}</p>"
+            f"{engines_info}"
+            f"<small style='color: #999;'>{escape(url)}</small>"
+            f"</div>"
+        )
+        parsed_results.append(html)
+    return "\n".join(parsed_results)
+
+def _clip(text: str, max_chars: int) -> str:
+    """
+    合并空白并截断到max_chars个字符，尽量在词或句子边界处截断
+    """
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    clipped = text[:max_chars]
+    boundary = max(clipped.rfind(mark) for mark in ("。", "；", ". ", "; ", " "))
+    if boundary > max_chars // 2:
+        clipped = clipped[:boundary + 1]
+    return clipped.rstrip() + "…"
+
+def render_llm_results(
+    results: list,
+    snippet_chars: int = LLM_SNIPPET_CHARS,
+    token_budget: int = LLM_TOKEN_BUDGET,
+    max_results: int = LLM_MAX_RESULTS,
+) -> str:
+    """
+    生成用于提示的纯文本结果：按得分排序，按链接和摘要去重，
+    每条摘要限制字符数，总长度限制在token预算内
+    """
+    # SearXNG的JSON结果带有得分；HTML结果本身已按得分排序
+    if any(result.get("score") is not None for result in results):
+        results = sorted(results, key=lambda result: -(result.get("score") or 0))
+
+    seen = set()
+    blocks = []
+    used = 0
+    for result in results:
+        title = _clip(result["title"], 120)
+        snippet = _clip(result["description"], snippet_chars)
+        url_key = searx_parser.url_key(result["url"])
+        snippet_key = snippet.lower()
+        if not title or url_key in seen or (snippet and snippet_key in seen):
+            continue
+        seen.add(url_key)
+        if snippet:
+            seen.add(snippet_key)
+
+        block = f"[{len(blocks) + 1}] {title}\n"
+        if snippet:
+            block += f"{snippet}\n"
+        block += f"链接: {result['url']}"
+
+        tokens = context_builder.estimate_tokens(block)
+        if blocks and used + tokens > token_budget:
+            break
+        blocks.append(block)
+        used += tokens
+        if len(blocks) >= max_results:
+            break
+
+    return "\n\n".join(blocks) if blocks else "未找到搜索结果"
 
 async def main():
     """
@@ -234,6 +305,8 @@ async def main():
     except Exception as e:
         print(f"搜索失败: {e}")
         sys.exit(1)
+    finally:
+        await search_http.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+相同请求合并（single-flight）
+同一个键的请求正在进行时，后到的调用不再发出新请求，而是等待并共享第一次请求的结果（或异常）。
+请求在独立的任务中执行，发起它的调用被取消时其余等待者不受影响
+"""
+
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """按键合并并发请求，可在多个线程和事件循环中使用（只合并同一事件循环中的请求）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # 键 -> 进行中的asyncio.Task
+        self.stats = {"calls": 0, "flights": 0, "coalesced": 0}
+
+    async def do(self, key, fetch):
+        """返回fetch()的结果；同一个键已有请求在进行时等待它的结果"""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            self.stats["calls"] += 1
+            task = self.calls.get(key)
+            if task is not None and task.get_loop() is loop:
+                self.stats["coalesced"] += 1
+            else:
+                task = loop.create_task(fetch())
+                self.stats["flights"] += 1
+                if key not in self.calls:
+                    self.calls[key] = task
+                    task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        # shield：单个等待者被取消时不取消共享的请求
+        return await asyncio.shield(task)
+
+    def in_flight(self):
+        """正在进行的请求数"""
+        with self.lock:
+            return len(self.calls)
+
+    def _finish(self, key, task):
+        with self.lock:
+            if self.calls.get(key) is task:
+                del self.calls[key]
+        # 所有等待者都已取消时，取出异常避免"exception was never retrieved"警告
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"合并的请求失败 {key!r}: {task.exception()}")
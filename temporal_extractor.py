@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间表达式提取
+将年份、日期、季度、年份范围和相对时间合并为一个预编译正则，对文本扫描一遍得到结构化的时间片段，
+供答案审查（判断回答是否具有时效性）和搜索请求（选择time_range）共同使用
+"""
+
+import re
+import time
+from collections import namedtuple
+from datetime import date
+
+# 时间片段：kind为 range / quarter / date / year / relative，years为其中有效的年份
+TimeSpan = namedtuple("TimeSpan", ["kind", "start", "end", "text", "years"])
+
+# 合理的年份范围
+MIN_YEAR = 1900
+MAX_YEAR = 2100
+
+# 相对年份对应的偏移
+RELATIVE_YEAR_OFFSETS = {'去年': -1, '上年': -1, '今年': 0, '本年': 0, '明年': 1, '下年': 1}
+
+# 相对时间关键词（出现即认为是时效性内容），较长的在前
+RELATIVE_KEYWORDS = sorted([
+    '去年', '今年', '明年', '上年', '本年', '下年',
+    '最近', '近期', '当前', '目前', '现在',
+    '最新', '新发布', '刚刚', '刚发布',
+    '最近几年', '近几年', '过去几年'
+], key=len, reverse=True)
+
+# 以四位数字开头的表达式共用同一个前缀，数字后面的部分决定类型，同一位置上先列出的分支优先
+TEMPORAL_PATTERN = re.compile(
+    r'(?P<digits>\d{4})(?:'
+    # 时间范围：2020-2024、2019至2023等
+    r'(?P<range>\s*[-至到]\s*(?P<range_end>\d{4}))'
+    # 季度：2024年第一季度、2023年Q1等
+    r'|(?P<quarter>\s*年\s*(?:第[一二三四1234]\s*季度|Q[1234]))'
+    # 日期：2024年1月、2023-01-01、2023/01/01等
+    r'|(?P<date>\s*年\s*\d+\s*月|-\d{1,2}-\d{1,2}|/\d{1,2}/\d{1,2})'
+    # 年份：2019年
+    r'|(?P<year>\s*年)'
+    # 独立的年份：前后都不是字母或数字的2020，或紧跟在英文单词之后的January 2024
+    r'|(?<!\w\d{4})\b|(?<=[A-Za-z]\s\d{4}))'
+    # 发布时间、更新时间等关键词后的年份
+    r'|(?:发布于|更新于|截至)\s*(?P<anchored_year>\d{4})(?!\d)'
+    # 相对年数：最近3年、近5年、过去10年
+    r'|(?P<relative_years>(?:最近|近|过去)\d+年)'
+    # 相对时间：去年、今年、最近、目前等
+    r'|(?P<relative>' + '|'.join(re.escape(keyword) for keyword in RELATIVE_KEYWORDS) + r')'
+)
+
+# 数字后缀分支 -> 片段类型，都不匹配时为独立年份
+_DIGIT_KINDS = (("range", "range"), ("quarter", "quarter"), ("date", "date"), ("year", "year"))
+
+
+def _valid_years(values):
+    """过滤出合理范围内的年份"""
+    years = []
+    for value in values:
+        if value:
+            year = int(value)
+            if MIN_YEAR <= year <= MAX_YEAR:
+                years.append(year)
+    return tuple(years)
+
+
+def iter_spans(text, current_year=None):
+    """扫描文本，按出现顺序逐个生成TimeSpan"""
+    if current_year is None:
+        current_year = date.today().year
+
+    for match in TEMPORAL_PATTERN.finditer(text):
+        value = match.group(0)
+
+        if match.group("digits") is not None:
+            kind = "year"
+            for group, group_kind in _DIGIT_KINDS:
+                if match.group(group) is not None:
+                    kind = group_kind
+                    break
+            years = _valid_years((match.group("digits"), match.group("range_end")))
+        elif match.group("anchored_year") is not None:
+            kind = "year"
+            years = _valid_years((match.group("anchored_year"),))
+        else:
+            kind = "relative"
+            offset = RELATIVE_YEAR_OFFSETS.get(value)
+            years = (current_year + offset,) if offset is not None else ()
+
+        if kind != "relative" and not years:
+            continue  # 四位数字但不是合理的年份
+
+        yield TimeSpan(kind, match.start(), match.end(), value, years)
+
+
+def extract(text, current_year=None):
+    """扫描文本，按出现顺序返回TimeSpan列表"""
+    return list(iter_spans(text, current_year))
+
+
+def is_time_sensitive(text, window=5, current_year=None):
+    """判断文本是否具有时效性：包含相对时间，或包含与当前相差window年以内的年份
+
+    返回 (是否具有时效性, 触发判断的片段)
+    """
+    if current_year is None:
+        current_year = date.today().year
+
+    for span in iter_spans(text, current_year):
+        if span.kind == "relative" or any(abs(current_year - year) <= window for year in span.years):
+            return True, span
+    return False, None
+
+
+def search_time_range(text, current_year=None):
+    """根据问题中的时间表达式选择SearXNG的time_range，无法确定时返回空字符串"""
+    if current_year is None:
+        current_year = date.today().year
+
+    for span in iter_spans(text, current_year):
+        # 只收窄到今年的查询，更早或跨多年的时间让搜索引擎自行排序
+        if span.kind == "relative" and span.years == (current_year,):
+            return "year"
+    return ""
+
+
+def _legacy_check_time_related_content(text, current_year):
+    """原check_time_related_content的实现（去掉调试输出），用于基准测试对比"""
+    time_patterns = [
+        r'(\d{4})\s*年',
+        r'\b(\d{4})\b',
+        r'(\d{4})\s*年\s*\d+\s*月',
+        r'(\d{4})-\d{1,2}-\d{1,2}',
+        r'(\d{4})/\d{1,2}/\d{1,2}',
+        r'(\d{4})\s*年\s*\d+\s*月',
+        r'[A-Za-z]+\s+(\d{4})',
+        r'(\d{4})\s*[-至到]\s*(\d{4})',
+        r'去年|今年|明年|上年|本年|下年',
+        r'最近\d+年|近\d+年|过去\d+年',
+        r'(\d{4})\s*年\s*第[一二三四1234]\s*季度',
+        r'(\d{4})\s*年\s*Q[1234]',
+        r'发布于\s*(\d{4})',
+        r'更新于\s*(\d{4})',
+        r'截至\s*(\d{4})',
+        r'自\s*(\d{4})\s*年',
+    ]
+    relative_time_keywords = [
+        '去年', '今年', '明年', '上年', '本年', '下年',
+        '最近', '近期', '当前', '目前', '现在',
+        '最新', '新发布', '刚刚', '刚发布',
+        '最近几年', '近几年', '过去几年'
+    ]
+    for keyword in relative_time_keywords:
+        if keyword in text:
+            return 0
+
+    found_years = set()
+    for pattern in time_patterns:
+        for match in re.findall(pattern, text):
+            for year_str in (match if isinstance(match, tuple) else (match,)):
+                if year_str.isdigit() and MIN_YEAR <= int(year_str) <= MAX_YEAR:
+                    found_years.add(int(year_str))
+
+    for year in found_years:
+        if abs(current_year - year) <= 5:
+            return 0
+    return 100
+
+
+def benchmark(rounds=200):
+    """对比原实现与单次扫描提取器在多KB回答上的耗时"""
+    current_year = date.today().year
+    paragraph = (
+        "量子计算的概念最早由费曼在1982年提出，1994年Shor算法证明了其在因数分解上的优势。"
+        "Python 1991 was released by Guido van Rossum; see the 1999-2001 archive dated 1998/12/01. "
+        "该领域在1985至1995年间发展迅速，1996年第一季度的论文数量明显增加，编号为12345的报告发布于1997。\n"
+    )
+    recent_tail = f"相关标准更新于{current_year - 1}。"
+
+    print(f"时间表达式提取基准测试（每项 {rounds} 轮，当前年份 {current_year}）")
+    for size in (2048, 8192, 32768):
+        text = (paragraph * (size // len(paragraph) + 1))[:size]
+        for label, sample in (("无近期年份", text), ("末尾有近期年份", text + recent_tail)):
+            legacy_result = _legacy_check_time_related_content(sample, current_year)
+            result = 0 if is_time_sensitive(sample, current_year=current_year)[0] else 100
+            assert legacy_result == result, (label, size, legacy_result, result)
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                _legacy_check_time_related_content(sample, current_year)
+            legacy_time = (time.perf_counter() - start) / rounds * 1000
+
+            start = time.perf_counter()
+            for _ in range(rounds):
+                is_time_sensitive(sample, current_year=current_year)
+            new_time = (time.perf_counter() - start) / rounds * 1000
+
+            print(f"  {len(sample):>6} 字符 {label:<8} 原实现 {legacy_time:.3f} ms  "
+                  f"提取器 {new_time:.3f} ms  加速 {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark()